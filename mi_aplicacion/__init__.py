@@ -1,6 +1,6 @@
 # d:\DocumentacionEmpaques\mi_aplicacion\__init__.py
 
-from flask import Flask
+from flask import Flask, flash, jsonify, redirect, request
 import os
 from dotenv import load_dotenv
 import logging # Añade esta importación para el logger
@@ -28,6 +28,14 @@ from .blueprints.sellado.sellado_form_se34 import se34_bp
 from .blueprints.sellado.sellado_form_se35 import se35_bp
 from .blueprints.sellado.sellado_form_se47 import se47_bp
 from .blueprints.sellado.sellado_form_Se50 import se50_bp
+from .blueprints.transversal.consultas_epicor import consultas_epicor_bp
+
+from .utils.directorio_empleados import iniciar_sincronizacion_periodica
+from .utils.epicor_api import epicor_degradado
+from .utils.outbox import iniciar_entrega_en_segundo_plano
+from .utils.bulkheads import BulkheadSaturado
+from .utils.admision import instalar_control_admision
+from .utils.datasets import iniciar_refresco_en_segundo_plano
 
 
 def create_app():
@@ -47,6 +55,36 @@ def create_app():
     app.config['WEBHOOK_EMP_TURNO_AUTH'] = os.getenv('WEBHOOK_EMP_TURNO_AUTH')
     app.config['EPICOR_API_PAUSAS_ACTIVAS'] = os.getenv('EPICOR_API_PAUSAS_ACTIVAS')
     app.config['EPICOR_API_TRABAJOS_FORM'] = os.getenv('EPICOR_API_TRABAJOS_FORM')
+    # Pool de conexiones keep-alive del cliente Epicor (ver utils/epicor_api.py)
+    app.config['EPICOR_POOL_CONNECTIONS'] = int(os.getenv('EPICOR_POOL_CONNECTIONS', '4'))
+    app.config['EPICOR_POOL_MAXSIZE'] = int(os.getenv('EPICOR_POOL_MAXSIZE', '16'))
+    # Circuit breaker por endpoint de Epicor: fallos seguidos para abrir y segundos antes de la sonda de recuperación
+    app.config['EPICOR_CIRCUIT_FAILURE_THRESHOLD'] = int(os.getenv('EPICOR_CIRCUIT_FAILURE_THRESHOLD', '5'))
+    app.config['EPICOR_CIRCUIT_RESET_TIMEOUT'] = int(os.getenv('EPICOR_CIRCUIT_RESET_TIMEOUT', '30'))
+    # Hilos para ejecutar en paralelo las validaciones Epicor independientes de un mismo formulario
+    app.config['EPICOR_LOOKUP_WORKERS'] = int(os.getenv('EPICOR_LOOKUP_WORKERS', '8'))
+    # Vigencia (segundos) de los tokens firmados de validación que el POST acepta en lugar de re-consultar Epicor
+    app.config['VALIDATION_TOKEN_MAX_AGE'] = int(os.getenv('VALIDATION_TOKEN_MAX_AGE', '900'))
+    # Segundos que navegador/proxy pueden reutilizar las respuestas de /api/empleado, /api/trabajo y /api/carnet
+    app.config['LOOKUP_HTTP_MAX_AGE'] = int(os.getenv('LOOKUP_HTTP_MAX_AGE', '60'))
+    # Máximo de claves que acepta la consulta por lotes /api/lookup
+    app.config['LOOKUP_MAX_KEYS'] = int(os.getenv('LOOKUP_MAX_KEYS', '50'))
+    # Caché de empleados: TTL en segundos para respuestas válidas y para "no encontrado / inactivo"
+    app.config['EMPLOYEE_CACHE_TTL'] = int(os.getenv('EMPLOYEE_CACHE_TTL', '600'))
+    app.config['EMPLOYEE_CACHE_NEGATIVE_TTL'] = int(os.getenv('EMPLOYEE_CACHE_NEGATIVE_TTL', '60'))
+    app.config['EMPLOYEE_CACHE_MAXSIZE'] = int(os.getenv('EMPLOYEE_CACHE_MAXSIZE', '2048'))
+    # Caché de trabajos: se sirve fresca hasta JOB_CACHE_FRESH_TTL y se refresca en segundo plano hasta JOB_CACHE_MAX_AGE
+    app.config['JOB_CACHE_FRESH_TTL'] = int(os.getenv('JOB_CACHE_FRESH_TTL', '120'))
+    app.config['JOB_CACHE_MAX_AGE'] = int(os.getenv('JOB_CACHE_MAX_AGE', '1800'))
+    app.config['JOB_CACHE_MAXSIZE'] = int(os.getenv('JOB_CACHE_MAXSIZE', '512'))
+    # Directorio local de empleados activos (snapshot SQLite sincronizado desde Epicor); requiere EPICOR_API_DIRECTORIO_EMPLEADOS
+    app.config['EMPLOYEE_DIRECTORY_ENABLED'] = os.getenv('EMPLOYEE_DIRECTORY_ENABLED', 'false').lower() == 'true'
+    app.config['EMPLOYEE_DIRECTORY_PATH'] = os.getenv('EMPLOYEE_DIRECTORY_PATH')
+    app.config['EMPLOYEE_DIRECTORY_REFRESH_INTERVAL'] = int(os.getenv('EMPLOYEE_DIRECTORY_REFRESH_INTERVAL', '3600'))
+    app.config['EMPLOYEE_DIRECTORY_MAX_AGE'] = int(os.getenv('EMPLOYEE_DIRECTORY_MAX_AGE', '86400'))
+    app.config['EMPLOYEE_DIRECTORY_PAGE_SIZE'] = int(os.getenv('EMPLOYEE_DIRECTORY_PAGE_SIZE', '500'))
+    app.config['EMPLOYEE_DIRECTORY_CARNET_FIELD'] = os.getenv('EMPLOYEE_DIRECTORY_CARNET_FIELD', 'EmpBasic_Carnet_c')
+    app.config['EPICOR_API_DIRECTORIO_EMPLEADOS'] = os.getenv('EPICOR_API_DIRECTORIO_EMPLEADOS')
     
     app.config['TIMEZONE'] = os.getenv('TIMEZONE', 'America/Bogota')
     app.config['EPICOR_API_CARNET_LOOKUP'] = os.getenv('EPICOR_API_CARNET_LOOKUP')
@@ -54,6 +92,21 @@ def create_app():
     app.config['WEBHOOK_MONITOREO_CUCHILLAS_URL_VALIDACION'] = os.getenv('WEBHOOK_MONITOREO_CUCHILLAS_URL_VALIDACION')
     app.config['WEBHOOK_MONITOREO_CUCHILLAS_URL_VALIDACION_COOR'] = os.getenv('WEBHOOK_MONITOREO_CUCHILLAS_URL_VALIDACION_COOR') # Carga la URL del coordinador
     app.config['WEBHOOK_CORES_URL_SELECT'] = os.getenv('WEBHOOK_CORES_URL_SELECT') # Carga la URL del coordinador
+    # Segundos entre refrescos de la copia en memoria de los monitoreos de cuchillas (utils/datasets.py)
+    app.config['MONITOREO_CUCHILLAS_REFRESH_INTERVAL'] = int(os.getenv('MONITOREO_CUCHILLAS_REFRESH_INTERVAL', '60'))
+    # Registros por página en la bandeja de aprobación de cuchillas de coordinadores
+    app.config['APROBACION_CUCHILLAS_PAGE_SIZE'] = int(os.getenv('APROBACION_CUCHILLAS_PAGE_SIZE', '50'))
+    # Aprobación por lotes: máximo de registros por solicitud y actualizaciones simultáneas al webhook
+    app.config['APROBACION_CUCHILLAS_MAX_ITEMS'] = int(os.getenv('APROBACION_CUCHILLAS_MAX_ITEMS', '100'))
+    app.config['APROBACION_CUCHILLAS_WORKERS'] = int(os.getenv('APROBACION_CUCHILLAS_WORKERS', '4'))
+    # Copias en memoria: hoy cada refresco descarga la tabla completa (caché con refresco completo, no sincronización
+    # incremental), porque los webhooks de consulta de n8n no implementan el filtro desde_<campo>. Dejar vacío el
+    # *_SYNC_FIELD hasta que el webhook lo implemente con una fecha de modificación; la reconciliación completa solo
+    # aplica con el modo incremental activo
+    app.config['MONITOREO_CUCHILLAS_SYNC_FIELD'] = os.getenv('MONITOREO_CUCHILLAS_SYNC_FIELD', '')
+    app.config['SOLICITUDES_CORES_REFRESH_INTERVAL'] = int(os.getenv('SOLICITUDES_CORES_REFRESH_INTERVAL', '60'))
+    app.config['SOLICITUDES_CORES_SYNC_FIELD'] = os.getenv('SOLICITUDES_CORES_SYNC_FIELD', '')
+    app.config['DATASET_FULL_RECONCILE_INTERVAL'] = int(os.getenv('DATASET_FULL_RECONCILE_INTERVAL', '900'))
     
     
     app.config['WEBHOOK_SE25_URL'] = os.getenv('WEBHOOK_SE25_URL')
@@ -69,6 +122,54 @@ def create_app():
     app.config['WEBHOOK_SE47_URL'] = os.getenv('WEBHOOK_SE47_URL')
     app.config['WEBHOOK_SE47_AUTH'] = os.getenv('WEBHOOK_SE47_AUTH')
     app.config['WEBHOOK_SE50'] = os.getenv('WEBHOOK_SE50')
+    # Despachador de webhooks (utils/webhooks.py): timeouts comunes y conexiones keep-alive por host
+    app.config['WEBHOOK_CONNECT_TIMEOUT'] = float(os.getenv('WEBHOOK_CONNECT_TIMEOUT', '5'))
+    app.config['WEBHOOK_READ_TIMEOUT'] = float(os.getenv('WEBHOOK_READ_TIMEOUT', '15'))
+    app.config['WEBHOOK_POOL_MAXSIZE'] = int(os.getenv('WEBHOOK_POOL_MAXSIZE', '10'))
+    # Deadline por petición (utils/deadline.py): las llamadas a Epicor y webhooks de una ruta comparten este presupuesto en segundos
+    app.config['DEADLINE_FORMULARIOS'] = float(os.getenv('DEADLINE_FORMULARIOS', '12'))
+    app.config['DEADLINE_CONSULTAS'] = float(os.getenv('DEADLINE_CONSULTAS', '6'))
+    # Bulkheads (utils/bulkheads.py): llamadas simultáneas por proceso a cada sistema externo y espera máxima por un cupo
+    app.config['BULKHEAD_EPICOR_MAX'] = int(os.getenv('BULKHEAD_EPICOR_MAX', '8'))
+    app.config['BULKHEAD_N8N_MAX'] = int(os.getenv('BULKHEAD_N8N_MAX', '6'))
+    app.config['BULKHEAD_SHEETS_MAX'] = int(os.getenv('BULKHEAD_SHEETS_MAX', '2'))
+    app.config['BULKHEAD_QUEUE_WAIT'] = float(os.getenv('BULKHEAD_QUEUE_WAIT', '0.5'))
+    # Lectura en caché de Google Sheets (utils/hojas.py): vigencia de la copia, filas finales que se releen con las nuevas
+    # y cada cuántos segundos se relee la hoja completa
+    app.config['SHEET_CACHE_TTL'] = int(os.getenv('SHEET_CACHE_TTL', '30'))
+    app.config['SHEET_TAIL_OVERLAP'] = int(os.getenv('SHEET_TAIL_OVERLAP', '50'))
+    app.config['SHEET_FULL_RELOAD_INTERVAL'] = int(os.getenv('SHEET_FULL_RELOAD_INTERVAL', '900'))
+    # Control de admisión (utils/admision.py): peticiones en curso por proceso, por clase de ruta y en total; las consultas y páginas dejan libres ADMISSION_RESERVA_FORMULARIOS cupos
+    app.config['ADMISSION_CONTROL_ENABLED'] = os.getenv('ADMISSION_CONTROL_ENABLED', 'true').lower() == 'true'
+    app.config['ADMISSION_MAX_TOTAL'] = int(os.getenv('ADMISSION_MAX_TOTAL', '40'))
+    app.config['ADMISSION_RESERVA_FORMULARIOS'] = int(os.getenv('ADMISSION_RESERVA_FORMULARIOS', '8'))
+    app.config['ADMISSION_MAX_FORMULARIOS'] = int(os.getenv('ADMISSION_MAX_FORMULARIOS', '24'))
+    app.config['ADMISSION_MAX_CONSULTAS'] = int(os.getenv('ADMISSION_MAX_CONSULTAS', '16'))
+    app.config['ADMISSION_MAX_PAGINAS'] = int(os.getenv('ADMISSION_MAX_PAGINAS', '12'))
+    app.config['ADMISSION_MAX_ESTATICOS'] = int(os.getenv('ADMISSION_MAX_ESTATICOS', '16'))
+    app.config['ADMISSION_RETRY_AFTER'] = int(os.getenv('ADMISSION_RETRY_AFTER', '2'))
+    # TLS de los webhooks: CA interna opcional y, si la verificación falla, cuánto tiempo se recuerda el host como inseguro
+    app.config['WEBHOOK_CA_BUNDLE'] = os.getenv('WEBHOOK_CA_BUNDLE')
+    app.config['WEBHOOK_TLS_FALLBACK'] = os.getenv('WEBHOOK_TLS_FALLBACK', 'true').lower() == 'true'
+    app.config['WEBHOOK_TLS_CACHE_SECONDS'] = int(os.getenv('WEBHOOK_TLS_CACHE_SECONDS', '3600'))
+    # Bandeja de salida durable (utils/outbox.py): los formularios se guardan en SQLite y un hilo los entrega con reintentos
+    app.config['OUTBOX_ENABLED'] = os.getenv('OUTBOX_ENABLED', 'true').lower() == 'true'
+    app.config['OUTBOX_PATH'] = os.getenv('OUTBOX_PATH')
+    app.config['OUTBOX_POLL_INTERVAL'] = float(os.getenv('OUTBOX_POLL_INTERVAL', '2'))
+    app.config['OUTBOX_MAX_ATTEMPTS'] = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '12'))
+    app.config['OUTBOX_BACKOFF_BASE'] = float(os.getenv('OUTBOX_BACKOFF_BASE', '5'))
+    app.config['OUTBOX_BACKOFF_MAX'] = float(os.getenv('OUTBOX_BACKOFF_MAX', '900'))
+    app.config['OUTBOX_LEASE_SECONDS'] = int(os.getenv('OUTBOX_LEASE_SECONDS', '120'))
+    # Validación diferida (utils/validacion_diferida.py): si Epicor no responde, los formularios de sellado se aceptan y el empleado se valida en segundo plano
+    app.config['DEFERRED_VALIDATION_ENABLED'] = os.getenv('DEFERRED_VALIDATION_ENABLED', 'false').lower() == 'true'
+    # Envíos duplicados (utils/idempotencia.py): un mismo formulario repetido dentro de la ventana se responde sin reenviarlo
+    app.config['IDEMPOTENCY_ENABLED'] = os.getenv('IDEMPOTENCY_ENABLED', 'true').lower() == 'true'
+    app.config['IDEMPOTENCY_WINDOW'] = int(os.getenv('IDEMPOTENCY_WINDOW', '600'))
+    # Destinos (separados por coma) cuyo webhook acepta un arreglo JSON; sus envíos salen en lotes por cantidad o ventana de tiempo
+    app.config['OUTBOX_BATCH_DESTINOS'] = tuple(d.strip() for d in os.getenv('OUTBOX_BATCH_DESTINOS', '').split(',') if d.strip())
+    app.config['OUTBOX_BATCH_MAX_SIZE'] = int(os.getenv('OUTBOX_BATCH_MAX_SIZE', '20'))
+    app.config['OUTBOX_BATCH_WINDOW'] = float(os.getenv('OUTBOX_BATCH_WINDOW', '3'))
+    app.config['OUTBOX_RETENTION_SECONDS'] = int(os.getenv('OUTBOX_RETENTION_SECONDS', str(7 * 86400)))
     
 
 
@@ -94,6 +195,7 @@ def create_app():
     
     app.register_blueprint(despeje_linea_bp, url_prefix='/shared')
     app.register_blueprint(monitoreo_cuchillas_bp, url_prefix='/shared') 
+    app.register_blueprint(consultas_epicor_bp)
     app.register_blueprint(coordinadores_bp)
     app.register_blueprint(taras_bp)
     
@@ -105,4 +207,34 @@ def create_app():
     app.register_blueprint(se47_bp)
     app.register_blueprint(se50_bp)
 
+    iniciar_sincronizacion_periodica(app)
+    iniciar_entrega_en_segundo_plano(app)
+    iniciar_refresco_en_segundo_plano(app)
+    instalar_control_admision(app)
+
+    @app.errorhandler(BulkheadSaturado)
+    def sistema_externo_saturado(error):
+        # Un upstream saturado responde rápido con 503 en lugar de dejar al operario esperando.
+        app.logger.warning(f"Solicitud rechazada por bulkhead: {error}")
+        mensaje = "El sistema externo está ocupado. Intenta de nuevo en unos segundos."
+        quiere_json = request.is_json or request.path.startswith('/api/') \
+            or request.headers.get('X-Requested-With') == 'XMLHttpRequest' \
+            or request.accept_mimetypes.best == 'application/json'
+        if not quiere_json and request.method == 'POST':
+            # Formulario HTML: igual que con_deadline, aviso y de vuelta a la página en lugar de un JSON crudo.
+            flash(mensaje, 'warning')
+            return redirect(request.url)
+        if quiere_json:
+            respuesta = jsonify(success=False, message=mensaje, category="warning")
+        else:
+            respuesta = app.make_response(f"<!doctype html><meta charset=\"utf-8\"><title>Sistema ocupado</title><p>{mensaje}</p>")
+        respuesta.status_code = 503
+        respuesta.headers['Retry-After'] = '2'
+        return respuesta
+
+    @app.context_processor
+    def inyectar_estado_epicor():
+        # Las plantillas muestran un aviso fijo mientras algún circuito de Epicor esté abierto.
+        return {"epicor_degradado": epicor_degradado()}
+
     return app
\ No newline at end of file
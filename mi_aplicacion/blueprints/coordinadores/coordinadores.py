@@ -8,7 +8,12 @@ import json
 
 # IMPORTAR LA API DE MONITOREO DE CUCHILLAS (ruta relativa correcta)
 # Asegúrate de que monitoreo_cuchillas_api.py exista en la misma carpeta que coordinadores.py
-from .monitoreo_cuchillas_api import get_pending_monitoreo_cuchillas_for_approval, update_monitoreo_cuchillas_record
+from .monitoreo_cuchillas_api import (
+    consultar_pendientes_monitoreo_cuchillas, update_monitoreo_cuchillas_record,
+    update_monitoreo_cuchillas_records, validar_aprobacion_cuchillas
+)
+from ...utils import outbox
+from ...utils.validacion_diferida import DESTINO as DESTINO_VALIDACION_DIFERIDA
 
 
 # --- Configuración del Blueprint ---
@@ -138,6 +143,12 @@ def coordinadores_dashboard():
             "url": url_for('coordinadores.aprobacion_monitoreo_cuchillas'),
             "icono": "fas fa-check-circle",
             "descripcion": "Revisa y aprueba los reportes de monitoreo de cuchillas."
+        },
+        {
+            "nombre": "Validaciones Pendientes",
+            "url": url_for('coordinadores.validaciones_pendientes'),
+            "icono": "fas fa-user-clock",
+            "descripcion": "Formularios aceptados sin validar el empleado en Epicor cuya validación falló."
         }
     ]
     if session.get('coordinador_role') == 'admin':
@@ -159,8 +170,16 @@ def coordinadores_dashboard():
 @validation_required_coordinador
 @role_required_coordinador(['coordinator', 'admin'])
 def aprobacion_monitoreo_cuchillas():
-    # Obtener solo los registros pendientes de aprobación usando la función de la API
-    pending_records = get_pending_monitoreo_cuchillas_for_approval()
+    # Filtros y página elegidos por el coordinador; la API filtra y pagina en el servidor
+    filtros = {
+        'proceso_seleccionado': request.args.get('proceso', '').strip(),
+        'maquina': request.args.get('maquina', '').strip(),
+        'turno': request.args.get('turno', '').strip(),
+        'fecha': request.args.get('fecha', '').strip(),
+    }
+    pagina = request.args.get('pagina', 1, type=int)
+    por_pagina = current_app.config.get('APROBACION_CUCHILLAS_PAGE_SIZE', 50)
+    resultado = consultar_pendientes_monitoreo_cuchillas(pagina, por_pagina, **filtros)
 
     # Los datos del coordinador ya están en la sesión gracias a los decoradores
     id_coordinador = session.get('coordinador_employee_id', 'N/A')
@@ -171,7 +190,13 @@ def aprobacion_monitoreo_cuchillas():
                            username_coordinador=nombre_coordinador,
                            nombre_proceso="Coordinadores de Verificación",
                            subseccion="Aprobación Cuchillas",
-                           data=pending_records, # ¡Pasa los datos aquí!
+                           data=resultado["registros"], # ¡Pasa los datos aquí!
+                           paginacion=resultado,
+                           filtros=filtros,
+                           # Filtros activos con el nombre de su parámetro, para los enlaces de paginación
+                           args_filtros={parametro: request.args[parametro] for parametro in ('proceso', 'maquina', 'turno', 'fecha')
+                                         if request.args.get(parametro, '').strip()},
+                           opciones=resultado["opciones"],
                            id_coordinador=id_coordinador,
                            nombre_coordinador=nombre_coordinador
                            )
@@ -246,6 +271,107 @@ def validar_monitoreo_cuchillas():
         return redirect(url_for('coordinadores.aprobacion_monitoreo_cuchillas'))
 
 
+@coordinadores_bp.route('/validar_monitoreo_cuchillas_lote', methods=['POST'])
+@validation_required_coordinador
+@role_required_coordinador(['coordinator', 'admin'])
+def validar_monitoreo_cuchillas_lote():
+    """
+    Aprueba varios registros en una sola petición. Recibe
+    {"items": [{"id", "cantidad_verificada", "verificacion"}, ...], "responsable_verificacion"?}
+    y responde el resultado de cada ítem en el mismo orden.
+    """
+    data = request.get_json(silent=True)
+    items = data.get('items') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify(success=False, message="Se requiere una lista 'items' con los registros a aprobar.", category="danger"), 400
+
+    max_items = current_app.config.get('APROBACION_CUCHILLAS_MAX_ITEMS', 100)
+    if len(items) > max_items:
+        return jsonify(success=False, message=f"Se pueden aprobar como máximo {max_items} registros por solicitud.", category="danger"), 400
+
+    responsable_verificacion = data.get('responsable_verificacion') or session.get('coordinador_username')
+    if not responsable_verificacion:
+        return jsonify(success=False, message="Falta el responsable de la verificación.", category="danger"), 400
+
+    # Validar todo el lote antes de enviar: los ítems inválidos o repetidos no se envían.
+    resultados = [None] * len(items)
+    aprobaciones, posiciones, vistos = [], [], set()
+    for posicion, item in enumerate(items):
+        item_id, cantidad_verificada, verificacion, error = validar_aprobacion_cuchillas(item)
+        if error is None and str(item_id) in vistos:
+            error = "Registro repetido en el lote."
+        if error is not None:
+            resultados[posicion] = {"id": item_id, "success": False, "message": error}
+            continue
+        vistos.add(str(item_id))
+        aprobaciones.append((item_id, cantidad_verificada, verificacion))
+        posiciones.append(posicion)
+
+    current_app.logger.info(f"Aprobación por lotes de {session.get('coordinador_employee_id', 'N/A')}: {len(aprobaciones)} de {len(items)} ítems válidos.")
+    for posicion, (item_id, _, _), result in zip(posiciones, aprobaciones, update_monitoreo_cuchillas_records(aprobaciones, responsable_verificacion)):
+        resultados[posicion] = {"id": item_id, "success": result["success"], "message": result["message"]}
+
+    aprobados = sum(1 for r in resultados if r["success"])
+    fallidos = len(resultados) - aprobados
+    if fallidos:
+        current_app.logger.error(f"-> FALLO: {fallidos} de {len(resultados)} registros no se pudieron aprobar.")
+    message = f"{aprobados} registro(s) aprobado(s)" + (f", {fallidos} con error." if fallidos else ".")
+    return jsonify(success=fallidos == 0, message=message, category="success" if fallidos == 0 else "warning",
+                   aprobados=aprobados, fallidos=fallidos, resultados=resultados), 200 if fallidos == 0 else 207
+
+
+# --- Revisión de formularios aceptados con validación diferida (utils/validacion_diferida.py) ---
+@coordinadores_bp.route('/validaciones_pendientes')
+@validation_required_coordinador
+@role_required_coordinador(['coordinator', 'admin'])
+def validaciones_pendientes():
+    registros = []
+    for envio in outbox.listar_envios(DESTINO_VALIDACION_DIFERIDA, outbox.FALLIDO):
+        destino, payload, (campo_id, _) = envio["argumentos"]
+        registros.append({
+            "id": envio["id"],
+            "formulario": destino.upper(),
+            "fecha": payload.get('fecha'),
+            "id_empleado": payload.get(campo_id),
+            "trabajo": payload.get('trabajo'),
+            "error": envio["ultimo_error"],
+        })
+
+    return render_template('coordinadores/validaciones_pendientes.html',
+                           username_coordinador=session.get('coordinador_username', 'Coordinador de Verificación'),
+                           nombre_proceso="Coordinadores de Verificación",
+                           subseccion="Validaciones Pendientes",
+                           registros=registros,
+                           en_espera=outbox.contar_envios(DESTINO_VALIDACION_DIFERIDA, outbox.PENDIENTE)
+                           )
+
+
+@coordinadores_bp.route('/validaciones_pendientes/<int:envio_id>', methods=['POST'])
+@validation_required_coordinador
+@role_required_coordinador(['coordinator', 'admin'])
+def resolver_validacion_pendiente(envio_id):
+    accion = request.form.get('accion')
+    coordinador = session.get('coordinador_employee_id', 'N/A')
+
+    if accion == 'enviar':
+        envio = outbox.obtener_envio(envio_id)
+        if envio is None or envio["destino"] != DESTINO_VALIDACION_DIFERIDA \
+                or not outbox.reasignar_envio(envio_id, envio["argumentos"][0], envio["argumentos"][1]):
+            flash('El registro ya no está pendiente de revisión.', 'warning')
+        else:
+            current_app.logger.info(f"Coordinador {coordinador} envió sin validar el registro {envio_id} ({envio['argumentos'][0]}).")
+            flash('Registro enviado sin validación del empleado.', 'success')
+    elif accion == 'descartar':
+        if outbox.descartar_envio(envio_id, DESTINO_VALIDACION_DIFERIDA, f"Descartado por el coordinador {coordinador}"):
+            current_app.logger.info(f"Coordinador {coordinador} descartó el registro {envio_id}.")
+            flash('Registro descartado.', 'info')
+        else:
+            flash('El registro ya no está pendiente de revisión.', 'warning')
+    else:
+        flash('Acción no válida.', 'danger')
+    return redirect(url_for('coordinadores.validaciones_pendientes'))
+
+
 @coordinadores_bp.route('/exit_module') # Ruta para salir del módulo
 def coordinadores_exit_module():
     _clear_coordinador_session() # Usar la función auxiliar para limpiar
@@ -1,19 +1,24 @@
 import requests
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from flask import current_app
 from datetime import datetime
 import pytz
 from urllib.parse import urlencode, urlparse, urlunparse # <-- ¡Importaciones esenciales para manipular URLs!
 
+from ...utils.webhooks import consultar_webhook, enviar_webhook
+from ...utils.datasets import registrar_dataset
+
 # Desactivar advertencias de SSL inseguro (solo para desarrollo)
 import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-def get_monitoreo_cuchillas_data():
+def _descargar_monitoreo_cuchillas(params=None):
     """
-    Obtiene todos los registros de monitoreo de cuchillas del webhook de consulta.
-    Utiliza la URL configurada en WEBHOOK_MONITOREO_CUCHILLAS_URL_VALIDACION.
-    Retorna una lista de diccionarios con los datos o una lista vacía en caso de error.
+    Descarga los registros de monitoreo de cuchillas del webhook de consulta
+    (WEBHOOK_MONITOREO_CUCHILLAS_URL_VALIDACION): todos, o solo los que cumplen `params`
+    en la sincronización incremental. Lanza la excepción si la descarga falla.
     """
     webhook_url = current_app.config.get('WEBHOOK_MONITOREO_CUCHILLAS_URL_VALIDACION')
     webhook_auth_token = current_app.config.get('WEBHOOK_AUTH')
@@ -26,13 +31,44 @@ def get_monitoreo_cuchillas_data():
     if webhook_auth_token:
         headers['Authorization'] = webhook_auth_token
 
+    current_app.logger.info(f"Intentando obtener datos de monitoreo de cuchillas de: {webhook_url} {params or ''}")
+    response = consultar_webhook('monitoreo_cuchillas_consulta', webhook_url, headers=headers, params=params)
+    response.raise_for_status()  # Lanza una excepción para errores HTTP (4xx o 5xx)
+    data = response.json()
+    current_app.logger.info("Datos de monitoreo de cuchillas obtenidos con éxito.")
+    # n8n responde un objeto suelto cuando la tabla tiene un solo registro.
+    return [data] if isinstance(data, dict) else data
+
+
+def _es_pendiente(item):
+    """Un registro está pendiente de aprobación si 'cantidad_verificada' y 'verificacion' son nulos."""
+    return item.get('cantidad_verificada') is None and item.get('verificacion') is None
+
+
+# Copia en memoria refrescada en segundo plano (utils/datasets.py): las páginas no descargan la tabla en cada
+# carga. Cada refresco descarga la tabla completa (así se ven las aprobaciones hechas en otros workers): el
+# webhook no implementa desde_<campo>, por eso MONITOREO_CUCHILLAS_SYNC_FIELD queda vacío.
+# Los índices permiten filtrar la bandeja de aprobación sin recorrer todo el historial.
+dataset_monitoreo_cuchillas = registrar_dataset(
+    'monitoreo_cuchillas', _descargar_monitoreo_cuchillas, 'id_monitoreo', 'MONITOREO_CUCHILLAS_REFRESH_INTERVAL',
+    clave_campo_marca='MONITOREO_CUCHILLAS_SYNC_FIELD', clave_url='WEBHOOK_MONITOREO_CUCHILLAS_URL_VALIDACION',
+    indices={
+        'pendiente': _es_pendiente,
+        'proceso_seleccionado': lambda item: item.get('proceso_seleccionado'),
+        'maquina': lambda item: item.get('maquina'),
+        'turno': lambda item: item.get('turno'),
+        'fecha': lambda item: str(item.get('fecha') or '')[:10],  # Día (AAAA-MM-DD) del registro
+    },
+)
+
+
+def get_monitoreo_cuchillas_data():
+    """
+    Obtiene todos los registros de monitoreo de cuchillas desde la copia en memoria.
+    Retorna una lista de diccionarios con los datos o una lista vacía en caso de error.
+    """
     try:
-        current_app.logger.info(f"Intentando obtener datos de monitoreo de cuchillas de: {webhook_url}")
-        response = requests.get(webhook_url, headers=headers, timeout=10, verify=False)
-        response.raise_for_status()  # Lanza una excepción para errores HTTP (4xx o 5xx)
-        data = response.json()
-        current_app.logger.info("Datos de monitoreo de cuchillas obtenidos con éxito.")
-        return data
+        return dataset_monitoreo_cuchillas.registros()
     except requests.exceptions.RequestException as e:
         current_app.logger.error(f"Error al obtener datos del webhook de monitoreo de cuchillas: {e}", exc_info=True)
         return []
@@ -49,13 +85,34 @@ def get_pending_monitoreo_cuchillas_for_approval():
     Un registro se considera pendiente si 'cantidad_verificada' y 'verificacion' son nulos.
     """
     all_records = get_monitoreo_cuchillas_data()
-    pending_records = [
-        item for item in all_records
-        if item.get('cantidad_verificada') is None and item.get('verificacion') is None
-    ]
+    pending_records = [item for item in all_records if _es_pendiente(item)]
     current_app.logger.info(f"Se encontraron {len(pending_records)} registros pendientes de aprobación.")
     return pending_records
 
+def consultar_pendientes_monitoreo_cuchillas(pagina=1, por_pagina=50, proceso_seleccionado=None, maquina=None,
+                                             turno=None, fecha=None):
+    """
+    Página de los registros pendientes de aprobación que cumplen los filtros (proceso, máquina,
+    turno y día AAAA-MM-DD; vacío no filtra). Retorna el resultado de `DatasetEnMemoria.consultar`
+    más "opciones" con los valores disponibles para cada filtro.
+    """
+    filtros = {'proceso_seleccionado': proceso_seleccionado, 'maquina': maquina, 'turno': turno, 'fecha': fecha}
+    try:
+        resultado = dataset_monitoreo_cuchillas.consultar(pagina, por_pagina, pendiente=True, **filtros)
+        # Las opciones de cada filtro dependen de los demás filtros elegidos, no de sí mismo.
+        resultado["opciones"] = {
+            campo: dataset_monitoreo_cuchillas.valores(
+                campo, pendiente=True, **{otro: valor for otro, valor in filtros.items() if otro != campo}
+            )
+            for campo in filtros
+        }
+    except Exception as e:
+        current_app.logger.error(f"Error al consultar los monitoreos de cuchillas pendientes: {e}", exc_info=True)
+        return {"registros": [], "total": 0, "pagina": 1, "por_pagina": por_pagina, "paginas": 1,
+                "opciones": {campo: [] for campo in filtros}}
+    current_app.logger.info(f"Pendientes de aprobación con filtros {filtros}: {resultado['total']} (página {resultado['pagina']}).")
+    return resultado
+
 def update_monitoreo_cuchillas_record(item_id, cantidad_verificada, verificacion, responsable_verificacion):
     """
     Actualiza un registro específico de monitoreo de cuchillas en el webhook/API.
@@ -106,11 +163,13 @@ def update_monitoreo_cuchillas_record(item_id, cantidad_verificada, verificacion
         current_app.logger.info(f"Intentando enviar actualización para registro {item_id} a: {update_url_with_id} con payload: {payload_to_send}")
         
         # Usamos POST a la URL que ahora incluye el id_monitoreo como query parameter
-        response = requests.post(update_url_with_id, headers=headers, json=payload_to_send, timeout=10, verify=False)
+        response = enviar_webhook('monitoreo_cuchillas_validacion', update_url_with_id, headers=headers, json=payload_to_send)
         
         response.raise_for_status() # Lanza una excepción para códigos de estado de error HTTP
 
         current_app.logger.info(f"Actualización para registro {item_id} enviada con éxito. Respuesta: {response.status_code} - {response.text}")
+        # La aprobación se refleja en la copia en memoria sin volver a descargar la tabla.
+        dataset_monitoreo_cuchillas.actualizar_registro(item_id, payload_to_send)
         return {"success": True, "message": "Registro actualizado con éxito."}
 
     except requests.exceptions.RequestException as e:
@@ -118,4 +177,59 @@ def update_monitoreo_cuchillas_record(item_id, cantidad_verificada, verificacion
         return {"success": False, "message": f"Error al actualizar el registro: {e}"}
     except Exception as e:
         current_app.logger.error(f"Error inesperado en update_monitoreo_cuchillas_record para ID {item_id}: {e}", exc_info=True)
-        return {"success": False, "message": f"Error interno al procesar actualización: {e}"}
\ No newline at end of file
+        return {"success": False, "message": f"Error interno al procesar actualización: {e}"}
+
+
+# --- Aprobación por lotes: varias actualizaciones al webhook en paralelo con un pool acotado ---
+_executor_aprobaciones = None
+_executor_aprobaciones_lock = threading.Lock()
+
+
+def _get_executor_aprobaciones():
+    global _executor_aprobaciones
+    if _executor_aprobaciones is None:
+        with _executor_aprobaciones_lock:
+            if _executor_aprobaciones is None:
+                _executor_aprobaciones = ThreadPoolExecutor(
+                    max_workers=current_app.config.get('APROBACION_CUCHILLAS_WORKERS', 4),
+                    thread_name_prefix='aprobacion-cuchillas',
+                )
+    return _executor_aprobaciones
+
+
+def validar_aprobacion_cuchillas(item):
+    """
+    Valida un ítem {id, cantidad_verificada, verificacion} de una aprobación por lotes.
+    Retorna (item_id, cantidad_verificada, verificacion, None) o (item_id, None, None, mensaje de error).
+    """
+    item_id = item.get('id') if isinstance(item, dict) else None
+    if not item_id or item.get('cantidad_verificada') in (None, '') or not item.get('verificacion'):
+        return item_id, None, None, "Datos incompletos: se requieren id, cantidad_verificada y verificacion."
+    try:
+        cantidad_verificada = int(item.get('cantidad_verificada'))
+    except (ValueError, TypeError):
+        return item_id, None, None, "La cantidad verificada debe ser un número entero válido."
+
+    registro = dataset_monitoreo_cuchillas.obtener_registro(item_id)
+    if registro is not None and not _es_pendiente(registro):
+        return item_id, None, None, "El registro ya fue verificado."
+    return item_id, cantidad_verificada, item.get('verificacion'), None
+
+
+def update_monitoreo_cuchillas_records(aprobaciones, responsable_verificacion):
+    """
+    Envía varias actualizaciones con `update_monitoreo_cuchillas_record` en paralelo (como mucho
+    APROBACION_CUCHILLAS_WORKERS a la vez). `aprobaciones` es una lista de tuplas
+    (item_id, cantidad_verificada, verificacion); retorna los resultados en el mismo orden.
+    """
+    app = current_app._get_current_object()
+
+    def actualizar(item_id, cantidad_verificada, verificacion):
+        with app.app_context():
+            return update_monitoreo_cuchillas_record(item_id, cantidad_verificada, verificacion, responsable_verificacion)
+
+    if len(aprobaciones) <= 1:
+        return [update_monitoreo_cuchillas_record(*aprobacion, responsable_verificacion) for aprobacion in aprobaciones]
+    executor = _get_executor_aprobaciones()
+    futuros = [executor.submit(actualizar, *aprobacion) for aprobacion in aprobaciones]
+    return [futuro.result() for futuro in futuros]
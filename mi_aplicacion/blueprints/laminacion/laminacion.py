@@ -13,6 +13,11 @@ from flask import (
 )
 from dotenv import load_dotenv
 
+from ...utils.webhooks import enviar_webhook, cuerpo_json
+from ...utils.outbox import encolar_envio, registrar_destino
+from ...utils.idempotencia import evitar_envio_duplicado
+from ...utils.deadline import con_deadline
+
 # Desactivar las advertencias de InsecureRequestWarning al usar verify=False.
 # ¡IMPORTANT! This should only be used in development/testing environments.
 # NOT in production, as it disables SSL certificate verification, which is a security risk.
@@ -26,7 +31,7 @@ laminacion_bp = Blueprint('laminacion', __name__,
 
 # --- Función auxiliar para enviar datos al webhook ---
 def enviar_a_webhook_externo(datos_payload):
-    """Envía datos al webhook externo para la relación de mezclas con manejo de SSL."""
+    """Envía datos al webhook externo para la relación de mezclas."""
     webhook_url = current_app.config.get('WEBHOOK_URL') # Asumimos WEBHOOK_URL para Laminación
     webhook_auth_token = current_app.config.get('WEBHOOK_AUTH')
 
@@ -40,47 +45,30 @@ def enviar_a_webhook_externo(datos_payload):
     }
     
     try:
-        # Intenta con verificación SSL, si falla, reintenta sin ella (para desarrollo)
-        response = requests.post(
+        # El despachador verifica SSL y, si el host tiene la cadena rota, recuerda usar verify=False
+        response = enviar_webhook(
+            'laminacion_mezclas',
             webhook_url,
             headers=headers,
-            json=datos_payload, # Usar 'json=' para enviar directamente un diccionario como JSON
-            timeout=10, # Ajusta el timeout según sea necesario
-            verify=True # Intentar con verificación SSL primero
+            json=datos_payload # Usar 'json=' para enviar directamente un diccionario como JSON
         )
         response.raise_for_status() # Levanta excepción para 4xx/5xx
 
         current_app.logger.info(f"Webhook Mezclas: Respuesta SSL Ok {response.status_code} - {response.text}")
-        return {"success": True, "data": response.json(), "status_code": response.status_code}
+        # Un 2xx ya quedó registrado en n8n aunque el cuerpo no sea JSON: no se debe reenviar.
+        return {"success": True, "data": cuerpo_json(response), "status_code": response.status_code}
 
-    except requests.exceptions.SSLError as ssl_err:
-        current_app.logger.warning(f"SSL error con el webhook de Mezclas: {ssl_err}. Reintentando sin verificación SSL.")
-        try:
-            response = requests.post(
-                webhook_url,
-                headers=headers,
-                json=datos_payload,
-                timeout=10,
-                verify=False # Reintentar sin verificación SSL
-            )
-            response.raise_for_status()
-            current_app.logger.info(f"Webhook Mezclas: Respuesta verify=False Ok {response.status_code} - {response.text}")
-            return {"success": True, "data": response.json(), "status_code": response.status_code}
-        except requests.exceptions.RequestException as e:
-            current_app.logger.error(f"Error en el reintento (verify=False) enviando al webhook de Mezclas: {str(e)}", exc_info=True)
-            return {"success": False, "message": f"Error de conexión al sistema externo (reintento SSL): {str(e)}"}
-        
     except requests.exceptions.RequestException as e:
         current_app.logger.error(f"Error enviando al webhook de Mezclas: {str(e)}", exc_info=True)
         return {"success": False, "message": f"Error de conexión al sistema externo: {str(e)}"}
-    except json.JSONDecodeError:
-        current_app.logger.error(f"El webhook de Mezclas respondió con un formato no JSON. Respuesta: {response.text if 'response' in locals() else 'N/A'}", exc_info=True)
-        return {"success": False, "message": "El sistema externo respondió con un formato inesperado (no JSON)."}
     except Exception as e:
         current_app.logger.error(f"Error inesperado al enviar a webhook de Mezclas: {str(e)}", exc_info=True)
         return {"success": False, "message": f"Error inesperado al comunicarse con el sistema externo: {str(e)}"}
 
 
+registrar_destino('laminacion_mezclas', enviar_a_webhook_externo, admite_lotes=True)
+
+
 @laminacion_bp.route('/dashboard')
 def proceso_laminacion_dashboard():
     # Asegúrate de que el usuario esté logueado
@@ -113,6 +101,8 @@ def proceso_laminacion_dashboard():
 
 
 @laminacion_bp.route('/relacion_mezclas', methods=['GET', 'POST'])
+@con_deadline('DEADLINE_FORMULARIOS')
+@evitar_envio_duplicado
 def proceso_laminacion_form_mezclas():
     # Asegúrate de que el usuario esté logueado
     if 'user_id' not in session:
@@ -238,7 +228,7 @@ def proceso_laminacion_form_mezclas():
         }
 
         # Enviar a webhook (solo si no hay errores críticos)
-        webhook_result = enviar_a_webhook_externo(payload_para_webhook)
+        webhook_result = encolar_envio('laminacion_mezclas', payload_para_webhook)
         
         if webhook_result["success"]:
             id_from_webhook = None # Inicializamos la variable que contendrá el ID
@@ -246,19 +236,25 @@ def proceso_laminacion_form_mezclas():
             # Obtenemos el contenido de 'data'. Esto podría ser una lista o un diccionario.
             webhook_data_content = webhook_result.get("data") 
 
-            # Verificamos si es una lista y si tiene elementos
-            if isinstance(webhook_data_content, list) and len(webhook_data_content) > 0:
-                # Si es una lista, intentamos obtener el primer elemento
-                first_item = webhook_data_content[0]
-                # Y si ese primer elemento es un diccionario, obtenemos el ID
-                if isinstance(first_item, dict):
-                    id_from_webhook = first_item.get('id')
-                else:
-                    current_app.logger.warning(f"DEBUG: El primer elemento de 'data' no es un diccionario: {first_item}")
-            elif isinstance(webhook_data_content, dict): # Esto es para el caso en que sea directamente un diccionario (comportamiento anterior)
-                id_from_webhook = webhook_data_content.get('id')
+            # Si quedó en la bandeja de salida no hay respuesta de n8n todavía: el ID se conoce cuando se entrega
+            # y el operario ve el mensaje de la bandeja en lugar de "enviado".
+            if webhook_result.get("encolado"):
+                final_message = webhook_result["message"] if not warnings_found \
+                    else f"{webhook_result['message']} Tiene advertencias."
             else:
-                current_app.logger.warning(f"DEBUG: Formato inesperado para 'webhook_result[\"data\"]': {webhook_data_content}")
+                # Verificamos si es una lista y si tiene elementos
+                if isinstance(webhook_data_content, list) and len(webhook_data_content) > 0:
+                    # Si es una lista, intentamos obtener el primer elemento
+                    first_item = webhook_data_content[0]
+                    # Y si ese primer elemento es un diccionario, obtenemos el ID
+                    if isinstance(first_item, dict):
+                        id_from_webhook = first_item.get('id')
+                    else:
+                        current_app.logger.warning(f"DEBUG: El primer elemento de 'data' no es un diccionario: {first_item}")
+                elif isinstance(webhook_data_content, dict): # Esto es para el caso en que sea directamente un diccionario (comportamiento anterior)
+                    id_from_webhook = webhook_data_content.get('id')
+                else:
+                    current_app.logger.warning(f"DEBUG: Formato inesperado para 'webhook_result[\"data\"]': {webhook_data_content}")
 
             return jsonify({
                 "success": True,
@@ -1,13 +1,22 @@
 # d:\DocumentacionEmpaques\mi_aplicacion\blueprints\main.py
 
 from flask import (
-    Blueprint, render_template, request, redirect, url_for, session, flash, current_app
+    Blueprint, render_template, request, redirect, url_for, session, flash, current_app, jsonify
 )
 # Ya no necesitamos requests directamente aquí porque usamos el módulo de utilidades
 # import requests 
 
 # --- Importación de la función de validación de Epicor desde el módulo de utilidades ---
-from ..utils.epicor_api import validate_employee_id # Sube un nivel (blueprints/) y entra a utils/
+from ..utils.epicor_api import validate_employee_id, get_epicor_stats # Sube un nivel (blueprints/) y entra a utils/
+from ..utils.webhooks import get_webhook_stats
+from ..utils.outbox import get_outbox_stats
+from ..utils.idempotencia import get_idempotencia_stats
+from ..utils.deadline import con_deadline
+from ..utils.bulkheads import get_bulkhead_stats
+from ..utils.admision import get_admision_stats
+from ..utils.datasets import get_datasets_stats
+from ..utils.hojas import get_hojas_stats
+from .coordinadores.coordinadores import validation_required_coordinador, role_required_coordinador
 
 # --- 1. Creación del Blueprint ---
 main_bp = Blueprint('main', __name__, 
@@ -16,6 +25,7 @@ main_bp = Blueprint('main', __name__,
 
 # --- 2. Ruta de Login (la raíz de la aplicación) ---
 @main_bp.route('/', methods=['GET', 'POST'])
+@con_deadline('DEADLINE_CONSULTAS')
 def login():
     if 'user_id' in session:
         return redirect(url_for('main.home'))
@@ -73,4 +83,17 @@ def logout():
     session.pop('user_id', None)
     session.pop('user_name', None)
     flash('Has cerrado sesión exitosamente.', 'info')
-    return redirect(url_for('main.login'))
\ No newline at end of file
+    return redirect(url_for('main.login'))
+
+
+# --- 5. Diagnóstico: métricas de las integraciones externas ---
+# Muestra hosts, circuitos y colas internas: solo para coordinadores y administradores.
+@main_bp.route('/api/diagnostico')
+@validation_required_coordinador
+@role_required_coordinador(['coordinator', 'admin'])
+def diagnostico():
+    return jsonify(epicor=get_epicor_stats(), webhooks=get_webhook_stats(), outbox=get_outbox_stats(),
+                   idempotencia=get_idempotencia_stats(), bulkheads=get_bulkhead_stats(),
+                   admision=get_admision_stats(current_app), datasets=get_datasets_stats(),
+                   hojas=get_hojas_stats())
+
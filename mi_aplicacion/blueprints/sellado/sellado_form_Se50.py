@@ -6,7 +6,11 @@ from flask import (
     Blueprint, render_template, request, jsonify,
     session, current_app, url_for, redirect, flash
 )
-from ...utils.epicor_api import get_employee_name_from_id, get_job_data
+from ...utils.validacion_diferida import validar_empleado_o_diferir, encolar_con_validacion_pendiente
+from ...utils.webhooks import enviar_webhook, cuerpo_json
+from ...utils.outbox import encolar_envio, registrar_destino
+from ...utils.idempotencia import evitar_envio_duplicado
+from ...utils.deadline import con_deadline
 
 # Desactivar advertencias de SSL inseguro (solo para desarrollo, si tu webhook usa HTTPS auto-firmado)
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -44,67 +48,31 @@ def enviar_a_webhook_se50(datos_payload):
 
     try:
         current_app.logger.info(f"Payload a enviar al webhook: {datos_payload}")
-        resp = requests.post(webhook_url, headers=headers, json=datos_payload, timeout=10, verify=True)
+        resp = enviar_webhook('se50', webhook_url, headers=headers, json=datos_payload)
         resp.raise_for_status()
         current_app.logger.info(f"Webhook respondió con estado {resp.status_code}. Respuesta: {resp.text}")
         current_app.logger.info(f"Respuesta completa del webhook: {resp.text}")
-        current_app.logger.info(f"JSON interpretado desde el webhook: {resp.json()}")
+        datos_respuesta = cuerpo_json(resp)  # Un 2xx ya quedó registrado aunque el cuerpo no sea JSON.
+        current_app.logger.info(f"JSON interpretado desde el webhook: {datos_respuesta}")
 
-        return {"success": True, "data": resp.json()}
+        return {"success": True, "data": datos_respuesta, "status_code": resp.status_code}
         print("Respuesta completa:", resp.text)
-    except requests.exceptions.SSLError as e:
-        current_app.logger.warning(f"Error SSL al conectar con webhook ({e}). Reintentando sin verificación SSL.")
-        try:
-            resp = requests.post(webhook_url, headers=headers, json=datos_payload, timeout=10, verify=False)
-            # Loguea SIEMPRE la respuesta del servidor
-            current_app.logger.error(f"Webhook (verify=False) respondió {resp.status_code}: {resp.text}")
-
-            if resp.status_code >= 400:
-                # Devuélvelo al caller para que lo veas en el flash/json
-                return {
-                    "success": False,
-                    "message": f"Error del servidor de datos ({resp.status_code}): {resp.text}",
-                    "status_code": resp.status_code,
-                }
-
-            # Si es 2xx intenta parsear JSON, si no es JSON devuelve texto crudo
-            try:
-                data = resp.json()
-            except ValueError:
-                data = {"raw": resp.text}
-            return {"success": True, "data": data}
-
-        except requests.exceptions.RequestException as e2:
-            # Aquí también intenta mostrar detalle si viene con response
-            status = getattr(getattr(e2, "response", None), "status_code", None)
-            body = getattr(getattr(e2, "response", None), "text", str(e2))
-            current_app.logger.error(f"Reintento de webhook sin verificación SSL falló: {body}", exc_info=True)
-            return {
-                "success": False,
-                "message": f"Error al enviar datos (SSL reintento fallido): {body}",
-                "status_code": status or 500,
-            }
-
-@se50_bp.route('/api/empleado', methods=['GET'])
-def api_empleado():
-    eid = request.args.get('id')
-    if not eid:
-        return jsonify(success=False, nombre="ID no proporcionado"), 400
-    res = get_employee_name_from_id(eid)
-    if res["success"]:
-        return jsonify(success=True, nombre=res["nombre"])
-    return jsonify(success=False, nombre=res["message"]), 404
-
-@se50_bp.route('/api/trabajo/<trabajo_id>', methods=['GET'])
-def api_trabajo(trabajo_id):
-    if not trabajo_id:
-        return jsonify(success=False, error="Trabajo ID faltante"), 400
-    res = get_job_data(trabajo_id)
-    if res["success"]:
-        return jsonify(res)
-    return jsonify(success=False, error=res["message"]), 404
+    except requests.exceptions.RequestException as e:
+        # Intenta mostrar el detalle si viene con response
+        status = getattr(getattr(e, "response", None), "status_code", None)
+        body = getattr(getattr(e, "response", None), "text", str(e))
+        current_app.logger.error(f"Error al enviar al webhook SE50: {body}", exc_info=True)
+        return {
+            "success": False,
+            "message": f"Error del servidor de datos: {body}",
+            "status_code": status or 500,
+        }
+
+registrar_destino('se50', enviar_a_webhook_se50, admite_lotes=True)
 
 @se50_bp.route('/', methods=['GET','POST'])
+@con_deadline('DEADLINE_FORMULARIOS')
+@evitar_envio_duplicado
 def sellado_form_se50():
     if 'user_id' not in session:
         flash('Por favor, inicia sesión.', 'warning')
@@ -181,13 +149,16 @@ def sellado_form_se50():
             validation_errors.append(('observaciones',"Especifique alguna observación'."))
 
         nombre_empleado = "" 
+        validacion_pendiente = False
         employee_id_input = datos.get('id_empleado')
+        token_empleado = datos.pop('token_empleado', None)
         if employee_id_input and to_int(employee_id_input) is not None: 
-            emp_api_res = get_employee_name_from_id(employee_id_input)
+            emp_api_res = validar_empleado_o_diferir(employee_id_input, token_empleado)
             if not emp_api_res["success"]:
                 validation_errors.append(('id_empleado',f"Error validando empleado: {emp_api_res['message']}"))
             else:
                 nombre_empleado = emp_api_res["nombre"] or ""
+                validacion_pendiente = emp_api_res.get("diferida", False)
 
         if validation_errors:
             details_html = "<br>".join(msg for _,msg in validation_errors)
@@ -275,7 +246,12 @@ def sellado_form_se50():
         current_app.logger.info("JSON del Payload del Formulario SE50 (Simulado):")
         current_app.logger.info(payload)
         # --- ENVÍO DE DATOS AL WEBHOOK ---
-        webhook_result = enviar_a_webhook_se50(payload)
+        if validacion_pendiente:
+            webhook_result = encolar_con_validacion_pendiente('se50', payload)
+        else:
+            webhook_result = encolar_envio('se50', payload)
+        # Encolado no es entregado: el operario ve el mensaje de la bandeja ("se enviará en segundo plano").
+        mensaje_exito = webhook_result["message"] if validacion_pendiente or webhook_result.get("encolado") else "Formulario enviado correctamente."
         
         
         if request.is_json:
@@ -283,7 +259,7 @@ def sellado_form_se50():
             print("Payload enviado:", payload)        # Depuración
             
             if webhook_result["success"]:
-                return jsonify(success=True, message="Formulario enviado correctamente.",
+                return jsonify(success=True, message=mensaje_exito,
                             category="success", data=payload), 200
             else:
                 return jsonify(success=False, message=webhook_result["message"],
@@ -294,7 +270,7 @@ def sellado_form_se50():
         print("Flujo normal - Payload enviado:", payload)
 
         flash(
-            "Formulario enviado correctamente." if webhook_result["success"]
+            mensaje_exito if webhook_result["success"]
             else f"Error al enviar: {webhook_result['message']}",
             "success" if webhook_result["success"] else "danger"
         )
@@ -6,7 +6,11 @@ from flask import (
     Blueprint, render_template, request, jsonify,
     session, current_app, url_for, redirect, flash
 )
-from ...utils.epicor_api import get_employee_name_from_id, get_job_data
+from ...utils.validacion_diferida import validar_empleado_o_diferir, encolar_con_validacion_pendiente
+from ...utils.webhooks import enviar_webhook, cuerpo_json
+from ...utils.outbox import PRIORIDAD_CRITICA, PRIORIDAD_NORMAL, encolar_envio, registrar_destino
+from ...utils.idempotencia import evitar_envio_duplicado
+from ...utils.deadline import con_deadline
 
 # Desactivar advertencias de SSL inseguro (solo para desarrollo, si tu webhook usa HTTPS auto-firmado)
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -43,20 +47,11 @@ def enviar_a_webhook_se35(datos_payload):
     current_app.logger.info(f"Headers de autorización: {headers['Authorization']}")
 
     try:
-        resp = requests.post(webhook_url, headers=headers, json=datos_payload, timeout=10, verify=True)
+        resp = enviar_webhook('se35', webhook_url, headers=headers, json=datos_payload)
         resp.raise_for_status()
         current_app.logger.info(f"Webhook respondió con estado {resp.status_code}. Respuesta: {resp.text}")
-        return {"success": True, "data": resp.json()}
-    except requests.exceptions.SSLError as e:
-        current_app.logger.warning(f"Error SSL al conectar con webhook ({e}). Reintentando sin verificación SSL.")
-        try:
-            resp = requests.post(webhook_url, headers=headers, json=datos_payload, timeout=10, verify=False)
-            resp.raise_for_status()
-            current_app.logger.info(f"Webhook conectado con éxito sin verificación SSL. Estado: {resp.status_code}. Respuesta: {resp.text}")
-            return {"success": True, "data": resp.json()}
-        except Exception as e:
-            current_app.logger.error(f"Reintento de webhook sin verificación SSL falló: {e}", exc_info=True)
-            return {"success": False, "message": f"Error al enviar datos (SSL reintento fallido): {str(e)}"}
+        # Un 2xx ya quedó registrado en n8n aunque el cuerpo no sea JSON: no se debe reenviar.
+        return {"success": True, "data": cuerpo_json(resp), "status_code": resp.status_code}
     except requests.exceptions.RequestException as e:
         current_app.logger.error(f"Error de red o HTTP al enviar webhook: {e}", exc_info=True)
         if isinstance(e, requests.exceptions.HTTPError):
@@ -66,26 +61,11 @@ def enviar_a_webhook_se35(datos_payload):
         current_app.logger.error(f"Error inesperado al enviar webhook: {e}", exc_info=True)
         return {"success": False, "message": f"Error interno al procesar el envío de datos: {str(e)}"}
 
-@se35_bp.route('/api/empleado', methods=['GET'])
-def api_empleado():
-    eid = request.args.get('id')
-    if not eid:
-        return jsonify(success=False, nombre="ID no proporcionado"), 400
-    res = get_employee_name_from_id(eid)
-    if res["success"]:
-        return jsonify(success=True, nombre=res["nombre"])
-    return jsonify(success=False, nombre=res["message"]), 404
-
-@se35_bp.route('/api/trabajo/<trabajo_id>', methods=['GET'])
-def api_trabajo(trabajo_id):
-    if not trabajo_id:
-        return jsonify(success=False, error="Trabajo ID faltante"), 400
-    res = get_job_data(trabajo_id)
-    if res["success"]:
-        return jsonify(res)
-    return jsonify(success=False, error=res["message"]), 404
+registrar_destino('se35', enviar_a_webhook_se35, admite_lotes=True)
 
 @se35_bp.route('/', methods=['GET','POST'])
+@con_deadline('DEADLINE_FORMULARIOS')
+@evitar_envio_duplicado
 def sellado_form_se35():
     if 'user_id' not in session:
         flash('Por favor, inicia sesión.', 'warning')
@@ -188,13 +168,16 @@ def sellado_form_se35():
 
 
         nombre_empleado = "" 
+        validacion_pendiente = False
         employee_id_input = datos.get('id_empleado')
+        token_empleado = datos.pop('token_empleado', None)
         if employee_id_input and to_int(employee_id_input) is not None: 
-            emp_api_res = get_employee_name_from_id(employee_id_input)
+            emp_api_res = validar_empleado_o_diferir(employee_id_input, token_empleado)
             if not emp_api_res["success"]:
                 validation_errors.append(('id_empleado',f"Error validando empleado: {emp_api_res['message']}"))
             else:
                 nombre_empleado = emp_api_res["nombre"] or ""
+                validacion_pendiente = emp_api_res.get("diferida", False)
 
         if validation_errors:
             details_html = "<br>".join(msg for _,msg in validation_errors)
@@ -259,17 +242,24 @@ def sellado_form_se35():
         current_app.logger.info(payload)
 
         # --- ENVÍO DE DATOS AL WEBHOOK ---
-        webhook_result = enviar_a_webhook_se35(payload)
+        # Los parámetros de un pedido crítico salen antes que los demás envíos en cola.
+        prioridad = PRIORIDAD_CRITICA if datos.get('pedido_critico', '').lower() == 'si' else PRIORIDAD_NORMAL
+        if validacion_pendiente:
+            webhook_result = encolar_con_validacion_pendiente('se35', payload, prioridad=prioridad)
+        else:
+            webhook_result = encolar_envio('se35', payload, prioridad=prioridad)
+        # Encolado no es entregado: el operario ve el mensaje de la bandeja ("se enviará en segundo plano").
+        mensaje_exito = webhook_result["message"] if validacion_pendiente or webhook_result.get("encolado") else "Formulario enviado correctamente."
         
         if request.is_json:
             if webhook_result["success"]:
-                return jsonify(success=True, message="Formulario enviado correctamente.",
+                return jsonify(success=True, message=mensaje_exito,
                                category="success", data=payload), 200
             else:
                 return jsonify(success=False, message=webhook_result["message"],
                                category="danger"), webhook_result.get("status_code", 500)
 
-        flash("Formulario enviado correctamente." if webhook_result["success"] else f"Error al enviar: {webhook_result['message']}",
+        flash(mensaje_exito if webhook_result["success"] else f"Error al enviar: {webhook_result['message']}",
               "success" if webhook_result["success"] else "danger")
         return redirect(url_for('se35.sellado_form_se35'))
 
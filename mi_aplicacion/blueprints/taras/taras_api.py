@@ -3,11 +3,44 @@
 import requests
 import json
 import logging
-from flask import current_app 
+from flask import current_app
+
+from ...utils.webhooks import consultar_webhook
+from ...utils.datasets import registrar_dataset
 
 logger = logging.getLogger(__name__)
 
 
+def _descargar_solicitudes_cores(params=None):
+    """
+    Descarga las solicitudes de cores del webhook WEBHOOK_CORES_URL_SELECT: todas, o solo las
+    que cumplen `params` en la sincronización incremental. Lanza la excepción si la descarga falla.
+    """
+    webhook_url_from_config = current_app.config.get('WEBHOOK_CORES_URL_SELECT')
+    webhook_auth_from_config = current_app.config.get('WEBHOOK_CORES_AUTH')
+    if not webhook_url_from_config or not webhook_auth_from_config:
+        return []
+
+    headers = {
+        'Authorization': webhook_auth_from_config
+    }
+    response = consultar_webhook('solicitudes_cores_consulta', webhook_url_from_config, headers=headers, params=params)
+    response.raise_for_status() # Lanza un error para códigos de estado HTTP 4xx/5xx
+
+    data = response.json()
+    logger.info(f"Solicitudes de cores recibidas del webhook en taras_api: {len(data)} ({params or 'completa'})")
+    # n8n responde un objeto suelto cuando hay un solo registro.
+    return [data] if isinstance(data, dict) else data
+
+
+# Copia en memoria (utils/datasets.py): descarga completa en cada refresco. El webhook no implementa
+# desde_<campo>, por eso SOLICITUDES_CORES_SYNC_FIELD queda vacío.
+dataset_solicitudes_cores = registrar_dataset(
+    'solicitudes_cores', _descargar_solicitudes_cores, 'id', 'SOLICITUDES_CORES_REFRESH_INTERVAL',
+    clave_campo_marca='SOLICITUDES_CORES_SYNC_FIELD', clave_url='WEBHOOK_CORES_URL_SELECT'
+)
+
+
 # --- FUNCIÓN ÚNICA: get_solicitudes_cores ---
 def get_solicitudes_cores():
     data = []
@@ -27,16 +60,8 @@ def get_solicitudes_cores():
         return [], "Error: Autenticación del webhook no configurada."
 
     try:
-        headers = {
-            'Authorization': webhook_auth_from_config 
-        }
-        # verify=False  HARDCODEADO 
-        response = requests.get(webhook_url_from_config, headers=headers, timeout=10, verify=False)
-
-        response.raise_for_status() # Lanza un error para códigos de estado HTTP 4xx/5xx
-
-        data = response.json()
-        logger.info(f"Datos recibidos del webhook en taras_api: {data}")
+        # La copia en memoria solo descarga aquí la primera vez; después la mantiene el hilo de refresco.
+        data = dataset_solicitudes_cores.registros()
 
     except requests.exceptions.Timeout:
         error_message = 'Error al conectar con el servidor: Tiempo de espera agotado.'
@@ -46,10 +71,9 @@ def get_solicitudes_cores():
         logger.error(f"Error de solicitud al webhook {webhook_url_from_config}: {e}")
     except json.JSONDecodeError:
         error_message = 'Error al procesar la respuesta del webhook: No es un JSON válido.'
-        response_text = response.text if 'response' in locals() else "No response text available."
-        logger.error(f"Error de JSON al decodificar respuesta del webhook: {response_text}")
+        logger.error("Error de JSON al decodificar respuesta del webhook de solicitudes de cores.")
     except Exception as e:
         error_message = f'Ocurrió un error inesperado al cargar los datos: {e}'
         logger.error(f"Error inesperado en get_solicitudes_cores: {e}", exc_info=True)
 
-    return data, error_message
\ No newline at end of file
+    return data, error_message
@@ -0,0 +1,145 @@
+# mi_aplicacion/blueprints/transversal/consultas_epicor.py
+
+"""
+Consultas a Epicor compartidas por todos los formularios (empleado, trabajo y carnet).
+
+Antes cada formulario registraba su propia copia de /api/empleado y /api/trabajo, lo que
+repartía la caché del navegador en varios espacios de URL. Aquí hay una sola copia cuyas
+respuestas exitosas llevan ETag y Cache-Control, y responden 304 a los GET condicionales.
+"""
+
+import hashlib
+import json
+import time
+
+from flask import Blueprint, request, jsonify, current_app
+
+from ...utils.epicor_api import (
+    get_employee_name_from_id, get_job_data, get_employee_by_carnet_id,
+    resolver_lookups, TIPOS_LOOKUP
+)
+from ...utils.tokens_validacion import firmar_validacion
+from ...utils.deadline import con_deadline
+
+consultas_epicor_bp = Blueprint('consultas_epicor', __name__, url_prefix='/api')
+
+
+def _respuesta_cacheable(datos, max_age, token=None):
+    """
+    Respuesta JSON con ETag y Cache-Control. Con token firmado la respuesta es privada (un proxy
+    no la comparte) y el ETag incluye la ventana de tiempo en que se emitió el token: un 304 solo
+    reutiliza un token de la misma ventana, de media vigencia (VALIDATION_TOKEN_MAX_AGE / 2), así
+    que al POST le queda al menos la otra mitad antes de que venza.
+    """
+    contenido = json.dumps(datos, sort_keys=True, ensure_ascii=False)
+    if token:
+        ventana = max(1, current_app.config.get('VALIDATION_TOKEN_MAX_AGE', 900) // 2)
+        contenido += f"|{int(time.time() // ventana)}"
+        datos = {**datos, "token": token}
+    etag = hashlib.sha1(contenido.encode('utf-8')).hexdigest()
+    respuesta = jsonify(datos)
+    respuesta.set_etag(etag)
+    if token:
+        respuesta.cache_control.private = True
+        respuesta.cache_control.max_age = min(max_age, ventana)
+    else:
+        respuesta.cache_control.public = True
+        respuesta.cache_control.max_age = max_age
+    return respuesta.make_conditional(request)
+
+
+def _respuesta_no_cacheable(status, **datos):
+    """Errores, datos vencidos o modo degradado: nunca se guardan en caché."""
+    respuesta = jsonify(datos)
+    respuesta.status_code = status
+    respuesta.cache_control.no_store = True
+    return respuesta
+
+
+def _status_error(res):
+    if res.get("deadline_excedido"):
+        return 504
+    return 503 if res.get("degradado") else 404
+
+
+@consultas_epicor_bp.route('/empleado', methods=['GET'])
+@con_deadline('DEADLINE_CONSULTAS')
+def api_empleado():
+    eid = (request.args.get('id') or '').strip()
+    if not eid:
+        return _respuesta_no_cacheable(400, success=False, nombre="ID no proporcionado")
+    res = get_employee_name_from_id(eid)
+    if not res["success"]:
+        return _respuesta_no_cacheable(_status_error(res), success=False, nombre=res["message"])
+    if res.get("stale"):
+        # Sin token: Epicor no confirmó el nombre ahora, el POST valida (o difiere) por su cuenta.
+        return _respuesta_no_cacheable(200, success=True, nombre=res["nombre"], stale=True)
+    # El token permite al POST del formulario no volver a consultar Epicor por este ID.
+    return _respuesta_cacheable(
+        {"success": True, "nombre": res["nombre"]},
+        current_app.config.get('LOOKUP_HTTP_MAX_AGE', 60),
+        token=firmar_validacion('empleado', eid, res["nombre"]),
+    )
+
+
+@consultas_epicor_bp.route('/trabajo/<trabajo_id>', methods=['GET'])
+@con_deadline('DEADLINE_CONSULTAS')
+def api_trabajo(trabajo_id):
+    if not trabajo_id:
+        return _respuesta_no_cacheable(400, success=False, error="Trabajo ID faltante")
+    res = get_job_data(trabajo_id)
+    if not res["success"]:
+        return _respuesta_no_cacheable(_status_error(res), success=False, error=res["message"])
+    if res.get("stale"):
+        return _respuesta_no_cacheable(200, **res)
+    return _respuesta_cacheable(res, current_app.config.get('LOOKUP_HTTP_MAX_AGE', 60))
+
+
+@consultas_epicor_bp.route('/carnet/<carnet_id>', methods=['GET'])
+@con_deadline('DEADLINE_CONSULTAS')
+def api_carnet(carnet_id):
+    """Nombre y área/departamento del empleado dueño del carnet."""
+    if not carnet_id:
+        return _respuesta_no_cacheable(400, success=False, error="ID de carnet no proporcionado.")
+    res = get_employee_by_carnet_id(carnet_id)
+    if not res["success"]:
+        return _respuesta_no_cacheable(_status_error(res), success=False, error=res["message"])
+    datos = {"success": True, "nombre": res["nombre"], "area": res["area"]}
+    if res.get("stale"):
+        return _respuesta_no_cacheable(200, stale=True, **datos)
+    return _respuesta_cacheable(datos, current_app.config.get('LOOKUP_HTTP_MAX_AGE', 60))
+
+
+@consultas_epicor_bp.route('/lookup', methods=['GET', 'POST'])
+@con_deadline('DEADLINE_CONSULTAS')
+def api_lookup():
+    """
+    Resuelve varias claves en una sola petición.
+    POST: {"claves": [{"tipo": "empleado", "id": "123"}, {"tipo": "trabajo", "id": "J1"}]}
+    GET:  /api/lookup?empleado=123&trabajo=J1&carnet=456 (cada parámetro puede repetirse)
+    """
+    if request.method == 'POST':
+        datos = request.get_json(silent=True) or {}
+        claves = datos.get('claves')
+        if not isinstance(claves, list) or not all(isinstance(c, dict) for c in claves):
+            return jsonify(success=False, error="Se esperaba un JSON con la lista 'claves'."), 400
+    else:
+        claves = [{"tipo": tipo, "id": valor} for tipo in TIPOS_LOOKUP for valor in request.args.getlist(tipo)]
+
+    if not claves:
+        return jsonify(success=False, error="No se indicaron claves para consultar."), 400
+    limite = current_app.config.get('LOOKUP_MAX_KEYS', 50)
+    if len(claves) > limite:
+        return jsonify(success=False, error=f"Máximo {limite} claves por consulta."), 400
+
+    try:
+        resultados = resolver_lookups(claves)
+    except ValueError as e:
+        return jsonify(success=False, error=str(e)), 400
+
+    # Los empleados resueltos llevan su token firmado, igual que /api/empleado (no los servidos vencidos).
+    for clave, resultado in resultados.items():
+        tipo, valor = clave.split(':', 1)
+        if tipo == 'empleado' and resultado.get('success') and not resultado.get('stale'):
+            resultado['token'] = firmar_validacion('empleado', valor, resultado.get('nombre'))
+    return jsonify(success=True, resultados=resultados)
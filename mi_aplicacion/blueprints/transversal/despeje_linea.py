@@ -9,7 +9,8 @@ from flask import (
     session, current_app, url_for, redirect, flash
 )
 # Importamos las funciones de la API de Epicor, incluyendo la nueva de carnet
-from ...utils.epicor_api import get_employee_name_from_id, get_job_data, get_employee_by_carnet_id 
+from ...utils.epicor_api import get_employee_name_from_id, get_job_data, get_employee_by_carnet_id, consultar_en_paralelo
+from ...utils.deadline import con_deadline, exigir_a_tiempo
 
 # Desactivar advertencias de SSL inseguro (solo para desarrollo)
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -20,48 +21,8 @@ despeje_linea_bp = Blueprint(
     static_folder='../../../static'      
 )
 
-# APIs existentes (sin cambios, ya que ahora se usan en el frontend directamente para sus funciones)
-@despeje_linea_bp.route('/api/empleado', methods=['GET'])
-def api_empleado_despeje():
-    eid = request.args.get('id')
-    if not eid:
-        return jsonify(success=False, nombre="ID no proporcionado"), 400
-    res = get_employee_name_from_id(eid) # Esta función usa EPICOR_API_PAUSAS_ACTIVAS (por ID de empleado)
-    if res["success"]:
-        return jsonify(success=True, nombre=res["nombre"])
-    return jsonify(success=False, nombre=res["message"]), 404
-
-@despeje_linea_bp.route('/api/trabajo/<trabajo_id>', methods=['GET'])
-def api_trabajo_despeje(trabajo_id):
-    if not trabajo_id:
-        return jsonify(success=False, error="Trabajo ID faltante"), 400
-    res = get_job_data(trabajo_id) # Esta función usa EPICOR_API_TRABAJOS_FORM
-    if res["success"]:
-        return jsonify(res)
-    return jsonify(success=False, error=res["message"]), 404
-
-# --- NUEVA RUTA API para consultar datos del carnet del AUTORIZADOR ---
-@despeje_linea_bp.route('/api/carnet/<carnet_id>', methods=['GET'])
-def api_carnet_despeje(carnet_id):
-    """
-    Consulta la API de Epicor HMP_PausasActivas por ID de Carnet.
-    Devuelve nombre y área/departamento.
-    """
-    if not carnet_id:
-        return jsonify(success=False, error="ID de carnet no proporcionado."), 400
-    
-    # Usar la función de utilidad get_employee_by_carnet_id
-    res = get_employee_by_carnet_id(carnet_id)
-    
-    if res["success"]:
-        # Devolvemos éxito junto con el nombre y el área
-        return jsonify(success=True, nombre=res["nombre"], area=res["area"])
-    else:
-        # Devolvemos el error específico de la utilidad
-        return jsonify(success=False, error=res["message"]), 404 # 404 si no encontrado, 500 si error de conexión
-
-
 @despeje_linea_bp.route('/despeje_linea_form', methods=['GET','POST'])
+@con_deadline('DEADLINE_FORMULARIOS')
 def despeje_linea_form():
     if 'user_id' not in session:
         flash('Por favor, inicia sesión.', 'warning')
@@ -142,11 +103,25 @@ def despeje_linea_form():
                 validation_errors.append((f, f'El campo "{label}" debe contener solo dígitos.'))
 
 
+        # --- Consultas a Epicor (operario, trabajo y autorizador) en paralelo ---
+        employee_id_input = datos.get('id_empleado')
+        trabajo_input = datos.get('trabajo')
+        carnet_autorizador_input = datos.get('autorizado_por_carnet')
+
+        consultas_epicor = {}
+        if employee_id_input and to_int(employee_id_input) is not None:
+            consultas_epicor['operario'] = (get_employee_name_from_id, employee_id_input)
+        if trabajo_input:
+            consultas_epicor['trabajo'] = (get_job_data, trabajo_input)
+        if carnet_autorizador_input and str(carnet_autorizador_input).isdigit(): # Solo si es numérico
+            consultas_epicor['autorizador'] = (get_employee_by_carnet_id, carnet_autorizador_input)
+        resultados_epicor = consultar_en_paralelo(consultas_epicor)
+        exigir_a_tiempo(*resultados_epicor.values())
+
         # --- Validar ID de empleado del operario en Epicor ---
         nombre_empleado_operario = "" 
-        employee_id_input = datos.get('id_empleado')
-        if employee_id_input and to_int(employee_id_input) is not None: 
-            emp_api_res = get_employee_name_from_id(employee_id_input)
+        if 'operario' in resultados_epicor:
+            emp_api_res = resultados_epicor['operario']
             if not emp_api_res["success"]:
                 validation_errors.append(('id_empleado',f"Error validando ID Operario: {emp_api_res['message']}"))
             else:
@@ -154,9 +129,8 @@ def despeje_linea_form():
 
         # --- Validar trabajo en Epicor ---
         parte_del_trabajo_api = ""
-        trabajo_input = datos.get('trabajo')
-        if trabajo_input:
-            job_api_res = get_job_data(trabajo_input)
+        if 'trabajo' in resultados_epicor:
+            job_api_res = resultados_epicor['trabajo']
             if not job_api_res["success"]:
                 validation_errors.append(('trabajo',f"Error validando trabajo: {job_api_res['message']}"))
             else:
@@ -169,9 +143,8 @@ def despeje_linea_form():
         # --- Validación del Autorizador por Carnet ---
         nombre_autorizador = ""
         cargo_autorizador = "" # Este será el departamento/área
-        carnet_autorizador_input = datos.get('autorizado_por_carnet')
-        if carnet_autorizador_input and str(carnet_autorizador_input).isdigit(): # Solo si es numérico
-            auth_api_res = get_employee_by_carnet_id(carnet_autorizador_input)
+        if 'autorizador' in resultados_epicor:
+            auth_api_res = resultados_epicor['autorizador']
             if not auth_api_res["success"]:
                 validation_errors.append(('autorizado_por_carnet',f"Error validando Autorizador (Carnet): {auth_api_res['message']}"))
             else:
@@ -9,6 +9,11 @@ import json
 import urllib3
 
 from ...utils.epicor_api import validate_employee_id
+from ...utils.tokens_validacion import firmar_validacion, empleado_activo_validado
+from ...utils.webhooks import enviar_webhook
+from ...utils.outbox import encolar_envio, registrar_destino
+from ...utils.idempotencia import evitar_envio_duplicado
+from ...utils.deadline import con_deadline
 
 # Desactivar advertencias SSL sólo para desarrollo.
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -33,10 +38,9 @@ def send_empalme_to_webhook(data_payload):
     }
 
     try:
-        response = requests.post(
-            webhook_url, headers=headers,
+        response = enviar_webhook(
+            'empalme_turno', webhook_url, headers=headers,
             data=json.dumps(data_payload),
-            timeout=15,
             verify=False  # Solo para desarrollo
         )
         response.raise_for_status()
@@ -49,7 +53,8 @@ def send_empalme_to_webhook(data_payload):
                 return {"success": True, "message": "Datos registrados exitosamente en la base de datos (ID: {}).".format(webhook_response_json['id'])}
             else:
                 current_app.logger.error(f"Webhook respondió con JSON inesperado: {webhook_response_json}")
-                return {"success": False, "message": f"Webhook no devolvió un ID de registro. Respuesta: {webhook_response_json.get('message', 'Formato inesperado')}"}
+                return {"success": False, "message": f"Webhook no devolvió un ID de registro. Respuesta: {webhook_response_json.get('message', 'Formato inesperado')}",
+                        "status_code": response.status_code}
         except json.JSONDecodeError:
             if 200 <= response.status_code < 300:
                 current_app.logger.warning("Webhook de Empalme de Turno: Respuesta OK, pero no es JSON.")
@@ -67,8 +72,13 @@ def send_empalme_to_webhook(data_payload):
         current_app.logger.error(f"Error inesperado en send_empalme_to_webhook: {e}", exc_info=True)
         return {"success": False, "message": "Error interno al procesar el envío al webhook."}
 
+
+registrar_destino('empalme_turno', send_empalme_to_webhook)
+
 # --- Ruta para el Formulario de Empalme de Turno ---
 @empalme_turno_bp.route('/formulario', methods=['GET', 'POST'])
+@con_deadline('DEADLINE_FORMULARIOS')
+@evitar_envio_duplicado
 def empalme_turno_form():
     user_id_session = session.get('user_id')
     user_name_session = session.get('user_name')
@@ -136,7 +146,7 @@ def empalme_turno_form():
         elif not re.fullmatch(r'[0-9]{1,5}', id_entrega_maquina):
             errors.append('El ID que entregó máquina debe ser numérico y tener entre 1 y 5 dígitos.')
         else:
-            validation_result_id_maquina = validate_employee_id(id_entrega_maquina)
+            validation_result_id_maquina = empleado_activo_validado(id_entrega_maquina, datos.get('token_id_entrega_maquina'))
             if not validation_result_id_maquina["success"]:
                 errors.append(f'ID de máquina inválido: {validation_result_id_maquina["message"]}')
             else:
@@ -196,7 +206,7 @@ def empalme_turno_form():
 
         current_app.logger.info(f"Payload final para Webhook: {registro_empalme_payload}")
 
-        webhook_send_result = send_empalme_to_webhook(registro_empalme_payload)
+        webhook_send_result = encolar_envio('empalme_turno', registro_empalme_payload)
 
         if webhook_send_result["success"]:
             flash(webhook_send_result["message"], 'success')
@@ -219,12 +229,17 @@ def empalme_turno_form():
 
 
 @empalme_turno_bp.route('/validar_id_maquina', methods=['POST'])
+@con_deadline('DEADLINE_CONSULTAS')
 def validar_id_maquina_ajax():
     employee_id = request.json.get('employee_id')
     if not employee_id:
         return jsonify({"success": False, "message": "ID de empleado no proporcionado."}), 400
     validation_result = validate_employee_id(employee_id)
     if validation_result["success"]:
-        return jsonify({"success": True, "employee_name": validation_result["user_name"]}), 200
+        return jsonify({
+            "success": True,
+            "employee_name": validation_result["user_name"],
+            "token": firmar_validacion('validador', employee_id, validation_result["user_name"]),
+        }), 200
     else:
         return jsonify({"success": False, "message": validation_result["message"]}), 200
@@ -8,7 +8,11 @@ from flask import (
     session, current_app, url_for, redirect, flash
 )
 # Asegúrate de que esta ruta sea correcta para tu estructura de proyecto
-from ...utils.epicor_api import get_employee_name_from_id 
+from ...utils.epicor_api import get_employee_name_from_id, consultar_en_paralelo
+from ...utils.webhooks import enviar_webhook
+from ...utils.outbox import PRIORIDAD_CRITICA, PRIORIDAD_NORMAL, encolar_envio, registrar_destino
+from ...utils.idempotencia import evitar_envio_duplicado
+from ...utils.deadline import con_deadline, exigir_a_tiempo
 
 # Desactivar advertencias de SSL inseguro (solo para desarrollo)
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -19,19 +23,40 @@ monitoreo_cuchillas_bp = Blueprint(
     static_folder='../../../static'
 )
 
-# API para buscar empleado por ID (para el operario ID)
-@monitoreo_cuchillas_bp.route('/api/empleado', methods=['GET'])
-def api_empleado_cuchillas():
-    eid = request.args.get('id')
-    if not eid:
-        return jsonify(success=False, nombre="ID no proporcionado"), 400
-    res = get_employee_name_from_id(eid)
-    if res["success"]:
-        return jsonify(success=True, nombre=res["nombre"])
-    return jsonify(success=False, nombre=res["message"]), 404
+
+# --- Función auxiliar para enviar el registro al webhook de cuchillas ---
+def enviar_monitoreo_cuchillas_a_webhook(payload):
+    webhook_url = current_app.config.get('WEBHOOK_MONITOREO_CUCHILLAS_URL')
+    webhook_auth = current_app.config.get('WEBHOOK_AUTH')
+
+    if not webhook_url or not webhook_auth:
+        current_app.logger.error("URL o token de autenticación del webhook de Monitoreo de Cuchillas no configurados.")
+        return {"success": False, "message": "Error de configuración del webhook. Contacta a soporte."}
+
+    headers = {
+        'Content-Type': 'application/json',
+        'Authorization': webhook_auth
+    }
+
+    try:
+        response = enviar_webhook('monitoreo_cuchillas', webhook_url, headers=headers, data=json.dumps(payload))
+        response.raise_for_status()
+        current_app.logger.info(f"Webhook de Cuchillas enviado exitosamente. Respuesta: {response.text}")
+        return {"success": True, "status_code": response.status_code}
+    except requests.exceptions.HTTPError as e:
+        current_app.logger.error(f"Error al enviar datos al webhook de Cuchillas: {e}")
+        return {"success": False, "message": str(e), "status_code": e.response.status_code}
+    except requests.exceptions.RequestException as e:
+        current_app.logger.error(f"Error al enviar datos al webhook de Cuchillas: {e}")
+        return {"success": False, "message": str(e)}
+
+
+registrar_destino('monitoreo_cuchillas', enviar_monitoreo_cuchillas_a_webhook, admite_lotes=True)
 
 
 @monitoreo_cuchillas_bp.route('/monitoreo_cuchillas_form', methods=['GET','POST'])
+@con_deadline('DEADLINE_FORMULARIOS')
+@evitar_envio_duplicado
 def monitoreo_cuchillas_form():
     if 'user_id' not in session:
         flash('Por favor, inicia sesión.', 'warning')
@@ -122,11 +147,22 @@ def monitoreo_cuchillas_form():
         if sum_estado_cuchillas != cuchilla_cantidad_total:
             validation_errors.append(('cuchillas_estados', f'La suma de las cuchillas por estado ({sum_estado_cuchillas}) no coincide con la cantidad total de cuchillas ({cuchilla_cantidad_total}).'))
 
-        # --- Validar ID de operario en Epicor ---
-        nombre_operario = ""
+        # --- Consultas a Epicor (operario y quien recibe) en paralelo ---
         operario_id_input = datos.get('id_operario')
+        id_quien_recibe_input = datos.get('id_quien_recibe')
+
+        consultas_epicor = {}
         if operario_id_input and to_int(operario_id_input) is not None:
-            emp_api_res = get_employee_name_from_id(operario_id_input)
+            consultas_epicor['operario'] = (get_employee_name_from_id, operario_id_input)
+        if id_quien_recibe_input and to_int(id_quien_recibe_input) is not None:
+            consultas_epicor['quien_recibe'] = (get_employee_name_from_id, id_quien_recibe_input)
+        resultados_epicor = consultar_en_paralelo(consultas_epicor)
+        exigir_a_tiempo(*resultados_epicor.values())
+
+        # --- Validar ID de operario en Epicor ---
+        nombre_operario = ""
+        if 'operario' in resultados_epicor:
+            emp_api_res = resultados_epicor['operario']
             if not emp_api_res["success"]:
                 validation_errors.append(('id_operario',f"Error validando ID Operario: {emp_api_res['message']}"))
             else:
@@ -134,9 +170,8 @@ def monitoreo_cuchillas_form():
 
         # --- Validar ID de quien recibe en Epicor ---
         nombre_quien_recibe = ""
-        id_quien_recibe_input = datos.get('id_quien_recibe')
-        if id_quien_recibe_input and to_int(id_quien_recibe_input) is not None:
-            recibe_api_res = get_employee_name_from_id(id_quien_recibe_input)
+        if 'quien_recibe' in resultados_epicor:
+            recibe_api_res = resultados_epicor['quien_recibe']
             if not recibe_api_res["success"]:
                 validation_errors.append(('id_quien_recibe', f"Error validando ID Quien Recibe: {recibe_api_res['message']}"))
             else:
@@ -188,32 +223,16 @@ def monitoreo_cuchillas_form():
         # --- DEBUGGING: Imprime el payload final ANTES de enviarlo ---
         current_app.logger.info(f"DEBUG: Payload final a enviar al webhook: {payload_dict_cleaned}")
 
-        # --- ENVÍO AL WEBHOOK ---
-        webhook_url = current_app.config.get('WEBHOOK_MONITOREO_CUCHILLAS_URL')
-        webhook_auth = current_app.config.get('WEBHOOK_AUTH') 
-
-        if not webhook_url or not webhook_auth:
-            current_app.logger.error("URL o token de autenticación del webhook de Monitoreo de Cuchillas no configurados.")
-            return jsonify(success=False, message="Error de configuración del webhook. Contacta a soporte.", category="danger"), 500
-
-        payload_json_string = json.dumps(payload_dict_cleaned) 
-
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': webhook_auth
-        }
-
+        # --- ENVÍO AL WEBHOOK (a través de la bandeja de salida) ---
         try:
-            response = requests.request("POST", webhook_url, headers=headers, data=payload_json_string, timeout=5, verify=False)
-            response.raise_for_status() 
-            current_app.logger.info(f"Webhook de Cuchillas enviado exitosamente. Respuesta: {response.text}")
-            
-            return jsonify(success=True, message="Monitoreo de Cuchillas registrado.",
-                            category="success", data=payload_dict_cleaned), 200
-
-        except requests.exceptions.RequestException as e:
-            current_app.logger.error(f"Error al enviar datos al webhook de Cuchillas: {e}")
-            return jsonify(success=False, message="Error al enviar al webhook de Cuchillas.", category="danger", details=str(e)), 500
+            # Un reporte con cuchillas fracturadas sale antes que los monitoreos de rutina.
+            prioridad = PRIORIDAD_CRITICA if fractura_cantidad > 0 else PRIORIDAD_NORMAL
+            resultado_envio = encolar_envio('monitoreo_cuchillas', payload_dict_cleaned, prioridad=prioridad)
+            if resultado_envio["success"]:
+                return jsonify(success=True, message="Monitoreo de Cuchillas registrado.",
+                                category="success", data=payload_dict_cleaned), 200
+            return jsonify(success=False, message="Error al enviar al webhook de Cuchillas.", category="danger",
+                           details=resultado_envio.get("message")), 500
         except Exception as e:
             current_app.logger.error(f"Error inesperado al procesar el formulario de Cuchillas: {e}", exc_info=True)
             return jsonify(success=False, message="Ocurrió un error interno al procesar el formulario de Cuchillas.", category="danger", details='Contacte a soporte.'), 500
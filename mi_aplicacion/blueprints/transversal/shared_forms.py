@@ -11,6 +11,13 @@ from datetime import datetime
 import pytz # Para manejar zonas horarias
 import urllib3 # Para desactivar InsecureRequestWarning si usas verify=False
 
+from ...utils.webhooks import enviar_webhook, cuerpo_json
+from ...utils.outbox import encolar_envio, registrar_destino
+from ...utils.idempotencia import evitar_envio_duplicado
+from ...utils.deadline import con_deadline
+from ...utils.bulkheads import BulkheadSaturado
+from ...utils.hojas import lector_hoja
+
 # Desactivar las advertencias de InsecureRequestWarning al usar verify=False.
 # ¡IMPORTANTE!: Esto solo debe usarse en entornos de desarrollo/prueba.
 # NO en producción, ya que deshabilita la verificación de certificados SSL, lo cual es un riesgo de seguridad.
@@ -33,9 +40,25 @@ MAQUINAS_POR_PROCESO = {
 }
 
 
-# === FUNCIÓN AUXILIAR PARA ENVIAR AL WEBHOOK DE CORES ===
-def enviar_solicitud_cores_a_webhook(datos_formulario, user_session_data):
-    """Función para enviar datos de solicitud de cores al webhook externo."""
+# === FUNCIONES AUXILIARES PARA EL WEBHOOK DE CORES ===
+def construir_payload_cores(datos_formulario, user_session_data):
+    """Arma el payload del webhook de Cores. Lanza ValueError/KeyError si los datos no convierten."""
+    return {
+        "marca_temporal": user_session_data.get('fecha_hora_registro'),
+        "area_solicitante": datos_formulario['area_solicitante'],
+        "id_solicitante": int(datos_formulario['solicitante_id']),
+        "solicitante_nombre": user_session_data.get('user_name'),
+        "maquina_seleccionada": datos_formulario.get('maquina_refiladora', ''), # <-- CAMBIADO A maquina_seleccionada en el payload
+        "trabajo": datos_formulario['trabajo_ingresa'],
+        "cantidad_cores": int(datos_formulario['cantidad_cores']),
+        "diametro": datos_formulario['diametro'],
+        "medida_mm": int(datos_formulario['medida_mm']),
+        "observaciones": datos_formulario.get('observaciones', ''),
+    }
+
+
+def enviar_payload_cores_a_webhook(payload):
+    """Envía al webhook de Cores un payload ya armado (o una lista de payloads)."""
     webhook_cores_url = current_app.config.get('WEBHOOK_CORES_URL')
     webhook_cores_auth = current_app.config.get('WEBHOOK_CORES_AUTH')
 
@@ -43,66 +66,42 @@ def enviar_solicitud_cores_a_webhook(datos_formulario, user_session_data):
         current_app.logger.error("URL o token de autenticación del webhook de Cores no configurados en app.config.")
         return {"success": False, "message": "Error de configuración interna del webhook de Cores. Contacta a soporte."}
 
-    try:
-        fecha_hora_solicitud = user_session_data.get('fecha_hora_registro')
-
-        payload = {
-            "marca_temporal": fecha_hora_solicitud,
-            "area_solicitante": datos_formulario['area_solicitante'],
-            "id_solicitante": int(datos_formulario['solicitante_id']),
-            "solicitante_nombre": user_session_data.get('user_name'),
-            "maquina_seleccionada": datos_formulario.get('maquina_refiladora', ''), # <-- CAMBIADO A maquina_seleccionada en el payload
-            "trabajo": datos_formulario['trabajo_ingresa'],
-            "cantidad_cores": int(datos_formulario['cantidad_cores']),
-            "diametro": datos_formulario['diametro'],
-            "medida_mm": int(datos_formulario['medida_mm']),
-            "observaciones": datos_formulario.get('observaciones', ''),
-        }
-        
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': webhook_cores_auth
-        }
-        
-        current_app.logger.info("Enviando solicitud de cores a webhook: %s", payload)
+    headers = {
+        'Content-Type': 'application/json',
+        'Authorization': webhook_cores_auth
+    }
 
-        try:
-            response = requests.post(
-                webhook_cores_url,
-                headers=headers,
-                json=payload,
-                timeout=5,
-                verify=True
-            )
-            response.raise_for_status()
-            current_app.logger.info("Respuesta del webhook de Cores (con SSL): %s", response.text)
-            return {"success": True, "data": response.json(), "status_code": response.status_code}
-
-        except requests.exceptions.SSLError as ssl_error:
-            current_app.logger.warning(f"Error de SSL en webhook Cores: {str(ssl_error)}. Reintentando sin verificación...")
-            response = requests.post(
-                webhook_cores_url,
-                headers=headers,
-                json=payload,
-                timeout=5,
-                verify=False
-            )
-            response.raise_for_status()
-            current_app.logger.warning("Conexión exitosa sin verificación SSL (solo para desarrollo) para Cores")
-            return {"success": True, "data": response.json(), "status_code": response.status_code}
-            
+    current_app.logger.info("Enviando solicitud de cores a webhook: %s", payload)
+
+    try:
+        response = enviar_webhook(
+            'solicitud_cores',
+            webhook_cores_url,
+            headers=headers,
+            json=payload
+        )
+        response.raise_for_status()
+        current_app.logger.info("Respuesta del webhook de Cores: %s", response.text)
+        # Un 2xx ya quedó registrado en n8n aunque el cuerpo no sea JSON: no se debe reenviar.
+        return {"success": True, "data": cuerpo_json(response), "status_code": response.status_code}
+
+    except requests.exceptions.HTTPError as e:
+        current_app.logger.error(f"Error enviando al webhook de Cores: {str(e)}", exc_info=True)
+        return {"success": False, "message": f"Error de conexión al sistema externo: {str(e)}", "status_code": e.response.status_code}
     except requests.exceptions.RequestException as e:
         current_app.logger.error(f"Error enviando al webhook de Cores: {str(e)}", exc_info=True)
         return {"success": False, "message": f"Error de conexión al sistema externo: {str(e)}"}
-    except ValueError as e:
-        current_app.logger.error(f"Error en la conversión de tipos para el payload del webhook de Cores: {str(e)}", exc_info=True)
-        return {"success": False, "message": f"Error en el formato de datos para el envío al webhook: {str(e)}"}
     except Exception as e:
         current_app.logger.error(f"Error inesperado al preparar/enviar webhook de Cores: {str(e)}", exc_info=True)
         return {"success": False, "message": f"Error inesperado al comunicarse con el sistema externo: {str(e)}"}
 
 
+registrar_destino('solicitud_cores', enviar_payload_cores_a_webhook, admite_lotes=True)
+
+
 @shared_bp.route('/formulario/solicitud_cores', methods=['GET', 'POST'])
+@con_deadline('DEADLINE_FORMULARIOS')
+@evitar_envio_duplicado
 def solicitud_cores_form():
     user_id_session = session.get('user_id')
     user_name_session = session.get('user_name')
@@ -214,7 +213,7 @@ def solicitud_cores_form():
                 'fecha_hora_registro': fecha_hora_registro_str # Usar este formato
             }
             
-            webhook_response = enviar_solicitud_cores_a_webhook(datos, user_session_data)
+            webhook_response = encolar_envio('solicitud_cores', construir_payload_cores(datos, user_session_data))
             
             current_app.logger.info(f"Respuesta del webhook de Cores: {webhook_response}")
             
@@ -311,15 +310,11 @@ def monitoreo_cores_sheet():
                                error_message='No se pudo establecer conexión con la hoja de Google Sheets para el monitoreo. Contacta a soporte.')
     else:
         try:
-            all_values = sheet.get_all_values()
-            if all_values:
-                headers = all_values[0][:19]
-                records_raw = all_values[1:]
-                records_raw.reverse() 
-                
-                for row in records_raw:
-                    row_padded = row[:19] + [''] * (19 - len(row))
-                    all_records.append(row_padded)
+            # Columnas A:S desde la caché; solo se piden a Sheets las filas nuevas (utils/hojas.py)
+            encabezados, filas = lector_hoja(sheet, 'A', 'S').leer()
+            if encabezados or filas:
+                headers = encabezados
+                all_records = filas[::-1]  # Lo más reciente primero
             else:
                 return render_template('shared_forms/monitoreo_cores.html',
                                        username=user_name_session,
@@ -329,6 +324,15 @@ def monitoreo_cores_sheet():
                                        records=all_records,
                                        headers=headers,
                                        info_message='La hoja de cálculo de monitoreo está vacía.')
+        except BulkheadSaturado:
+            return render_template('shared_forms/monitoreo_cores.html',
+                                   username=user_name_session,
+                                   url_volver_proceso=url_volver_proceso,
+                                   proceso_origen_nombre=proceso_origen_nombre,
+                                   subseccion="Monitoreo de Estado de Core",
+                                   records=all_records,
+                                   headers=headers,
+                                   error_message='Google Sheets está atendiendo muchas consultas. Intenta de nuevo en unos segundos.'), 503
         except Exception as e:
             current_app.logger.error(f"Error al leer datos de la hoja de monitoreo de cores: {e}", exc_info=True)
             return render_template('shared_forms/monitoreo_cores.html',
@@ -0,0 +1,146 @@
+# mi_aplicacion/utils/admision.py
+
+"""
+Control de admisión de peticiones entrantes (middleware WSGI).
+
+Cada petición se clasifica por tipo de ruta: 'formulario' (POST de formularios y acciones),
+'consulta' (APIs de validación contra Epicor), 'pagina' (dashboards y formularios en GET) y
+'estatico'. Cada clase tiene un máximo de peticiones en curso por proceso; al pasarlo la
+petición se responde al instante con 503 y Retry-After en lugar de quedar en cola detrás de
+las demás. Las consultas y páginas además se rechazan cuando el total en curso llega a
+ADMISSION_MAX_TOTAL menos ADMISSION_RESERVA_FORMULARIOS, de modo que en el cambio de turno
+siempre queda espacio para que los formularios se envíen.
+"""
+
+import json
+import threading
+
+from werkzeug.wsgi import ClosingIterator
+
+FORMULARIO = 'formulario'
+CONSULTA = 'consulta'
+PAGINA = 'pagina'
+ESTATICO = 'estatico'
+
+# Clase -> (clave de configuración del máximo en curso, máximo por defecto)
+LIMITES = {
+    FORMULARIO: ('ADMISSION_MAX_FORMULARIOS', 24),
+    CONSULTA: ('ADMISSION_MAX_CONSULTAS', 16),
+    PAGINA: ('ADMISSION_MAX_PAGINAS', 12),
+    ESTATICO: ('ADMISSION_MAX_ESTATICOS', 16),
+}
+
+# Clases que ceden su lugar a los formularios cuando el proceso está cerca del total.
+_BAJA_PRIORIDAD = (CONSULTA, PAGINA, ESTATICO)
+
+_RUTAS_CONSULTA = ('/api/', '/empalme_turno/validar_id_maquina')
+# Diagnóstico siempre responde, aunque el proceso esté saturado.
+_RUTAS_EXENTAS = ('/api/diagnostico',)
+
+_METODOS_ESCRITURA = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+
+def clasificar(environ):
+    """Clase de admisión de la petición WSGI `environ`."""
+    ruta = environ.get('PATH_INFO', '')
+    if ruta.startswith('/static/'):
+        return ESTATICO
+    if ruta.startswith(_RUTAS_CONSULTA):
+        return CONSULTA
+    if environ.get('REQUEST_METHOD', 'GET') in _METODOS_ESCRITURA:
+        return FORMULARIO
+    return PAGINA
+
+
+class ControlAdmision:
+    """Envuelve `app.wsgi_app` y cuenta las peticiones en curso por clase."""
+
+    def __init__(self, wsgi_app, config):
+        self.wsgi_app = wsgi_app
+        self.habilitado = config.get('ADMISSION_CONTROL_ENABLED', True)
+        self.max_total = config.get('ADMISSION_MAX_TOTAL', 40)
+        self.reserva_formularios = config.get('ADMISSION_RESERVA_FORMULARIOS', 8)
+        self.retry_after = config.get('ADMISSION_RETRY_AFTER', 2)
+        self.limites = {clase: config.get(clave, tope) for clase, (clave, tope) in LIMITES.items()}
+        self._lock = threading.Lock()
+        self.en_curso = {clase: 0 for clase in LIMITES}
+        self.max_en_curso = {clase: 0 for clase in LIMITES}
+        self.atendidas = {clase: 0 for clase in LIMITES}
+        self.rechazadas = {clase: 0 for clase in LIMITES}
+
+    def _admitir(self, clase):
+        with self._lock:
+            total = sum(self.en_curso.values())
+            tope_total = self.max_total - self.reserva_formularios if clase in _BAJA_PRIORIDAD else self.max_total
+            if self.en_curso[clase] >= self.limites[clase] or total >= tope_total:
+                self.rechazadas[clase] += 1
+                return False
+            self.en_curso[clase] += 1
+            self.atendidas[clase] += 1
+            self.max_en_curso[clase] = max(self.max_en_curso[clase], self.en_curso[clase])
+            return True
+
+    def _liberar(self, clase):
+        with self._lock:
+            self.en_curso[clase] -= 1
+
+    def _rechazar(self, environ, start_response, clase):
+        mensaje = "El servidor está atendiendo muchas solicitudes. Intenta de nuevo en unos segundos."
+        if clase == PAGINA and 'application/json' not in environ.get('HTTP_ACCEPT', ''):
+            cuerpo = f"<!doctype html><meta charset=\"utf-8\"><title>Servidor ocupado</title><p>{mensaje}</p>".encode('utf-8')
+            tipo = 'text/html; charset=utf-8'
+        else:
+            cuerpo = json.dumps({"success": False, "sobrecarga": True, "message": mensaje, "category": "warning"}, ensure_ascii=False).encode('utf-8')
+            tipo = 'application/json'
+        start_response('503 SERVICE UNAVAILABLE', [
+            ('Content-Type', tipo),
+            ('Content-Length', str(len(cuerpo))),
+            ('Retry-After', str(self.retry_after)),
+        ])
+        return [cuerpo]
+
+    def __call__(self, environ, start_response):
+        if not self.habilitado or environ.get('PATH_INFO', '').startswith(_RUTAS_EXENTAS):
+            return self.wsgi_app(environ, start_response)
+
+        clase = clasificar(environ)
+        if not self._admitir(clase):
+            return self._rechazar(environ, start_response, clase)
+        try:
+            respuesta = self.wsgi_app(environ, start_response)
+        except Exception:
+            self._liberar(clase)
+            raise
+        # El cupo se libera cuando el servidor termina de enviar la respuesta.
+        return ClosingIterator(respuesta, [lambda: self._liberar(clase)])
+
+    def stats(self):
+        with self._lock:
+            return {
+                "habilitado": self.habilitado,
+                "max_total": self.max_total,
+                "reserva_formularios": self.reserva_formularios,
+                "clases": {
+                    clase: {
+                        "limite": self.limites[clase],
+                        "en_curso": self.en_curso[clase],
+                        "max_en_curso": self.max_en_curso[clase],
+                        "atendidas": self.atendidas[clase],
+                        "rechazadas": self.rechazadas[clase],
+                    }
+                    for clase in LIMITES
+                },
+            }
+
+
+def instalar_control_admision(app):
+    """Envuelve la app con el control de admisión y lo deja en app.extensions para el diagnóstico."""
+    control = ControlAdmision(app.wsgi_app, app.config)
+    app.wsgi_app = control
+    app.extensions['control_admision'] = control
+    return control
+
+
+def get_admision_stats(app):
+    control = app.extensions.get('control_admision')
+    return control.stats() if control else {"habilitado": False}
@@ -0,0 +1,116 @@
+# mi_aplicacion/utils/bulkheads.py
+
+"""
+Compartimentos (bulkheads) de concurrencia por sistema externo.
+
+Cada upstream (Epicor, n8n, Google Sheets) tiene un tope de llamadas simultáneas por
+proceso. Si el tope está lleno se espera un momento corto (BULKHEAD_QUEUE_WAIT, sin pasar
+del deadline de la petición) y luego se rechaza de inmediato con BulkheadSaturado. Así un
+webhook lento ocupa como mucho sus propios cupos y no todos los hilos del worker, y el
+login o los dashboards siguen respondiendo.
+"""
+
+import threading
+from contextlib import contextmanager
+
+import requests
+from flask import current_app
+
+from .deadline import tiempo_restante
+
+# Nombre del bulkhead -> (clave de configuración del tope, tope por defecto)
+UPSTREAMS = {
+    'epicor': ('BULKHEAD_EPICOR_MAX', 8),
+    'n8n': ('BULKHEAD_N8N_MAX', 6),
+    'sheets': ('BULKHEAD_SHEETS_MAX', 2),
+}
+
+_bulkheads = {}
+_bulkheads_lock = threading.Lock()
+
+
+class BulkheadSaturado(requests.exceptions.ConnectionError):
+    """
+    El upstream ya tiene el máximo de llamadas en curso. Hereda de ConnectionError para que
+    los llamadores lo traten como una falla de conexión (resultado degradado, reintento).
+    """
+
+
+class Bulkhead:
+    """Semáforo con espera acotada y contadores de uso."""
+
+    def __init__(self, nombre, max_concurrentes, max_espera):
+        self.nombre = nombre
+        self.max_concurrentes = max_concurrentes
+        self.max_espera = max_espera
+        self._semaforo = threading.BoundedSemaphore(max_concurrentes)
+        self._lock = threading.Lock()
+        self.en_curso = 0
+        self.en_cola = 0
+        self.max_en_curso = 0
+        self.aceptadas = 0
+        self.rechazadas = 0
+
+    @contextmanager
+    def ocupar(self):
+        espera = self.max_espera
+        restante = tiempo_restante()
+        if restante is not None:
+            espera = max(0.0, min(espera, restante))
+
+        with self._lock:
+            self.en_cola += 1
+        try:
+            obtenido = self._semaforo.acquire(timeout=espera)
+        finally:
+            with self._lock:
+                self.en_cola -= 1
+        if not obtenido:
+            with self._lock:
+                self.rechazadas += 1
+            raise BulkheadSaturado(f"{self.nombre}: {self.max_concurrentes} llamadas en curso, no se aceptan más por ahora.")
+
+        with self._lock:
+            self.en_curso += 1
+            self.aceptadas += 1
+            self.max_en_curso = max(self.max_en_curso, self.en_curso)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.en_curso -= 1
+            self._semaforo.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_concurrentes": self.max_concurrentes,
+                "en_curso": self.en_curso,
+                "en_cola": self.en_cola,
+                "max_en_curso": self.max_en_curso,
+                "aceptadas": self.aceptadas,
+                "rechazadas": self.rechazadas,
+            }
+
+
+def bulkhead(nombre):
+    """Bulkhead del upstream `nombre` (uno por proceso, creado con la configuración de la app)."""
+    compartimento = _bulkheads.get(nombre)
+    if compartimento is None:
+        with _bulkheads_lock:
+            compartimento = _bulkheads.get(nombre)
+            if compartimento is None:
+                clave_config, tope = UPSTREAMS[nombre]
+                compartimento = Bulkhead(
+                    nombre,
+                    current_app.config.get(clave_config, tope),
+                    current_app.config.get('BULKHEAD_QUEUE_WAIT', 0.5),
+                )
+                _bulkheads[nombre] = compartimento
+    return compartimento
+
+
+def get_bulkhead_stats():
+    with _bulkheads_lock:
+        compartimentos = list(_bulkheads.values())
+    return {c.nombre: c.stats() for c in compartimentos}
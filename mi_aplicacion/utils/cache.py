@@ -0,0 +1,178 @@
+# mi_aplicacion/utils/cache.py
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Caché en memoria acotada por tamaño (LRU) con expiración por entrada.
+    Es segura entre hilos y lleva contadores de aciertos, fallos, expiraciones y desalojos.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._datos = OrderedDict()  # clave -> (valor, expira_en)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expiraciones = 0
+        self.desalojos = 0
+
+    def get(self, clave):
+        """
+        Retorna (encontrado, valor). Las entradas vencidas cuentan como fallo pero se conservan
+        (hasta que el LRU las desaloje) para poder servirlas con `get_stale` si el origen cae.
+        """
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                self.misses += 1
+                return False, None
+            valor, expira_en = entrada
+            if expira_en <= ahora:
+                self.expiraciones += 1
+                self.misses += 1
+                return False, None
+            self._datos.move_to_end(clave)
+            self.hits += 1
+            return True, valor
+
+    def get_stale(self, clave):
+        """Retorna (encontrado, valor) sin mirar la expiración. Solo para respaldo en modo degradado."""
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return False, None
+            return True, entrada[0]
+
+    def set(self, clave, valor, ttl=None):
+        expira_en = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._datos[clave] = (valor, expira_en)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.maxsize:
+                self._datos.popitem(last=False)
+                self.desalojos += 1
+
+    def invalidate(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def clear(self):
+        with self._lock:
+            self._datos.clear()
+
+    def __len__(self):
+        return len(self._datos)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entradas": len(self._datos),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "expiraciones": self.expiraciones,
+                "desalojos": self.desalojos,
+            }
+
+
+FRESCO = 'fresco'
+VENCIDO = 'vencido'
+
+
+class StaleWhileRevalidateCache:
+    """
+    Caché acotada (LRU) que distingue entradas frescas y vencidas.
+    Una entrada con edad menor a `fresh_ttl` es fresca; entre `fresh_ttl` y `max_age`
+    se sirve igual pero quien la lee debe refrescarla en segundo plano; pasado `max_age`
+    deja de servirse (queda solo como respaldo para `get_stale`).
+    `iniciar_refresco` garantiza un solo refresco en curso por clave.
+    """
+
+    def __init__(self, maxsize=512, fresh_ttl=120, max_age=1800):
+        self.maxsize = maxsize
+        self.fresh_ttl = fresh_ttl
+        self.max_age = max_age
+        self._datos = OrderedDict()  # clave -> (valor, guardado_en)
+        self._refrescando = set()
+        self._lock = threading.Lock()
+        self.hits_frescos = 0
+        self.hits_vencidos = 0
+        self.misses = 0
+        self.refrescos = 0
+        self.desalojos = 0
+
+    def get(self, clave):
+        """Retorna (estado, valor) con estado FRESCO, VENCIDO o None si no hay entrada utilizable."""
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                self.misses += 1
+                return None, None
+            valor, guardado_en = entrada
+            edad = ahora - guardado_en
+            if edad >= self.max_age:
+                self.misses += 1
+                return None, None
+            self._datos.move_to_end(clave)
+            if edad < self.fresh_ttl:
+                self.hits_frescos += 1
+                return FRESCO, valor
+            self.hits_vencidos += 1
+            return VENCIDO, valor
+
+    def get_stale(self, clave):
+        """Retorna (encontrado, valor) sin importar la edad. Solo para respaldo en modo degradado."""
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return False, None
+            return True, entrada[0]
+
+    def set(self, clave, valor):
+        with self._lock:
+            self._datos[clave] = (valor, time.monotonic())
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.maxsize:
+                self._datos.popitem(last=False)
+                self.desalojos += 1
+
+    def invalidate(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def iniciar_refresco(self, clave):
+        """True si el llamador debe refrescar `clave` (nadie más lo está haciendo)."""
+        with self._lock:
+            if clave in self._refrescando:
+                return False
+            self._refrescando.add(clave)
+            self.refrescos += 1
+            return True
+
+    def terminar_refresco(self, clave):
+        with self._lock:
+            self._refrescando.discard(clave)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits_frescos + self.hits_vencidos + self.misses
+            return {
+                "entradas": len(self._datos),
+                "maxsize": self.maxsize,
+                "hits_frescos": self.hits_frescos,
+                "hits_vencidos": self.hits_vencidos,
+                "misses": self.misses,
+                "hit_rate": round((self.hits_frescos + self.hits_vencidos) / total, 4) if total else 0.0,
+                "refrescos": self.refrescos,
+                "refrescos_en_curso": len(self._refrescando),
+                "desalojos": self.desalojos,
+            }
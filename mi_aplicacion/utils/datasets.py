@@ -0,0 +1,319 @@
+# mi_aplicacion/utils/datasets.py
+
+"""
+Conjuntos de datos de solo lectura mantenidos en memoria y refrescados en segundo plano.
+
+Algunas páginas (p. ej. la aprobación de cuchillas) leen una tabla completa desde un
+webhook de n8n en cada carga. Un dataset registrado aquí se descarga una vez, lo refresca
+un hilo cada `intervalo` segundos y las páginas leen la copia en memoria. Cuando la app
+misma modifica un registro (una aprobación) la copia se corrige en el acto con
+`actualizar_registro`, sin volver a descargar todo.
+
+Sincronización incremental (opcional, desactivada hoy: los webhooks de consulta de n8n no
+implementan el filtro, así que los datasets funcionan como caché con refresco completo): si el
+dataset tiene un campo de marca, el refresco pide solo los
+registros con la marca mayor o igual a la más alta que ya se tiene (parámetro `desde_<campo>`
+en la consulta) y los fusiona por id con la copia. La marca debe ser una fecha de modificación:
+con un id creciente solo llegan las filas nuevas y los cambios a filas existentes (p. ej. una
+aprobación hecha en otro worker) no se ven hasta la reconciliación. Cada
+DATASET_FULL_RECONCILE_INTERVAL segundos se descarga la tabla completa para recoger borrados.
+Si el webhook ignora el parámetro y responde la tabla completa, la fusión da el mismo
+resultado, solo que sin el ahorro. Sin campo de marca cada refresco descarga la tabla completa.
+
+Un dataset puede declarar índices secundarios (campo -> función que da el valor indexado de un
+registro). `consultar` filtra por igualdad sobre esos índices y pagina el resultado, así una
+página que muestra solo un proceso o una máquina no recorre ni envía la tabla entera.
+
+Los datos son por proceso: con varios workers, cada uno tiene su copia y ve los cambios
+hechos en otro worker en su siguiente refresco.
+"""
+
+import random
+import threading
+import time
+
+from flask import current_app
+
+_datasets = {}  # nombre -> DatasetEnMemoria
+_hilo_refresco = None
+
+
+class DatasetEnMemoria:
+    """
+    Copia en memoria de una lista de registros (diccionarios) identificados por `campo_id`.
+    `descargar(params=None)` retorna la lista de registros (con `params`, solo los que cumplen
+    el filtro de la marca) y lanza una excepción si no la pudo obtener. `clave_campo_marca` es
+    la clave de configuración con el campo de marca; vacío desactiva la sincronización incremental.
+    `indices` es un diccionario nombre -> función(registro) con los índices secundarios.
+    `clave_url` es la clave de configuración de la URL de origen: sin ella el dataset no se refresca.
+    """
+
+    def __init__(self, nombre, descargar, campo_id, clave_intervalo, intervalo_por_defecto=60,
+                 clave_campo_marca=None, campo_marca_por_defecto=None, indices=None, clave_url=None):
+        self.nombre = nombre
+        self.descargar = descargar
+        self.campo_id = campo_id
+        self.clave_intervalo = clave_intervalo
+        self.intervalo_por_defecto = intervalo_por_defecto
+        self.clave_campo_marca = clave_campo_marca
+        self.campo_marca_por_defecto = campo_marca_por_defecto
+        self.clave_url = clave_url
+        self.funciones_indice = dict(indices or {})
+        self._indices = {nombre_indice: {} for nombre_indice in self.funciones_indice}  # índice -> valor -> posiciones
+        self._lock = threading.Lock()
+        self._lock_refresco = threading.Lock()
+        self._registros = None
+        self._posiciones = {}
+        self._parches = {}  # id -> (instante, cambios) aplicados desde el último refresco
+        self.actualizado_en = None
+        self.marca = None
+        self.reconciliado_en = None
+        self.sincronizaciones_incrementales = 0
+        self.filas_ultimo_refresco = None
+        self.refrescos = 0
+        self.errores = 0
+        self.parches_aplicados = 0
+        self.ultimo_error = None
+
+    def intervalo(self):
+        return current_app.config.get(self.clave_intervalo, self.intervalo_por_defecto)
+
+    def configurado(self, config):
+        """False si falta la URL de origen en `config`."""
+        return not self.clave_url or bool(config.get(self.clave_url))
+
+    def campo_marca(self):
+        if not self.clave_campo_marca:
+            return self.campo_marca_por_defecto
+        return current_app.config.get(self.clave_campo_marca, self.campo_marca_por_defecto)
+
+    def _clave(self, valor):
+        return str(valor)
+
+    @staticmethod
+    def _valor_indice(valor):
+        """Los filtros llegan como texto desde la query string: los valores se indexan como texto."""
+        if valor is None or isinstance(valor, bool):
+            return valor
+        return str(valor).strip()
+
+    def _indexar(self, indices, posicion, registro, agregar=True):
+        for nombre_indice, funcion in self.funciones_indice.items():
+            valor = self._valor_indice(funcion(registro))
+            posiciones = indices[nombre_indice].setdefault(valor, set())
+            if agregar:
+                posiciones.add(posicion)
+            else:
+                posiciones.discard(posicion)
+                if not posiciones:
+                    del indices[nombre_indice][valor]
+
+    @staticmethod
+    def _orden_marca(valor):
+        """Ids numéricos (aunque lleguen como texto) se comparan como números; lo demás como texto."""
+        try:
+            return (0, float(valor))
+        except (TypeError, ValueError):
+            return (1, str(valor))
+
+    def _incremental(self):
+        if self._registros is None or self.marca is None or not self.campo_marca():
+            return False
+        reconciliar_cada = current_app.config.get('DATASET_FULL_RECONCILE_INTERVAL', 900)
+        return time.time() - self.reconciliado_en < reconciliar_cada
+
+    def refrescar(self):
+        """Descarga el dataset y reemplaza la copia en memoria. Propaga el error de la descarga."""
+        with self._lock_refresco:
+            return self._refrescar()
+
+    def _refrescar(self):
+        inicio = time.time()
+        incremental = self._incremental()
+        try:
+            if incremental:
+                filas = list(self.descargar({f"desde_{self.campo_marca()}": self.marca}))
+            else:
+                filas = list(self.descargar())
+        except Exception as e:
+            self.errores += 1
+            self.ultimo_error = str(e)
+            raise
+
+        if incremental:
+            registros = self._fusionar(filas)
+            self.sincronizaciones_incrementales += 1
+        else:
+            registros = filas
+            self.reconciliado_en = inicio
+        self._publicar(registros, inicio)
+        self.filas_ultimo_refresco = len(filas)
+        self.refrescos += 1
+        self.ultimo_error = None
+        return len(filas)
+
+    def _fusionar(self, filas):
+        """Copia actual con las `filas` nuevas agregadas al final y las ya conocidas reemplazadas."""
+        with self._lock:
+            registros = list(self._registros)
+            posiciones = dict(self._posiciones)
+        for fila in filas:
+            clave = self._clave(fila.get(self.campo_id))
+            if clave in posiciones:
+                registros[posiciones[clave]] = fila
+            else:
+                posiciones[clave] = len(registros)
+                registros.append(fila)
+        return registros
+
+    def _publicar(self, registros, inicio):
+        campo_marca = self.campo_marca()
+        marcas = [r.get(campo_marca) for r in registros if r.get(campo_marca) is not None] if campo_marca else []
+        with self._lock:
+            # Las correcciones hechas mientras se descargaba pueden no venir aún en la descarga.
+            self._parches = {clave: parche for clave, parche in self._parches.items() if parche[0] >= inicio}
+            posiciones = {}
+            indices = {nombre_indice: {} for nombre_indice in self.funciones_indice}
+            for posicion, registro in enumerate(registros):
+                clave = self._clave(registro.get(self.campo_id))
+                posiciones[clave] = posicion
+                if clave in self._parches:
+                    registros[posicion] = {**registro, **self._parches[clave][1]}
+                self._indexar(indices, posicion, registros[posicion])
+            self._registros = registros
+            self._posiciones = posiciones
+            self._indices = indices
+            self.marca = max(marcas, key=self._orden_marca) if marcas else None
+            self.actualizado_en = time.time()
+
+    def registros(self):
+        """
+        Lista actual de registros. La primera llamada descarga el dataset si el hilo aún no lo
+        hizo. La lista no se modifica después de publicada: tratarla como de solo lectura.
+        """
+        if self._registros is None:
+            with self._lock_refresco:
+                if self._registros is None:  # Otro hilo pudo descargarlo mientras se esperaba.
+                    self._refrescar()
+        return self._registros
+
+    def obtener_registro(self, id_registro):
+        """Registro con ese id en la copia en memoria, o None (si no está o aún no se descargó)."""
+        with self._lock:
+            posicion = self._posiciones.get(self._clave(id_registro))
+            return self._registros[posicion] if posicion is not None else None
+
+    def actualizar_registro(self, id_registro, cambios):
+        """Aplica `cambios` al registro `id_registro` de la copia en memoria. Retorna False si no está."""
+        clave = self._clave(id_registro)
+        with self._lock:
+            self._parches[clave] = (time.time(), dict(cambios))
+            posicion = self._posiciones.get(clave)
+            if self._registros is None or posicion is None:
+                return False
+            registros = list(self._registros)
+            self._indexar(self._indices, posicion, registros[posicion], agregar=False)
+            registros[posicion] = {**registros[posicion], **cambios}
+            self._indexar(self._indices, posicion, registros[posicion])
+            self._registros = registros
+            self.parches_aplicados += 1
+            return True
+
+    def _seleccionar(self, filtros):
+        """Posiciones (ordenadas) de los registros que cumplen los filtros. Llamar con el lock tomado."""
+        conjuntos = []
+        for nombre_indice, valor in filtros.items():
+            if valor is None or valor == '':
+                continue
+            if nombre_indice not in self._indices:
+                raise ValueError(f"El dataset '{self.nombre}' no tiene índice '{nombre_indice}'.")
+            conjuntos.append(self._indices[nombre_indice].get(self._valor_indice(valor), set()))
+        if not conjuntos:
+            return range(len(self._registros))
+        conjuntos.sort(key=len)
+        return sorted(conjuntos[0].intersection(*conjuntos[1:]))
+
+    def consultar(self, pagina=1, por_pagina=50, **filtros):
+        """
+        Registros que cumplen los filtros de igualdad (índice=valor; vacío o None no filtra), en el
+        orden del dataset y paginados. Retorna {"registros", "total", "pagina", "por_pagina", "paginas"}.
+        """
+        self.registros()
+        por_pagina = max(1, por_pagina)
+        with self._lock:
+            posiciones = self._seleccionar(filtros)
+            total = len(posiciones)
+            paginas = max(1, -(-total // por_pagina))
+            pagina = min(max(1, pagina), paginas)
+            inicio = (pagina - 1) * por_pagina
+            registros = [self._registros[p] for p in posiciones[inicio:inicio + por_pagina]]
+        return {"registros": registros, "total": total, "pagina": pagina, "por_pagina": por_pagina, "paginas": paginas}
+
+    def valores(self, nombre_indice, **filtros):
+        """Valores del índice `nombre_indice` presentes entre los registros que cumplen los filtros, ordenados."""
+        self.registros()
+        with self._lock:
+            seleccion = set(self._seleccionar(filtros))
+            return sorted(
+                valor for valor, posiciones in self._indices[nombre_indice].items()
+                if valor not in (None, '') and not seleccion.isdisjoint(posiciones)
+            )
+
+    def vencido(self):
+        return self.actualizado_en is None or time.time() - self.actualizado_en >= self.intervalo()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "registros": len(self._registros) if self._registros is not None else None,
+                "edad_s": round(time.time() - self.actualizado_en, 1) if self.actualizado_en else None,
+                "marca": self.marca,
+                "filas_ultimo_refresco": self.filas_ultimo_refresco,
+                "reconciliado_hace_s": round(time.time() - self.reconciliado_en, 1) if self.reconciliado_en else None,
+                "sincronizaciones_incrementales": self.sincronizaciones_incrementales,
+                "refrescos": self.refrescos,
+                "errores": self.errores,
+                "parches_aplicados": self.parches_aplicados,
+                "ultimo_error": self.ultimo_error,
+            }
+
+
+def registrar_dataset(nombre, descargar, campo_id, clave_intervalo, intervalo_por_defecto=60,
+                      clave_campo_marca=None, campo_marca_por_defecto=None, indices=None, clave_url=None):
+    """Registra un dataset (se llama al importar el módulo que lo usa) y lo retorna."""
+    dataset = DatasetEnMemoria(nombre, descargar, campo_id, clave_intervalo, intervalo_por_defecto,
+                               clave_campo_marca, campo_marca_por_defecto, indices, clave_url)
+    _datasets[nombre] = dataset
+    return dataset
+
+
+def _bucle_refresco(app):
+    with app.app_context():
+        while True:
+            espera = 60
+            for dataset in list(_datasets.values()):
+                if not dataset.configurado(app.config):
+                    continue
+                if dataset.vencido():
+                    try:
+                        cantidad = dataset.refrescar()
+                        app.logger.info(f"Dataset '{dataset.nombre}' refrescado: {cantidad} registros.")
+                    except Exception as e:
+                        app.logger.error(f"Error refrescando el dataset '{dataset.nombre}': {e}", exc_info=True)
+                        espera = min(espera, 15)
+                        continue
+                espera = min(espera, max(1, dataset.intervalo() - (time.time() - dataset.actualizado_en)))
+            time.sleep(espera * random.uniform(1.0, 1.1))
+
+
+def iniciar_refresco_en_segundo_plano(app):
+    """Arranca (una vez por proceso) el hilo que refresca los datasets registrados con URL configurada."""
+    global _hilo_refresco
+    if _hilo_refresco is not None or not any(d.configurado(app.config) for d in _datasets.values()):
+        return
+    _hilo_refresco = threading.Thread(target=_bucle_refresco, args=(app,), name='datasets-refresco', daemon=True)
+    _hilo_refresco.start()
+
+
+def get_datasets_stats():
+    return {nombre: dataset.stats() for nombre, dataset in list(_datasets.items())}
@@ -0,0 +1,92 @@
+# mi_aplicacion/utils/deadline.py
+
+"""
+Presupuesto de tiempo (deadline) por petición.
+
+Una ruta decorada con `con_deadline` fija en `g` el instante límite de la petición. Cada
+llamada a Epicor o a un webhook recorta su timeout al tiempo que queda, en lugar de usar su
+propio timeout fijo, así que las esperas de una cadena de llamadas ya no se suman. Si el
+presupuesto se agota antes de una llamada se lanza `DeadlineExcedido` y la ruta responde
+504 con un JSON estructurado.
+"""
+
+import time
+from functools import wraps
+
+import requests
+from flask import current_app, flash, g, has_app_context, jsonify, redirect, request
+
+# Por debajo de esto no vale la pena abrir una conexión.
+_MINIMO_SEGUNDOS = 0.05
+
+
+class DeadlineExcedido(requests.exceptions.Timeout):
+    """
+    Se agotó el presupuesto de tiempo de la petición. Hereda de Timeout para que los
+    llamadores que ya manejan timeouts de `requests` no se rompan.
+    """
+
+
+def fijar_deadline(segundos):
+    g.deadline = time.monotonic() + segundos
+
+
+def deadline_actual():
+    """Instante límite (time.monotonic) de la petición en curso, o None."""
+    return g.get('deadline') if has_app_context() else None
+
+
+def tiempo_restante():
+    """Segundos que le quedan a la petición en curso, o None si no tiene deadline."""
+    deadline = deadline_actual()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def limitar_timeout(timeout):
+    """
+    Recorta `timeout` (número o tupla (conexión, lectura) de requests) al tiempo restante.
+    Lanza DeadlineExcedido si ya no queda presupuesto.
+    """
+    restante = tiempo_restante()
+    if restante is None:
+        return timeout
+    if restante <= _MINIMO_SEGUNDOS:
+        raise DeadlineExcedido("Se agotó el tiempo disponible para la solicitud.")
+    if isinstance(timeout, tuple):
+        return tuple(min(t, restante) for t in timeout)
+    return min(timeout, restante) if timeout is not None else restante
+
+
+def respuesta_deadline_excedido():
+    """Resultado estructurado para las funciones que retornan {"success": ..., "message": ...}."""
+    return {
+        "success": False,
+        "degradado": True,
+        "deadline_excedido": True,
+        "message": "La consulta tardó demasiado y se canceló. Intenta de nuevo.",
+    }
+
+
+def exigir_a_tiempo(*resultados):
+    """Lanza DeadlineExcedido si alguno de los resultados se canceló por el deadline."""
+    if any(r.get("deadline_excedido") for r in resultados if r):
+        raise DeadlineExcedido("Se agotó el tiempo disponible para la solicitud.")
+
+
+def con_deadline(clave_config, segundos_por_defecto=10):
+    """Decorador de rutas: fija el deadline leído de `clave_config` y traduce DeadlineExcedido a 504."""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            fijar_deadline(current_app.config.get(clave_config, segundos_por_defecto))
+            try:
+                return f(*args, **kwargs)
+            except DeadlineExcedido as e:
+                current_app.logger.warning(f"Deadline excedido en {request.endpoint}: {e}")
+                mensaje = "La operación tardó demasiado porque un sistema externo no respondió a tiempo. Intenta de nuevo."
+                if request.method == 'POST' and not request.is_json:
+                    flash(mensaje, 'danger')
+                    return redirect(request.url)
+                return jsonify(success=False, deadline_excedido=True, message=mensaje, category="danger"), 504
+        return decorated_function
+    return decorator
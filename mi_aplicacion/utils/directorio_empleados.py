@@ -0,0 +1,219 @@
+# mi_aplicacion/utils/directorio_empleados.py
+
+"""
+Directorio local de empleados activos.
+
+Un hilo en segundo plano descarga periódicamente el conjunto de empleados activos desde
+Epicor (BAQ paginada con $top/$skip) y lo escribe en un archivo SQLite compacto. Todos los
+workers abren ese archivo en modo solo lectura con memory-mapping, de modo que las
+validaciones de ID y carnet se resuelven localmente y solo se consulta Epicor en un fallo.
+"""
+
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from flask import current_app
+
+_lector = threading.local()
+_lock_stats = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "sincronizaciones": 0, "errores_sincronizacion": 0}
+_hilo_sincronizacion = None
+
+
+def _ruta_directorio():
+    ruta = current_app.config.get('EMPLOYEE_DIRECTORY_PATH')
+    return ruta or os.path.join(current_app.instance_path, 'directorio_empleados.sqlite3')
+
+
+def _contar(campo):
+    with _lock_stats:
+        _stats[campo] += 1
+
+
+# --- Lectura ---
+def _conexion_lectura():
+    """
+    Devuelve una conexión de solo lectura (una por hilo) al snapshot vigente.
+    Si el archivo fue reemplazado por una nueva sincronización, se reabre.
+    """
+    ruta = _ruta_directorio()
+    try:
+        st = os.stat(ruta)
+    except FileNotFoundError:
+        return None
+
+    firma = (st.st_ino, st.st_mtime_ns)
+    conexion = getattr(_lector, 'conexion', None)
+    if conexion is not None and getattr(_lector, 'firma', None) == firma:
+        return conexion
+    if conexion is not None:
+        conexion.close()
+
+    conexion = sqlite3.connect(f"file:{ruta}?mode=ro", uri=True, check_same_thread=False)
+    conexion.row_factory = sqlite3.Row
+    conexion.execute(f"PRAGMA mmap_size={int(current_app.config.get('EMPLOYEE_DIRECTORY_MMAP_SIZE', 64 * 1024 * 1024))}")
+    _lector.conexion = conexion
+    _lector.firma = firma
+    _lector.generado_en = float(conexion.execute("SELECT valor FROM meta WHERE clave = 'generado_en'").fetchone()[0])
+    return conexion
+
+
+def _buscar(columna, valor):
+    if not current_app.config.get('EMPLOYEE_DIRECTORY_ENABLED', False) or not valor:
+        return None
+    try:
+        conexion = _conexion_lectura()
+        if conexion is None:
+            return None
+        if time.time() - _lector.generado_en > current_app.config.get('EMPLOYEE_DIRECTORY_MAX_AGE', 86400):
+            return None  # Snapshot demasiado viejo: mejor consultar Epicor.
+        fila = conexion.execute(
+            f"SELECT emp_id, nombre, area, carnet FROM empleados WHERE {columna} = ?", (str(valor).strip(),)
+        ).fetchone()
+    except sqlite3.Error as e:
+        current_app.logger.warning(f"Error leyendo el directorio local de empleados: {e}")
+        return None
+
+    _contar('hits' if fila else 'misses')
+    return dict(fila) if fila else None
+
+
+def buscar_por_id(employee_id):
+    """Empleado activo con ese ID según el último snapshot, o None."""
+    return _buscar('emp_id', employee_id)
+
+
+def buscar_por_carnet(carnet_id):
+    """Empleado activo con ese carnet según el último snapshot, o None."""
+    return _buscar('carnet', carnet_id)
+
+
+# --- Sincronización ---
+def _descargar_empleados_activos():
+    """
+    Recorre la BAQ de empleados página por página y retorna una lista de tuplas.
+    Debe ser una BAQ de directorio (todos los empleados con su estado), no la de consulta por carnet.
+    """
+    from .epicor_api import get_epicor_client, get_epicor_headers
+
+    url = current_app.config.get('EPICOR_API_DIRECTORIO_EMPLEADOS')
+    headers = get_epicor_headers()
+    if not url or not headers:
+        raise RuntimeError("EPICOR_API_DIRECTORIO_EMPLEADOS o headers no configurados para el directorio de empleados.")
+
+    tam_pagina = current_app.config.get('EMPLOYEE_DIRECTORY_PAGE_SIZE', 500)
+    campo_carnet = current_app.config.get('EMPLOYEE_DIRECTORY_CARNET_FIELD', 'EmpBasic_Carnet_c')
+    empleados = []
+    skip = 0
+    while True:
+        # Sin un orden fijo las páginas de $top/$skip pueden saltarse o repetir filas.
+        response = get_epicor_client().get(
+            f"{url}?$orderby=EmpBasic_EmpID&$top={tam_pagina}&$skip={skip}", headers=headers, timeout=30
+        )
+        response.raise_for_status()
+        pagina = response.json().get('value', [])
+        for fila in pagina:
+            # Solo entran los marcados como activos: una fila sin estado no prueba que el empleado lo esté.
+            if fila.get('EmpBasic_EmpStatus') != 'A':
+                continue
+            emp_id = fila.get('EmpBasic_EmpID')
+            if not emp_id:
+                continue
+            carnet = fila.get(campo_carnet)
+            empleados.append((
+                str(emp_id).strip(),
+                fila.get('EmpBasic_Name') or '',
+                fila.get('EmpBasic_JCDept') or '',
+                str(carnet).strip() if carnet not in (None, '') else None,
+            ))
+        if len(pagina) < tam_pagina:
+            return empleados
+        skip += tam_pagina
+
+
+def sincronizar_directorio():
+    """
+    Descarga los empleados activos y reemplaza el snapshot de forma atómica.
+    Retorna la cantidad de empleados escritos.
+    """
+    empleados = _descargar_empleados_activos()
+    if not empleados:
+        # Una respuesta vacía casi siempre es un error de la BAQ; se conserva el snapshot anterior.
+        raise RuntimeError("La BAQ del directorio de empleados no devolvió empleados activos.")
+
+    ruta = _ruta_directorio()
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    ruta_tmp = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+    conexion = sqlite3.connect(ruta_tmp)
+    try:
+        conexion.executescript("""
+            PRAGMA journal_mode = OFF;
+            CREATE TABLE empleados (emp_id TEXT PRIMARY KEY, nombre TEXT, area TEXT, carnet TEXT) WITHOUT ROWID;
+            CREATE TABLE meta (clave TEXT PRIMARY KEY, valor TEXT);
+        """)
+        conexion.executemany("INSERT OR REPLACE INTO empleados VALUES (?, ?, ?, ?)", empleados)
+        conexion.execute("CREATE INDEX idx_empleados_carnet ON empleados (carnet)")
+        conexion.execute("INSERT INTO meta VALUES ('generado_en', ?)", (str(time.time()),))
+        conexion.commit()
+    except Exception:
+        conexion.close()
+        os.remove(ruta_tmp)
+        raise
+    conexion.close()
+
+    os.replace(ruta_tmp, ruta)  # Los lectores detectan el archivo nuevo en su siguiente consulta.
+    _contar('sincronizaciones')
+    current_app.logger.info(f"Directorio local de empleados sincronizado: {len(empleados)} empleados activos.")
+    return len(empleados)
+
+
+def _edad_snapshot():
+    try:
+        return time.time() - os.stat(_ruta_directorio()).st_mtime
+    except FileNotFoundError:
+        return None
+
+
+def _bucle_sincronizacion(app):
+    with app.app_context():
+        intervalo = app.config.get('EMPLOYEE_DIRECTORY_REFRESH_INTERVAL', 3600)
+        while True:
+            espera = intervalo
+            edad = _edad_snapshot()
+            # Con varios workers, el primero que encuentra el snapshot vencido lo renueva.
+            if edad is None or edad >= intervalo:
+                try:
+                    sincronizar_directorio()
+                except Exception as e:
+                    _contar('errores_sincronizacion')
+                    app.logger.error(f"Error sincronizando el directorio local de empleados: {e}", exc_info=True)
+                    espera = min(intervalo, 300)
+            else:
+                espera = intervalo - edad
+            time.sleep(espera * random.uniform(1.0, 1.1))
+
+
+def iniciar_sincronizacion_periodica(app):
+    """Arranca (una vez por proceso) el hilo que mantiene el snapshot al día."""
+    global _hilo_sincronizacion
+    if not app.config.get('EMPLOYEE_DIRECTORY_ENABLED', False) or _hilo_sincronizacion is not None:
+        return
+    if not app.config.get('EPICOR_API_DIRECTORIO_EMPLEADOS'):
+        app.logger.warning("EMPLOYEE_DIRECTORY_ENABLED activo sin EPICOR_API_DIRECTORIO_EMPLEADOS: no se sincroniza el directorio local.")
+        return
+    _hilo_sincronizacion = threading.Thread(
+        target=_bucle_sincronizacion, args=(app,), name='directorio-empleados', daemon=True
+    )
+    _hilo_sincronizacion.start()
+
+
+def get_directorio_stats():
+    with _lock_stats:
+        datos = dict(_stats)
+    edad = _edad_snapshot()
+    datos["edad_snapshot_s"] = round(edad, 1) if edad is not None else None
+    return datos
@@ -1,12 +1,400 @@
 # d:\DocumentacionEmpaques\mi_aplicacion\utils\epicor_api.py
 
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
-from flask import current_app
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from flask import current_app, g
+
+from .cache import TTLCache, StaleWhileRevalidateCache, VENCIDO
+from .bulkheads import BulkheadSaturado, bulkhead
+from .deadline import DeadlineExcedido, deadline_actual, limitar_timeout, respuesta_deadline_excedido
+from . import directorio_empleados
 
 # Desactivar advertencias de SSL inseguro (solo para desarrollo)
 import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+
+# --- Cliente HTTP compartido para Epicor (pool de conexiones keep-alive) ---
+class _ContadoresPool:
+    """Cuenta cuántas peticiones reutilizaron una conexión del pool y cuántas abrieron una nueva."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.conexiones_nuevas = 0
+
+    def registrar_checkout(self):
+        with self._lock:
+            self.checkouts += 1
+
+    def registrar_conexion_nueva(self):
+        with self._lock:
+            self.conexiones_nuevas += 1
+
+    def snapshot(self):
+        with self._lock:
+            hits = max(self.checkouts - self.conexiones_nuevas, 0)
+            return {
+                "pool_hits": hits,
+                "pool_misses": self.conexiones_nuevas,
+                "peticiones": self.checkouts,
+                "hit_rate": round(hits / self.checkouts, 4) if self.checkouts else 0.0,
+            }
+
+
+def _pool_con_contadores(base, contadores):
+    """Crea una subclase del pool de urllib3 que reporta checkouts y conexiones nuevas."""
+
+    class _PoolConContadores(base):
+        def _get_conn(self, timeout=None):
+            contadores.registrar_checkout()
+            return super()._get_conn(timeout=timeout)
+
+        def _new_conn(self):
+            contadores.registrar_conexion_nueva()
+            return super()._new_conn()
+
+    return _PoolConContadores
+
+
+class _EpicorHTTPAdapter(HTTPAdapter):
+    def __init__(self, contadores, **kwargs):
+        # Debe existir antes de super().__init__, que ya llama a init_poolmanager.
+        self._contadores = contadores
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _pool_con_contadores(HTTPConnectionPool, self._contadores),
+            "https": _pool_con_contadores(HTTPSConnectionPool, self._contadores),
+        }
+
+
+# --- Circuit breaker por endpoint de Epicor ---
+class EpicorNoDisponible(requests.exceptions.ConnectionError):
+    """El circuito del endpoint está abierto: se falla rápido sin llamar a Epicor."""
+
+
+class CircuitBreaker:
+    """
+    Se abre tras `umbral_fallos` fallos seguidos (timeouts, errores de conexión o 5xx).
+    Mientras está abierto las llamadas fallan de inmediato. Pasado `tiempo_apertura`
+    pasa a semiabierto y una sola sonda en segundo plano decide si vuelve a cerrarse. Si la
+    sonda no registra resultado en otros `tiempo_apertura` segundos se lanza otra.
+    """
+    CERRADO = 'cerrado'
+    ABIERTO = 'abierto'
+    SEMIABIERTO = 'semiabierto'
+
+    def __init__(self, nombre, umbral_fallos=5, tiempo_apertura=30):
+        self.nombre = nombre
+        self.umbral_fallos = umbral_fallos
+        self.tiempo_apertura = tiempo_apertura
+        self.estado = self.CERRADO
+        self.fallos_consecutivos = 0
+        self.abierto_desde = None
+        self.semiabierto_desde = None
+        self.rechazadas = 0
+        self.aperturas = 0
+        self._lock = threading.Lock()
+
+    def permitir(self):
+        """Retorna (permitida, lanzar_sonda)."""
+        with self._lock:
+            if self.estado == self.CERRADO:
+                return True, False
+            self.rechazadas += 1
+            ahora = time.monotonic()
+            if self.estado == self.ABIERTO and ahora - self.abierto_desde >= self.tiempo_apertura:
+                self.estado = self.SEMIABIERTO
+                self.semiabierto_desde = ahora
+                return False, True
+            if self.estado == self.SEMIABIERTO and ahora - self.semiabierto_desde >= self.tiempo_apertura:
+                # La sonda anterior no terminó (o se perdió): se lanza otra.
+                self.semiabierto_desde = ahora
+                return False, True
+            return False, False
+
+    def registrar_exito(self):
+        with self._lock:
+            self.estado = self.CERRADO
+            self.fallos_consecutivos = 0
+            self.abierto_desde = None
+
+    def registrar_fallo(self):
+        with self._lock:
+            self.fallos_consecutivos += 1
+            if self.estado == self.SEMIABIERTO or self.fallos_consecutivos >= self.umbral_fallos:
+                if self.estado != self.ABIERTO:
+                    self.aperturas += 1
+                self.estado = self.ABIERTO
+                self.abierto_desde = time.monotonic()
+
+    def registrar_fallo_sonda(self):
+        """La sonda terminó con un error que no dejó resultado registrado: el circuito se vuelve a abrir."""
+        with self._lock:
+            if self.estado == self.SEMIABIERTO:
+                self.aperturas += 1
+                self.estado = self.ABIERTO
+                self.abierto_desde = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "estado": self.estado,
+                "fallos_consecutivos": self.fallos_consecutivos,
+                "rechazadas": self.rechazadas,
+                "aperturas": self.aperturas,
+            }
+
+
+def _es_falla_upstream(error):
+    """Timeouts, errores de conexión y 5xx cuentan como falla de Epicor (no los 4xx)."""
+    if isinstance(error, (requests.exceptions.Timeout, requests.exceptions.ConnectionError)):
+        return True
+    respuesta = getattr(error, 'response', None)
+    return respuesta is not None and respuesta.status_code >= 500
+
+
+class EpicorClient:
+    """
+    Cliente único por proceso para las BAQ de Epicor.
+    Mantiene una requests.Session con pool de conexiones keep-alive para no pagar
+    un handshake TCP+TLS nuevo en cada consulta.
+    """
+
+    def __init__(self, pool_connections=4, pool_maxsize=16, umbral_fallos=5, tiempo_apertura=30):
+        self.umbral_fallos = umbral_fallos
+        self.tiempo_apertura = tiempo_apertura
+        self.circuitos = {}
+        self._circuitos_lock = threading.Lock()
+        self.contadores = _ContadoresPool()
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.session = requests.Session()
+        self.session.headers.update({"Connection": "keep-alive"})
+        adapter = _EpicorHTTPAdapter(
+            self.contadores,
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=False,
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def circuito(self, endpoint):
+        with self._circuitos_lock:
+            if endpoint not in self.circuitos:
+                self.circuitos[endpoint] = CircuitBreaker(endpoint, self.umbral_fallos, self.tiempo_apertura)
+            return self.circuitos[endpoint]
+
+    def get(self, url, headers=None, timeout=5, endpoint=None):
+        """
+        GET a Epicor. Con `endpoint` la llamada pasa por el circuit breaker de ese endpoint
+        y lanza EpicorNoDisponible si el circuito está abierto. El timeout se recorta al
+        deadline de la petición en curso (DeadlineExcedido si ya no queda tiempo).
+        """
+        timeout_efectivo = limitar_timeout(timeout)
+        if endpoint is None:
+            with bulkhead('epicor').ocupar():
+                return self.session.get(url, headers=headers, timeout=timeout_efectivo, verify=False)
+
+        circuito = self.circuito(endpoint)
+        permitida, lanzar_sonda = circuito.permitir()
+        if not permitida:
+            if lanzar_sonda:
+                _refresh_executor.submit(self._sondear, circuito, url, headers, timeout)
+            raise EpicorNoDisponible(f"Circuito de Epicor '{endpoint}' abierto.")
+        return self._get_registrando(circuito, url, headers, timeout_efectivo, recortado=timeout_efectivo != timeout)
+
+    def _get_registrando(self, circuito, url, headers, timeout, recortado=False):
+        # Un rechazo del bulkhead sale antes del try: no es una falla de Epicor para el circuito.
+        with bulkhead('epicor').ocupar():
+            return self._get_con_circuito(circuito, url, headers, timeout, recortado)
+
+    def _get_con_circuito(self, circuito, url, headers, timeout, recortado):
+        try:
+            response = self.session.get(url, headers=headers, timeout=timeout, verify=False)
+        except requests.exceptions.Timeout as e:
+            if recortado:
+                # Se agotó el presupuesto de la petición, no el de Epicor: no cuenta para el circuito.
+                raise DeadlineExcedido(f"Se agotó el tiempo disponible para la solicitud: {e}") from e
+            circuito.registrar_fallo()
+            raise
+        except requests.exceptions.RequestException as e:
+            if _es_falla_upstream(e):
+                circuito.registrar_fallo()
+            raise
+        if response.status_code >= 500:
+            circuito.registrar_fallo()
+        else:
+            circuito.registrar_exito()
+        return response
+
+    def _sondear(self, circuito, url, headers, timeout):
+        try:
+            # La sonda no pasa por el bulkhead: un rechazo por cupos no dice nada de Epicor y
+            # dejaría el circuito semiabierto sin resultado.
+            self._get_con_circuito(circuito, url, headers, timeout, recortado=False)
+        except Exception:
+            # Un error que no cuenta como falla de Epicor (p. ej. una URL inválida) no registra nada:
+            # sin esto el circuito quedaría semiabierto para siempre.
+            circuito.registrar_fallo_sonda()
+
+    def degradado(self):
+        with self._circuitos_lock:
+            circuitos = list(self.circuitos.values())
+        return any(c.estado != CircuitBreaker.CERRADO for c in circuitos)
+
+    def stats(self):
+        datos = self.contadores.snapshot()
+        datos.update({"pool_connections": self.pool_connections, "pool_maxsize": self.pool_maxsize})
+        return datos
+
+    def stats_circuitos(self):
+        with self._circuitos_lock:
+            circuitos = list(self.circuitos.values())
+        return {c.nombre: c.stats() for c in circuitos}
+
+
+_epicor_client = None
+_epicor_client_lock = threading.Lock()
+
+
+def get_epicor_client():
+    """Devuelve el cliente Epicor del proceso, creándolo la primera vez con la configuración de la app."""
+    global _epicor_client
+    if _epicor_client is None:
+        with _epicor_client_lock:
+            if _epicor_client is None:
+                _epicor_client = EpicorClient(
+                    pool_connections=current_app.config.get('EPICOR_POOL_CONNECTIONS', 4),
+                    pool_maxsize=current_app.config.get('EPICOR_POOL_MAXSIZE', 16),
+                    umbral_fallos=current_app.config.get('EPICOR_CIRCUIT_FAILURE_THRESHOLD', 5),
+                    tiempo_apertura=current_app.config.get('EPICOR_CIRCUIT_RESET_TIMEOUT', 30),
+                )
+    return _epicor_client
+
+
+def epicor_degradado():
+    """True si algún endpoint de Epicor tiene el circuito abierto (modo degradado)."""
+    return get_epicor_client().degradado()
+
+
+def get_epicor_stats():
+    """Métricas del cliente Epicor para diagnóstico (pool y cachés)."""
+    return {
+        "pool": get_epicor_client().stats(),
+        "cache_empleados": get_employee_cache().stats(),
+        "cache_trabajos": get_job_cache().stats(),
+        "directorio": directorio_empleados.get_directorio_stats(),
+        "singleflight": _singleflight.stats(),
+        "circuitos": get_epicor_client().stats_circuitos(),
+    }
+
+# --- Single-flight: una sola petición upstream por clave en curso ---
+class _LlamadaEnCurso:
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesce llamadas concurrentes con la misma clave: el primer llamador ejecuta la
+    consulta y los demás esperan y reciben el mismo resultado.
+    Usa primitivas de `threading`, por lo que con gevent (monkey.patch_all) también
+    coordina greenlets.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._en_curso = {}
+        self.ejecutadas = 0
+        self.coalescidas = 0
+
+    def do(self, clave, funcion):
+        with self._lock:
+            llamada = self._en_curso.get(clave)
+            es_lider = llamada is None
+            if es_lider:
+                llamada = _LlamadaEnCurso()
+                self._en_curso[clave] = llamada
+                self.ejecutadas += 1
+            else:
+                self.coalescidas += 1
+
+        if not es_lider:
+            llamada.evento.wait()
+            if llamada.error is not None:
+                raise llamada.error
+            return llamada.resultado
+
+        try:
+            llamada.resultado = funcion()
+            return llamada.resultado
+        except BaseException as e:
+            llamada.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._en_curso[clave]
+            llamada.evento.set()
+
+    def stats(self):
+        with self._lock:
+            return {"ejecutadas": self.ejecutadas, "coalescidas": self.coalescidas, "en_curso": len(self._en_curso)}
+
+
+_singleflight = SingleFlight()
+
+
+# --- Consultas concurrentes (validaciones independientes dentro de un mismo POST) ---
+_lookup_executor = None
+_lookup_executor_lock = threading.Lock()
+
+
+def _get_lookup_executor():
+    global _lookup_executor
+    if _lookup_executor is None:
+        with _lookup_executor_lock:
+            if _lookup_executor is None:
+                _lookup_executor = ThreadPoolExecutor(
+                    max_workers=current_app.config.get('EPICOR_LOOKUP_WORKERS', 8),
+                    thread_name_prefix='epicor-lookup',
+                )
+    return _lookup_executor
+
+
+def consultar_en_paralelo(consultas):
+    """
+    Ejecuta varias consultas independientes a la vez en un pool de hilos acotado.
+    `consultas` es un dict nombre -> (funcion, *args); retorna un dict nombre -> resultado.
+    La latencia total es la de la consulta más lenta en lugar de la suma de todas.
+    """
+    if len(consultas) <= 1:
+        return {nombre: funcion(*args) for nombre, (funcion, *args) in consultas.items()}
+
+    app = current_app._get_current_object()
+    deadline = deadline_actual()
+
+    def ejecutar(funcion, args):
+        with app.app_context():
+            g.deadline = deadline  # Las consultas en paralelo comparten el deadline de la petición.
+            return funcion(*args)
+
+    executor = _get_lookup_executor()
+    futuros = {nombre: executor.submit(ejecutar, funcion, args) for nombre, (funcion, *args) in consultas.items()}
+    return {nombre: futuro.result() for nombre, futuro in futuros.items()}
+
+
 # --- Función para obtener headers de autorización ---
 def get_epicor_headers():
     api_token = current_app.config.get('EPICOR_API_TOKEN')
@@ -18,23 +406,94 @@ def get_epicor_headers():
         "Content-Type": "application/json"
     }
 
+# --- Caché de empleados (TTL + LRU con caché negativa) ---
+# Los resultados "no encontrado / inactivo" se guardan por menos tiempo que los válidos.
+# Los errores de conexión o configuración nunca se guardan.
+RESULTADO_POSITIVO = 'positivo'
+RESULTADO_NEGATIVO = 'negativo'
+
+_employee_cache = None
+_employee_cache_lock = threading.Lock()
+
+
+def get_employee_cache():
+    global _employee_cache
+    if _employee_cache is None:
+        with _employee_cache_lock:
+            if _employee_cache is None:
+                _employee_cache = TTLCache(
+                    maxsize=current_app.config.get('EMPLOYEE_CACHE_MAXSIZE', 2048),
+                    ttl=current_app.config.get('EMPLOYEE_CACHE_TTL', 600),
+                )
+    return _employee_cache
+
+
+def _consultar_con_cache(cache, clave, consulta, ttl_negativo):
+    """
+    Resuelve `clave` desde la caché o ejecuta `consulta`, que debe retornar
+    (resultado, tipo) con tipo RESULTADO_POSITIVO, RESULTADO_NEGATIVO o None (no cachear).
+    """
+    encontrado, resultado = cache.get(clave)
+    if encontrado:
+        return dict(resultado)
+
+    resultado, tipo = _singleflight.do(clave, consulta)
+    if tipo == RESULTADO_POSITIVO:
+        cache.set(clave, dict(resultado))
+    elif tipo == RESULTADO_NEGATIVO:
+        cache.set(clave, dict(resultado), ttl=ttl_negativo)
+    elif resultado.get("degradado"):
+        return _respaldo_vencido(cache.get_stale(clave), resultado)
+    return dict(resultado)
+
+
+def _respaldo_vencido(entrada_cache, resultado_degradado):
+    """Si Epicor no responde, sirve la última respuesta válida conocida marcada como 'stale'."""
+    encontrado, anterior = entrada_cache
+    if encontrado and anterior.get("success"):
+        return {**anterior, "stale": True}
+    return dict(resultado_degradado)
+
+
+def _respuesta_degradada():
+    return {
+        "success": False,
+        "degradado": True,
+        "message": "El servicio Epicor no está disponible en este momento. Intenta de nuevo en unos minutos.",
+    }
+
+
 # --- 1. Función de validación de ID de empleado (existente) ---
 # Esta función usa EPICOR_API_BASE_URL (que debe ser para HMP_ValidadorID)
 def validate_employee_id(employee_id):
     """
     Valida un ID de empleado contra la API de Epicor (HMP_ValidadorID) y devuelve su estado y nombre.
     Retorna un diccionario con 'success', 'message', 'user_id', 'user_name'.
+    Primero se busca en el directorio local de empleados activos; en un fallo se usa
+    la caché de empleados y, si tampoco está, Epicor.
     """
+    empleado = directorio_empleados.buscar_por_id(employee_id)
+    if empleado:
+        return {"success": True, "user_id": empleado["emp_id"], "user_name": empleado["nombre"], "message": "ID válido."}
+
+    return _consultar_con_cache(
+        get_employee_cache(), ('validador', str(employee_id).strip()),
+        lambda: _validate_employee_id_epicor(employee_id),
+        current_app.config.get('EMPLOYEE_CACHE_NEGATIVE_TTL', 60),
+    )
+
+
+def _validate_employee_id_epicor(employee_id):
     base_url = current_app.config.get('EPICOR_API_BASE_URL') # URL para HMP_ValidadorID
     headers = get_epicor_headers()
 
     if not base_url or not headers:
-        return {"success": False, "message": "Error de configuración de la API interna. Contacta a soporte."}
+        return {"success": False, "message": "Error de configuración de la API interna. Contacta a soporte."}, None
 
     api_url = f"{base_url}?ID={employee_id}"
 
     try:
-        response = requests.get(api_url, headers=headers, timeout=5, verify=False) 
+        response = get_epicor_client().get(api_url, headers=headers, timeout=5, endpoint='validador')
 
         if response.status_code == 200:
             data = response.json()
@@ -46,70 +505,145 @@ def validate_employee_id(employee_id):
                 emp_id = user_data.get('EmpBasic_EmpID', employee_id)
 
                 if emp_status == 'A':
-                    return {"success": True, "user_id": emp_id, "user_name": emp_name, "message": "ID válido."}
+                    return {"success": True, "user_id": emp_id, "user_name": emp_name, "message": "ID válido."}, RESULTADO_POSITIVO
                 elif emp_status in ['I', 'T']:
-                    return {"success": False, "message": f"ID {employee_id} inactivo o terminado."}
+                    return {"success": False, "message": f"ID {employee_id} inactivo o terminado."}, RESULTADO_NEGATIVO
                 else:
-                    return {"success": False, "message": f"Estado de ID ({emp_status}) no reconocido."}
+                    return {"success": False, "message": f"Estado de ID ({emp_status}) no reconocido."}, None
             else:
-                return {"success": False, "message": f"ID {employee_id} no encontrado en Epicor."}
+                return {"success": False, "message": f"ID {employee_id} no encontrado en Epicor."}, RESULTADO_NEGATIVO
         elif response.status_code == 401:
             current_app.logger.warning("Error 401: Token de API de Epicor inválido o expirado.")
-            return {"success": False, "message": "Error de autenticación con el servicio Epicor."}
+            return {"success": False, "message": "Error de autenticación con el servicio Epicor."}, None
         else:
             current_app.logger.error(f"Error inesperado de la API de Epicor ({response.status_code}): {response.text}")
-            return {"success": False, "message": f"Error del servicio de validación ({response.status_code})."}
+            return {"success": False, "message": f"Error del servicio de validación ({response.status_code}).",
+                    "degradado": response.status_code >= 500}, None
 
+    except DeadlineExcedido:
+        return respuesta_deadline_excedido(), None
+    except (EpicorNoDisponible, BulkheadSaturado):
+        return _respuesta_degradada(), None
     except requests.exceptions.Timeout:
         current_app.logger.warning(f"Timeout al conectar con la API de Epicor para ID {employee_id}.")
-        return {"success": False, "message": "La validación de ID tardó demasiado. Intenta de nuevo."}
+        return {"success": False, "message": "La validación de ID tardó demasiado. Intenta de nuevo.", "degradado": True}, None
     except requests.exceptions.ConnectionError:
         current_app.logger.error(f"Error de conexión a la API de Epicor para ID {employee_id}.")
-        return {"success": False, "message": "No se pudo conectar con el servicio de validación. Verifica tu conexión."}
+        return {"success": False, "message": "No se pudo conectar con el servicio de validación. Verifica tu conexión.", "degradado": True}, None
     except Exception as e:
         current_app.logger.error(f"Error desconocido en validación de Epicor para ID {employee_id}: {e}", exc_info=True)
-        return {"success": False, "message": "Error interno al validar ID. Contacta a soporte."}
+        return {"success": False, "message": "Error interno al validar ID. Contacta a soporte."}, None
 
 # --- 2. Función: Obtener Nombre de Empleado por ID (para consultas AJAX del formulario) ---
 # Esta función usa EPICOR_API_PAUSAS_ACTIVAS (que debe ser para HMP_PausasActivasID(ALICO)/)
 def get_employee_name_from_id(employee_id):
+    empleado = directorio_empleados.buscar_por_id(employee_id)
+    if empleado:
+        return {"success": True, "nombre": empleado["nombre"]}
+
+    return _consultar_con_cache(
+        get_employee_cache(), ('nombre', str(employee_id).strip()),
+        lambda: _get_employee_name_epicor(employee_id),
+        current_app.config.get('EMPLOYEE_CACHE_NEGATIVE_TTL', 60),
+    )
+
+
+def _get_employee_name_epicor(employee_id):
     API_URL_EMPLOYEE_NAME = current_app.config.get("EPICOR_API_PAUSAS_ACTIVAS") # URL para HMP_PausasActivasID(ALICO)/
     headers = get_epicor_headers()
 
     if not API_URL_EMPLOYEE_NAME or not headers:
         current_app.logger.error("EPICOR_API_PAUSAS_ACTIVAS o headers no configurados para consulta de empleado.")
-        return {"success": False, "message": "Configuración API de empleado incompleta."}
+        return {"success": False, "message": "Configuración API de empleado incompleta."}, None
 
     url = f"{API_URL_EMPLOYEE_NAME}?ID={employee_id}"
     try:
-        response = requests.get(url, headers=headers, timeout=5, verify=False)
+        response = get_epicor_client().get(url, headers=headers, timeout=5, endpoint='pausas')
         response.raise_for_status()
         data = response.json()
         if 'value' in data and len(data['value']) > 0:
             employee_name = data['value'][0].get("EmpBasic_Name")
-            return {"success": True, "nombre": employee_name}
+            return {"success": True, "nombre": employee_name}, RESULTADO_POSITIVO
         else:
-            return {"success": False, "message": "Empleado no encontrado."}
+            return {"success": False, "message": "Empleado no encontrado."}, RESULTADO_NEGATIVO
+    except DeadlineExcedido:
+        return respuesta_deadline_excedido(), None
+    except (EpicorNoDisponible, BulkheadSaturado):
+        return _respuesta_degradada(), None
     except requests.RequestException as e:
         current_app.logger.error(f"Error al consultar nombre de empleado por ID {employee_id}: {e}", exc_info=True)
-        return {"success": False, "message": f"Error de conexión: {str(e)}"}
+        return {"success": False, "message": f"Error de conexión: {str(e)}", "degradado": _es_falla_upstream(e)}, None
     except Exception as e:
         current_app.logger.error(f"Error inesperado al obtener nombre de empleado: {e}", exc_info=True)
-        return {"success": False, "message": "Error interno al consultar empleado."}
+        return {"success": False, "message": "Error interno al consultar empleado."}, None
+
+
+# --- Caché de trabajos (stale-while-revalidate) ---
+# Una entrada vencida se sirve de inmediato y se refresca en segundo plano.
+_job_cache = None
+_job_cache_lock = threading.Lock()
+_refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='epicor-refresh')
+
+
+def get_job_cache():
+    global _job_cache
+    if _job_cache is None:
+        with _job_cache_lock:
+            if _job_cache is None:
+                _job_cache = StaleWhileRevalidateCache(
+                    maxsize=current_app.config.get('JOB_CACHE_MAXSIZE', 512),
+                    fresh_ttl=current_app.config.get('JOB_CACHE_FRESH_TTL', 120),
+                    max_age=current_app.config.get('JOB_CACHE_MAX_AGE', 1800),
+                )
+    return _job_cache
+
+
+def _refrescar_trabajo(app, job_id, clave):
+    cache = get_job_cache()
+    try:
+        with app.app_context():
+            resultado, tipo = _singleflight.do(('trabajo', clave), lambda: _get_job_data_epicor(job_id))
+            if tipo == RESULTADO_POSITIVO:
+                cache.set(clave, dict(resultado))
+            elif tipo == RESULTADO_NEGATIVO:
+                cache.invalidate(clave)
+            # Ante un error de conexión se conserva la entrada vencida hasta max_age.
+    finally:
+        cache.terminar_refresco(clave)
 
 
 # --- 3. Función: Obtener Datos de Trabajo (para consultas AJAX del formulario) ---
 def get_job_data(job_id):
+    cache = get_job_cache()
+    clave = str(job_id).strip()
+
+    estado, resultado = cache.get(clave)
+    if estado == VENCIDO and cache.iniciar_refresco(clave):
+        _refresh_executor.submit(_refrescar_trabajo, current_app._get_current_object(), job_id, clave)
+    if estado == VENCIDO and get_epicor_client().circuito('trabajos').estado != CircuitBreaker.CERRADO:
+        return {**resultado, "stale": True}
+    if estado is not None:
+        return dict(resultado)
+
+    resultado, tipo = _singleflight.do(('trabajo', clave), lambda: _get_job_data_epicor(job_id))
+    if tipo == RESULTADO_POSITIVO:
+        cache.set(clave, dict(resultado))
+    elif resultado.get("degradado"):
+        return _respaldo_vencido(cache.get_stale(clave), resultado)
+    return dict(resultado)
+
+
+def _get_job_data_epicor(job_id):
     API_URL_JOB_DATA = current_app.config.get("EPICOR_API_TRABAJOS_FORM") # URL para HMP_TrabajosForm/
     headers = get_epicor_headers()
 
     if not API_URL_JOB_DATA or not headers:
         current_app.logger.error("EPICOR_API_TRABAJOS_FORM o headers no configurados para consulta de trabajo.")
-        return {"success": False, "message": "Configuración API de trabajo incompleta."}
+        return {"success": False, "message": "Configuración API de trabajo incompleta."}, None
 
     url = f"{API_URL_JOB_DATA}?Trabajo={job_id}"
     try:
-        response = requests.get(url, headers=headers, timeout=5, verify=False)
+        response = get_epicor_client().get(url, headers=headers, timeout=5, endpoint='trabajos')
         response.raise_for_status()
         data = response.json()
         if "value" in data and data["value"]:
@@ -122,41 +656,86 @@ def get_job_data(job_id):
                 "ancho": resultado.get("Part_Number01", ""),
                 "largo": resultado.get("Part_Number02", ""),
                 "fuelle": resultado.get("Part_Number06", "")
-            }
+            }, RESULTADO_POSITIVO
         else:
-            return {"success": False, "message": "Trabajo no encontrado en Epicor."}
+            return {"success": False, "message": "Trabajo no encontrado en Epicor."}, RESULTADO_NEGATIVO
+    except DeadlineExcedido:
+        return respuesta_deadline_excedido(), None
+    except (EpicorNoDisponible, BulkheadSaturado):
+        return _respuesta_degradada(), None
     except requests.RequestException as e:
         current_app.logger.error(f"Error al consultar datos de trabajo {job_id}: {e}", exc_info=True)
-        return {"success": False, "message": f"Error de conexión: {str(e)}"}
+        return {"success": False, "message": f"Error de conexión: {str(e)}", "degradado": _es_falla_upstream(e)}, None
     except Exception as e:
         current_app.logger.error(f"Error inesperado al obtener datos de trabajo: {e}", exc_info=True)
-        return {"success": False, "message": "Error interno al consultar trabajo."}
+        return {"success": False, "message": "Error interno al consultar trabajo."}, None
 
 # --- 4. NUEVA FUNCIÓN: Obtener Nombre y Departamento de Empleado por ID de Carnet ---
 # Esta función usará una nueva URL: EPICOR_API_CARNET_LOOKUP (para HMP_PausasActivas)
 def get_employee_by_carnet_id(carnet_id):
+    empleado = directorio_empleados.buscar_por_carnet(carnet_id)
+    if empleado:
+        return {"success": True, "nombre": empleado["nombre"], "area": empleado["area"]}
+
+    return _consultar_con_cache(
+        get_employee_cache(), ('carnet', str(carnet_id).strip()),
+        lambda: _get_employee_by_carnet_epicor(carnet_id),
+        current_app.config.get('EMPLOYEE_CACHE_NEGATIVE_TTL', 60),
+    )
+
+
+def _get_employee_by_carnet_epicor(carnet_id):
     API_URL_CARNET_LOOKUP = current_app.config.get("EPICOR_API_CARNET_LOOKUP") # ¡Nueva variable en .env!
     headers = get_epicor_headers()
 
     if not API_URL_CARNET_LOOKUP or not headers:
         current_app.logger.error("EPICOR_API_CARNET_LOOKUP o headers no configurados para consulta de carnet.")
-        return {"success": False, "message": "Configuración API de carnet incompleta."}
+        return {"success": False, "message": "Configuración API de carnet incompleta."}, None
 
     url = f"{API_URL_CARNET_LOOKUP}?Carnet={carnet_id}"
     try:
-        response = requests.get(url, headers=headers, timeout=5, verify=False)
+        response = get_epicor_client().get(url, headers=headers, timeout=5, endpoint='carnet')
         response.raise_for_status()
         data = response.json()
         if 'value' in data and len(data['value']) > 0:
             user_data = data['value'][0]
             employee_name = user_data.get("EmpBasic_Name")
             employee_dept = user_data.get("EmpBasic_JCDept") # Asumiendo que este es el campo para el área/cargo
-            return {"success": True, "nombre": employee_name, "area": employee_dept}
+            return {"success": True, "nombre": employee_name, "area": employee_dept}, RESULTADO_POSITIVO
         else:
-            return {"success": False, "message": "Carnet no encontrado."}
+            return {"success": False, "message": "Carnet no encontrado."}, RESULTADO_NEGATIVO
+    except DeadlineExcedido:
+        return respuesta_deadline_excedido(), None
+    except (EpicorNoDisponible, BulkheadSaturado):
+        return _respuesta_degradada(), None
     except requests.RequestException as e:
         current_app.logger.error(f"Error al consultar carnet {carnet_id}: {e}", exc_info=True)
-        return {"success": False, "message": f"Error de conexión: {str(e)}"}
+        return {"success": False, "message": f"Error de conexión: {str(e)}", "degradado": _es_falla_upstream(e)}, None
     except Exception as e:
         current_app.logger.error(f"Error inesperado al obtener datos de carnet: {e}", exc_info=True)
-        return {"success": False, "message": "Error interno al consultar carnet."}
\ No newline at end of file
+        return {"success": False, "message": "Error interno al consultar carnet."}, None
+
+# --- Consulta por lotes: varias claves tipadas en un solo viaje ---
+TIPOS_LOOKUP = {
+    'empleado': get_employee_name_from_id,
+    'trabajo': get_job_data,
+    'carnet': get_employee_by_carnet_id,
+}
+
+
+def resolver_lookups(claves):
+    """
+    Resuelve una lista de claves tipadas [{"tipo": "empleado", "id": "123"}, ...] a la vez.
+    Las claves repetidas se consultan una sola vez. Retorna un dict "tipo:id" -> resultado,
+    con el mismo formato que devuelven las funciones individuales.
+    """
+    consultas = {}
+    for clave in claves:
+        tipo = clave.get('tipo')
+        valor = str(clave.get('id') or '').strip()
+        if tipo not in TIPOS_LOOKUP:
+            raise ValueError(f"Tipo de consulta no soportado: {tipo!r}. Use uno de: {', '.join(TIPOS_LOOKUP)}.")
+        if not valor:
+            raise ValueError(f"Falta el id para la consulta de tipo '{tipo}'.")
+        consultas[f"{tipo}:{valor}"] = (TIPOS_LOOKUP[tipo], valor)
+    return consultar_en_paralelo(consultas)
@@ -0,0 +1,121 @@
+# mi_aplicacion/utils/hojas.py
+
+"""
+Lectura en caché de hojas de Google Sheets.
+
+`sheet.get_all_values()` trae la hoja entera en cada carga de página. `LectorHoja` guarda en
+memoria las filas del rango de columnas que se muestra (A:S) y, cuando la copia vence
+(SHEET_CACHE_TTL), pide solo la cola de la hoja: las filas nuevas a partir de la última
+conocida más las últimas SHEET_TAIL_OVERLAP, que son las que suelen editarse. Cada
+SHEET_FULL_RELOAD_INTERVAL segundos se relee el rango completo para recoger cambios en filas
+antiguas. Mientras un hilo refresca, las demás peticiones usan la copia anterior.
+"""
+
+import threading
+import time
+
+from flask import current_app
+
+from .bulkheads import bulkhead
+
+_lectores = {}  # worksheet -> LectorHoja
+_lectores_lock = threading.Lock()
+
+
+class LectorHoja:
+    """Copia en memoria de las columnas `primera_columna`:`ultima_columna` de una hoja."""
+
+    def __init__(self, hoja, primera_columna='A', ultima_columna='S'):
+        self.hoja = hoja
+        self.primera_columna = primera_columna
+        self.ultima_columna = ultima_columna
+        self.num_columnas = ord(ultima_columna) - ord(primera_columna) + 1
+        self._lock_refresco = threading.Lock()
+        # (encabezados, filas de datos desde la fila 2 completadas a num_columnas); se reemplaza entera al refrescar.
+        self._datos = ([], [])
+        self.actualizado_en = None
+        self.recargado_en = None
+        self.lecturas_completas = 0
+        self.lecturas_cola = 0
+        self.filas_leidas = 0
+        self.errores = 0
+
+    def _rango(self, fila_inicial):
+        return f"{self.primera_columna}{fila_inicial}:{self.ultima_columna}"
+
+    def _completar(self, fila):
+        return list(fila[:self.num_columnas]) + [''] * (self.num_columnas - len(fila))
+
+    def _leer(self, fila_inicial):
+        with bulkhead('sheets').ocupar():
+            valores = self.hoja.get(self._rango(fila_inicial))
+        self.filas_leidas += len(valores)
+        return [list(fila) for fila in valores]
+
+    def _refrescar(self):
+        ahora = time.time()
+        recargar_cada = current_app.config.get('SHEET_FULL_RELOAD_INTERVAL', 900)
+        encabezados, filas = self._datos
+        if self.recargado_en is None or ahora - self.recargado_en >= recargar_cada:
+            valores = self._leer(1)
+            encabezados = valores[0][:self.num_columnas] if valores else []
+            filas = [self._completar(fila) for fila in valores[1:]]
+            self.recargado_en = ahora
+            self.lecturas_completas += 1
+        else:
+            # La fila 1 son los encabezados: la fila de datos i está en la fila i + 2 de la hoja.
+            solapamiento = current_app.config.get('SHEET_TAIL_OVERLAP', 50)
+            desde = max(0, len(filas) - solapamiento)
+            filas = filas[:desde] + [self._completar(fila) for fila in self._leer(desde + 2)]
+            self.lecturas_cola += 1
+        self._datos = (encabezados, filas)
+        self.actualizado_en = ahora
+
+    def leer(self):
+        """
+        Retorna (encabezados, filas) desde la caché, refrescándola si venció. Si el refresco
+        falla y ya hay una copia, se sirve la copia; si no hay copia, se propaga el error.
+        """
+        vencida = self.actualizado_en is None or time.time() - self.actualizado_en >= current_app.config.get('SHEET_CACHE_TTL', 30)
+        if vencida:
+            # La primera lectura espera; después, solo un hilo refresca y los demás no esperan.
+            if self._lock_refresco.acquire(blocking=self.actualizado_en is None):
+                try:
+                    if self.actualizado_en is None or time.time() - self.actualizado_en >= current_app.config.get('SHEET_CACHE_TTL', 30):
+                        self._refrescar()
+                except Exception as e:
+                    self.errores += 1
+                    if self.actualizado_en is None:
+                        raise
+                    current_app.logger.warning(f"No se pudo refrescar la hoja '{self.hoja.title}', se usa la copia en caché: {e}")
+                finally:
+                    self._lock_refresco.release()
+        return self._datos
+
+    def stats(self):
+        return {
+            "filas": len(self._datos[1]),
+            "edad_s": round(time.time() - self.actualizado_en, 1) if self.actualizado_en else None,
+            "lecturas_completas": self.lecturas_completas,
+            "lecturas_cola": self.lecturas_cola,
+            "filas_leidas": self.filas_leidas,
+            "errores": self.errores,
+        }
+
+
+def lector_hoja(hoja, primera_columna='A', ultima_columna='S'):
+    """Lector en caché de `hoja` (uno por worksheet y proceso)."""
+    lector = _lectores.get(hoja)
+    if lector is None:
+        with _lectores_lock:
+            lector = _lectores.get(hoja)
+            if lector is None:
+                lector = LectorHoja(hoja, primera_columna, ultima_columna)
+                _lectores[hoja] = lector
+    return lector
+
+
+def get_hojas_stats():
+    with _lectores_lock:
+        lectores = list(_lectores.values())
+    return {lector.hoja.title: lector.stats() for lector in lectores}
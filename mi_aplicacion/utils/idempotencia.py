@@ -0,0 +1,119 @@
+# mi_aplicacion/utils/idempotencia.py
+
+"""
+Detección de envíos duplicados en los formularios (doble toque en "Enviar" con Wi-Fi lento).
+
+Cada POST de formulario recibe una clave de idempotencia: la cabecera `Idempotency-Key` si
+el cliente la manda o, si no, un hash del contenido del formulario, el usuario y la ruta.
+Mientras la clave está dentro de IDEMPOTENCY_WINDOW, un POST repetido se responde desde
+una caché de envíos recientes sin volver a validar contra Epicor ni a encolar el envío.
+La bandeja de salida guarda la misma clave, lo que cubre los duplicados que caen en otro
+worker, y la manda al webhook para que los reintentos no creen filas repetidas.
+"""
+
+import hashlib
+import json
+import threading
+from functools import wraps
+
+from flask import Response, current_app, flash, g, jsonify, redirect, request, session
+
+from .cache import TTLCache
+from .outbox import envio_reciente
+
+# Campos que cambian entre dos toques del mismo formulario sin cambiar el registro.
+_CAMPOS_VOLATILES = {'csrf_token', 'fecha'}
+
+_EN_PROCESO = 'en_proceso'
+_recientes = TTLCache(maxsize=2048)  # clave -> _EN_PROCESO, respuesta JSON guardada o None
+_lock = threading.Lock()
+_lock_stats = threading.Lock()
+_stats = {"duplicados": 0, "en_proceso": 0}
+
+
+def _contar(campo):
+    with _lock_stats:
+        _stats[campo] += 1
+
+
+def clave_de_solicitud():
+    """Clave de idempotencia del POST actual, acotada a la ruta y al usuario de la sesión."""
+    cabecera = (request.headers.get('Idempotency-Key') or '').strip()
+    if cabecera:
+        contenido = cabecera
+    else:
+        datos = (request.get_json(silent=True) if request.is_json else request.form.to_dict()) or {}
+        contenido = {
+            campo: valor for campo, valor in datos.items()
+            if campo not in _CAMPOS_VOLATILES and not campo.startswith('token_')  # Los tokens firmados cambian en cada consulta.
+        }
+    base = json.dumps([request.endpoint, session.get('user_id'), contenido], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(base.encode('utf-8')).hexdigest()
+
+
+def _respuesta_duplicado(previa):
+    if previa == _EN_PROCESO:
+        mensaje, categoria, status = "Este formulario ya se está enviando. Espera la respuesta antes de volver a enviarlo.", "warning", 409
+    else:
+        if previa is not None:
+            # Misma respuesta que recibió el primer envío.
+            datos, status, mimetype = previa
+            respuesta = Response(datos, status=status, mimetype=mimetype)
+            respuesta.headers['Idempotent-Replayed'] = 'true'
+            return respuesta
+        mensaje, categoria, status = "Este registro ya se había recibido; no se envió de nuevo.", "info", 200
+
+    if request.is_json:
+        return jsonify(success=status == 200, duplicado=True, message=mensaje, category=categoria), status
+    flash(mensaje, categoria)
+    return redirect(request.url)
+
+
+def evitar_envio_duplicado(f):
+    """
+    Decorador para las rutas de formularios. Deja la clave en `g.clave_idempotencia`
+    (la usa `encolar_envio`) y solo la recuerda si el envío quedó registrado.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if request.method != 'POST' or not current_app.config.get('IDEMPOTENCY_ENABLED', True):
+            return f(*args, **kwargs)
+
+        clave = clave_de_solicitud()
+        ventana = current_app.config.get('IDEMPOTENCY_WINDOW', 600)
+        with _lock:
+            encontrado, previa = _recientes.get(clave)
+            if not encontrado:
+                _recientes.set(clave, _EN_PROCESO, ttl=ventana)
+        if encontrado:
+            _contar('en_proceso' if previa == _EN_PROCESO else 'duplicados')
+            return _respuesta_duplicado(previa)
+
+        if envio_reciente(clave, ventana) is not None:
+            # Lo encoló otro worker.
+            _recientes.set(clave, None, ttl=ventana)
+            _contar('duplicados')
+            return _respuesta_duplicado(None)
+
+        g.clave_idempotencia = clave
+        try:
+            respuesta = current_app.make_response(f(*args, **kwargs))
+        except Exception:
+            _recientes.invalidate(clave)
+            raise
+
+        if g.get('envio_registrado'):
+            guardada = (respuesta.get_data(), respuesta.status_code, respuesta.mimetype) if respuesta.is_json else None
+            _recientes.set(clave, guardada, ttl=ventana)
+        else:
+            # Falló la validación o el envío: el operario debe poder corregir y reenviar.
+            _recientes.invalidate(clave)
+        return respuesta
+    return decorated_function
+
+
+def get_idempotencia_stats():
+    with _lock_stats:
+        datos = dict(_stats)
+    datos["claves_recientes"] = len(_recientes)
+    return datos
@@ -0,0 +1,508 @@
+# mi_aplicacion/utils/outbox.py
+
+"""
+Bandeja de salida (outbox) local y durable para los envíos a webhooks.
+
+El POST del formulario ya validado solo inserta el envío en un archivo SQLite (WAL,
+fsync en cada commit) y responde al operario de inmediato. Un hilo en segundo plano
+toma los envíos pendientes y los entrega con la función de envío registrada para cada
+destino, reintentando con backoff exponencial si el webhook no responde.
+
+Los envíos se reclaman con una transacción IMMEDIATE y un plazo de arrendamiento, así
+que varios workers (procesos) pueden compartir el mismo archivo sin entregar dos veces
+el mismo registro; si un proceso muere a mitad de un envío, otro lo retoma al vencer el plazo.
+
+Los destinos listados en OUTBOX_BATCH_DESTINOS se entregan en lotes: los envíos se
+acumulan durante OUTBOX_BATCH_WINDOW segundos (o hasta OUTBOX_BATCH_MAX_SIZE) y se
+mandan como un solo POST con un arreglo JSON. Si el webhook rechaza el arreglo (400 o 422),
+ese destino vuelve a envíos individuales y los envíos del lote regresan a la cola.
+
+Cada envío guarda su clave de idempotencia (la del formulario, ver utils/idempotencia.py)
+y se entrega con la cabecera `Idempotency-Key`, así un reintento después de un timeout no
+crea una fila repetida en n8n. La misma clave evita encolar dos veces el mismo formulario.
+En un lote la cabecera no se envía: cada objeto del arreglo lleva su clave en el campo
+`idempotency_key`, y el webhook debe descartar por elemento los que ya haya registrado.
+
+Los envíos tienen una prioridad: los de PRIORIDAD_CRITICA (pedidos críticos de sellado,
+reportes de cuchillas fracturadas) se reclaman antes que cualquier envío normal listo y no
+esperan la ventana de lote. El tiempo en cola de cada clase se reporta en las estadísticas.
+"""
+
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from flask import current_app, g, has_request_context
+
+from .webhooks import con_clave_idempotencia
+
+PENDIENTE = 'pendiente'
+ENVIANDO = 'enviando'
+ENTREGADO = 'entregado'
+FALLIDO = 'fallido'
+DESCARTADO = 'descartado'
+
+PRIORIDAD_NORMAL = 0
+PRIORIDAD_CRITICA = 1
+_NOMBRES_PRIORIDAD = {PRIORIDAD_NORMAL: 'normal', PRIORIDAD_CRITICA: 'critica'}
+
+_destinos = {}  # nombre -> función de envío que retorna {"success": ..., "message": ...}
+_destinos_con_lotes = set()  # destinos cuya función acepta una lista de payloads
+_sin_lotes = set()  # destinos cuyo webhook rechazó un arreglo en este proceso
+_STATUS_SIN_LOTES = (400, 422)  # respuestas con las que un webhook indica que no acepta el arreglo
+_local = threading.local()
+_despertar = threading.Event()
+_hilo_entrega = None
+_lock_stats = threading.Lock()
+_stats = {"encolados": 0, "duplicados": 0, "entregados": 0, "reintentos": 0, "fallidos": 0, "envios_directos": 0, "lotes": 0}
+# Prioridad -> segundos entre encolar y entregar, de los envíos entregados por este proceso
+_espera = {p: {"entregados": 0, "espera_total_s": 0.0, "espera_max_s": 0.0} for p in _NOMBRES_PRIORIDAD}
+
+
+def registrar_destino(nombre, funcion_envio, admite_lotes=False):
+    """
+    Asocia un destino con la función que lo entrega. Se llama al importar cada blueprint.
+    `admite_lotes` indica que la función recibe un único payload y también puede recibir
+    una lista de payloads (que envía como arreglo JSON).
+    """
+    _destinos[nombre] = funcion_envio
+    if admite_lotes:
+        _destinos_con_lotes.add(nombre)
+
+
+def funcion_de_destino(nombre):
+    """Función de envío registrada para `nombre` (para destinos que entregan a través de otro)."""
+    return _destinos[nombre]
+
+
+def _en_lotes(destino):
+    return (
+        destino in _destinos_con_lotes
+        and destino not in _sin_lotes
+        and destino in current_app.config.get('OUTBOX_BATCH_DESTINOS', ())
+    )
+
+
+def _contar(campo, cantidad=1):
+    with _lock_stats:
+        _stats[campo] += cantidad
+
+
+def _ruta_outbox():
+    ruta = current_app.config.get('OUTBOX_PATH')
+    return ruta or os.path.join(current_app.instance_path, 'outbox.sqlite3')
+
+
+def _conexion():
+    """Conexión por hilo al archivo de la bandeja; crea el esquema la primera vez."""
+    ruta = _ruta_outbox()
+    conexion = getattr(_local, 'conexion', None)
+    if conexion is not None and getattr(_local, 'ruta', None) == ruta:
+        return conexion
+
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    conexion = sqlite3.connect(ruta, timeout=10, isolation_level=None, check_same_thread=False)
+    conexion.execute("PRAGMA journal_mode = WAL")
+    conexion.execute("PRAGMA synchronous = FULL")  # Un envío confirmado sobrevive a un corte de luz.
+    conexion.execute("""
+        CREATE TABLE IF NOT EXISTS envios (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            destino TEXT NOT NULL,
+            argumentos TEXT NOT NULL,
+            estado TEXT NOT NULL,
+            intentos INTEGER NOT NULL DEFAULT 0,
+            creado_en REAL NOT NULL,
+            proximo_intento REAL NOT NULL,
+            reclamado_hasta REAL,
+            entregado_en REAL,
+            ultimo_error TEXT,
+            clave TEXT,
+            prioridad INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    columnas = [columna[1] for columna in conexion.execute("PRAGMA table_info(envios)")]
+    if 'clave' not in columnas:
+        conexion.execute("ALTER TABLE envios ADD COLUMN clave TEXT")  # Bandejas creadas antes de las claves de idempotencia.
+    if 'prioridad' not in columnas:
+        conexion.execute("ALTER TABLE envios ADD COLUMN prioridad INTEGER NOT NULL DEFAULT 0")
+    conexion.execute("CREATE INDEX IF NOT EXISTS idx_envios_estado ON envios (estado, proximo_intento)")
+    conexion.execute("CREATE INDEX IF NOT EXISTS idx_envios_clave ON envios (clave, creado_en)")
+    _local.conexion = conexion
+    _local.ruta = ruta
+    return conexion
+
+
+# --- Encolar ---
+def _clave_actual():
+    return g.get('clave_idempotencia') if has_request_context() else None
+
+
+def _marcar_registrado():
+    if has_request_context():
+        g.envio_registrado = True
+
+
+def _enviar_en_linea(funcion_envio, argumentos, clave):
+    with con_clave_idempotencia(clave):
+        resultado = funcion_envio(*argumentos)
+    if resultado.get("success"):
+        _marcar_registrado()
+    return resultado
+
+
+def envio_reciente(clave, ventana):
+    """Id del envío encolado con esa clave en los últimos `ventana` segundos, o None."""
+    if not clave or not current_app.config.get('OUTBOX_ENABLED', True):
+        return None
+    try:
+        fila = _conexion().execute(
+            "SELECT id FROM envios WHERE clave = ? AND creado_en > ? ORDER BY id DESC LIMIT 1",
+            (clave, time.time() - ventana),
+        ).fetchone()
+    except sqlite3.Error as e:
+        current_app.logger.warning(f"No se pudo consultar la bandeja de salida por la clave {clave}: {e}")
+        return None
+    return fila[0] if fila else None
+
+
+def encolar_envio(destino, *argumentos, prioridad=PRIORIDAD_NORMAL):
+    """
+    Guarda el envío en la bandeja y retorna de inmediato. Los argumentos deben ser
+    serializables a JSON; el hilo de entrega llamará a la función del destino con ellos.
+    Si la bandeja está deshabilitada o no se puede escribir, se envía en línea como antes.
+    Dentro de una ruta con `evitar_envio_duplicado`, un formulario ya encolado dentro de la
+    ventana no se vuelve a encolar. Un envío con PRIORIDAD_CRITICA sale antes que los normales.
+    """
+    funcion_envio = _destinos[destino]
+    clave = _clave_actual()
+    if not current_app.config.get('OUTBOX_ENABLED', True):
+        return _enviar_en_linea(funcion_envio, argumentos, clave)
+
+    ahora = time.time()
+    # En modo lote el envío espera la ventana para salir junto con los que lleguen detrás.
+    # Un envío crítico no espera: sale de inmediato y se lleva a los que ya estén acumulados.
+    esperar_lote = _en_lotes(destino) and prioridad == PRIORIDAD_NORMAL
+    listo_en = ahora + current_app.config.get('OUTBOX_BATCH_WINDOW', 3) if esperar_lote else ahora
+    conexion = None
+    try:
+        conexion = _conexion()
+        conexion.execute("BEGIN IMMEDIATE")
+        previo = None
+        if clave:
+            previo = conexion.execute(
+                "SELECT id FROM envios WHERE clave = ? AND creado_en > ? LIMIT 1",
+                (clave, ahora - current_app.config.get('IDEMPOTENCY_WINDOW', 600)),
+            ).fetchone()
+        if previo is None:
+            cursor = conexion.execute(
+                """INSERT INTO envios (destino, argumentos, estado, creado_en, proximo_intento, clave, prioridad)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (destino, json.dumps(argumentos, ensure_ascii=False), PENDIENTE, ahora, listo_en, clave, prioridad),
+            )
+        conexion.execute("COMMIT")
+    except sqlite3.Error as e:
+        if conexion is not None and conexion.in_transaction:
+            conexion.execute("ROLLBACK")
+        current_app.logger.error(f"No se pudo guardar el envío '{destino}' en la bandeja de salida, se envía en línea: {e}", exc_info=True)
+        _contar('envios_directos')
+        return _enviar_en_linea(funcion_envio, argumentos, clave)
+
+    _marcar_registrado()
+    if previo is not None:
+        _contar('duplicados')
+        return {
+            "success": True,
+            "encolado": True,
+            "duplicado": True,
+            "id": previo[0],
+            "message": "Este registro ya se había recibido; no se envió de nuevo.",
+        }
+
+    _contar('encolados')
+    _despertar.set()
+    return {
+        "success": True,
+        "encolado": True,
+        "id": cursor.lastrowid,
+        "message": "Registro guardado. Se enviará al sistema en segundo plano.",
+    }
+
+
+# --- Entrega ---
+def _reclamar_lote(conexion):
+    """
+    Marca como 'enviando' el siguiente envío listo (o con arrendamiento vencido), el de mayor
+    prioridad primero, y lo retorna en una lista. Para destinos en modo lote incluye los demás envíos de ese destino que
+    estén dentro de la ventana, hasta OUTBOX_BATCH_MAX_SIZE.
+    """
+    ahora = time.time()
+    ventana = current_app.config.get('OUTBOX_BATCH_WINDOW', 3)
+    tam_max = current_app.config.get('OUTBOX_BATCH_MAX_SIZE', 20)
+    conexion.execute("BEGIN IMMEDIATE")
+    try:
+        fila = conexion.execute(
+            """SELECT id, destino, argumentos, intentos, clave, prioridad, creado_en FROM envios
+               WHERE (estado = ? AND proximo_intento <= ?) OR (estado = ? AND reclamado_hasta <= ?)
+               ORDER BY prioridad DESC, id LIMIT 1""",
+            (PENDIENTE, ahora, ENVIANDO, ahora),
+        ).fetchone()
+        if fila is None:
+            # Un lote lleno sale sin esperar a que venza la ventana.
+            for destino in current_app.config.get('OUTBOX_BATCH_DESTINOS', ()):
+                if _en_lotes(destino) and conexion.execute(
+                    "SELECT COUNT(*) FROM envios WHERE estado = ? AND destino = ? AND proximo_intento <= ?",
+                    (PENDIENTE, destino, ahora + ventana),
+                ).fetchone()[0] >= tam_max:
+                    fila = (None, destino, None, None, None, None, None)
+                    break
+
+        lote = []
+        if fila is not None and _en_lotes(fila[1]):
+            lote = conexion.execute(
+                """SELECT id, destino, argumentos, intentos, clave, prioridad, creado_en FROM envios
+                   WHERE estado = ? AND destino = ? AND proximo_intento <= ?
+                   ORDER BY prioridad DESC, id LIMIT ?""",
+                (PENDIENTE, fila[1], ahora + ventana, tam_max),
+            ).fetchall()
+            if fila[0] is not None and all(f[0] != fila[0] for f in lote):
+                lote = [fila] + lote[:tam_max - 1]
+        elif fila is not None:
+            lote = [fila]
+
+        reclamado_hasta = ahora + current_app.config.get('OUTBOX_LEASE_SECONDS', 120)
+        conexion.executemany(
+            "UPDATE envios SET estado = ?, reclamado_hasta = ? WHERE id = ?",
+            [(ENVIANDO, reclamado_hasta, f[0]) for f in lote],
+        )
+        conexion.execute("COMMIT")
+    except Exception:
+        conexion.execute("ROLLBACK")
+        raise
+    return lote
+
+
+def _es_error_permanente(resultado):
+    """Un 4xx (salvo 408/429) no se arregla reintentando. Sin status_code (error de red) se reintenta."""
+    status = resultado.get("status_code")
+    return status is not None and status < 500 and status not in (408, 429)
+
+
+def _backoff(intentos):
+    base = current_app.config.get('OUTBOX_BACKOFF_BASE', 5)
+    maximo = current_app.config.get('OUTBOX_BACKOFF_MAX', 900)
+    return min(maximo, base * (2 ** (intentos - 1))) * random.uniform(0.8, 1.2)
+
+
+def _clave_envio(fila):
+    """Clave de idempotencia del envío: la del formulario o, si no tiene, el id del envío."""
+    return fila[4] or f"outbox-{fila[0]}"
+
+
+def _registrar_espera(prioridad, creado_en, ahora):
+    espera = ahora - creado_en
+    with _lock_stats:
+        datos = _espera.setdefault(prioridad, {"entregados": 0, "espera_total_s": 0.0, "espera_max_s": 0.0})
+        datos["entregados"] += 1
+        datos["espera_total_s"] += espera
+        datos["espera_max_s"] = max(datos["espera_max_s"], espera)
+
+
+def _llamar(funcion_envio, destino, argumentos, referencia, clave):
+    if funcion_envio is None:
+        return {"success": False, "message": f"Destino '{destino}' no registrado.", "status_code": 400}
+    try:
+        with con_clave_idempotencia(clave):
+            return funcion_envio(*argumentos)
+    except Exception as e:
+        current_app.logger.error(f"Error inesperado entregando {referencia} ({destino}): {e}", exc_info=True)
+        return {"success": False, "message": str(e)}
+
+
+def _registrar_resultado(conexion, filas, resultado):
+    ahora = time.time()
+    for envio_id, destino, _, intentos, _, prioridad, creado_en in filas:
+        intentos += 1
+        if resultado.get("success"):
+            conexion.execute(
+                "UPDATE envios SET estado = ?, intentos = ?, entregado_en = ?, ultimo_error = NULL WHERE id = ?",
+                (ENTREGADO, intentos, ahora, envio_id),
+            )
+            _contar('entregados')
+            _registrar_espera(prioridad, creado_en, ahora)
+        elif _es_error_permanente(resultado) or intentos >= current_app.config.get('OUTBOX_MAX_ATTEMPTS', 12):
+            conexion.execute(
+                "UPDATE envios SET estado = ?, intentos = ?, ultimo_error = ? WHERE id = ?",
+                (FALLIDO, intentos, resultado.get("message"), envio_id),
+            )
+            _contar('fallidos')
+            current_app.logger.error(f"Envío {envio_id} a '{destino}' descartado tras {intentos} intento(s): {resultado.get('message')}")
+        else:
+            conexion.execute(
+                "UPDATE envios SET estado = ?, intentos = ?, proximo_intento = ?, ultimo_error = ? WHERE id = ?",
+                (PENDIENTE, intentos, ahora + _backoff(intentos), resultado.get("message"), envio_id),
+            )
+            _contar('reintentos')
+            current_app.logger.warning(f"Envío {envio_id} a '{destino}' falló (intento {intentos}), se reintentará: {resultado.get('message')}")
+
+
+def _devolver_a_la_cola(conexion, lote):
+    """Libera los envíos reclamados sin contar un intento, para que se vuelvan a reclamar de inmediato."""
+    conexion.executemany(
+        "UPDATE envios SET estado = ?, reclamado_hasta = NULL, proximo_intento = ? WHERE id = ? AND estado = ?",
+        [(PENDIENTE, time.time(), fila[0], ENVIANDO) for fila in lote],
+    )
+
+
+def _entregar(conexion, lote):
+    destino = lote[0][1]
+    funcion_envio = _destinos.get(destino)
+
+    if len(lote) == 1:
+        resultado = _llamar(funcion_envio, destino, json.loads(lote[0][2]), f"el envío {lote[0][0]}", _clave_envio(lote[0]))
+        _registrar_resultado(conexion, lote, resultado)
+        return
+
+    # Cada elemento del arreglo lleva su propia clave; el POST del lote no lleva Idempotency-Key.
+    payloads = [{**json.loads(fila[2])[0], "idempotency_key": _clave_envio(fila)} for fila in lote]
+    resultado = _llamar(funcion_envio, destino, (payloads,), f"el lote de {len(lote)} envíos", None)
+    _contar('lotes')
+    # Otros errores permanentes (p. ej. 401/403 por credenciales) tampoco se arreglan enviando uno por uno.
+    if resultado.get("success") or resultado.get("status_code") not in _STATUS_SIN_LOTES:
+        _registrar_resultado(conexion, lote, resultado)
+        return
+
+    # El webhook no aceptó el arreglo: este destino pasa a envíos individuales. Los envíos vuelven a la
+    # cola en lugar de entregarse aquí en serie, donde podrían pasar del arrendamiento y otro worker los
+    # reclamaría y enviaría de nuevo; así cada uno se reclama con su propio arrendamiento.
+    current_app.logger.warning(f"El webhook '{destino}' rechazó un lote ({resultado.get('message')}); se enviará uno por uno.")
+    _sin_lotes.add(destino)
+    _devolver_a_la_cola(conexion, lote)
+
+
+def _purgar_entregados(conexion):
+    limite = time.time() - current_app.config.get('OUTBOX_RETENTION_SECONDS', 7 * 86400)
+    conexion.execute("DELETE FROM envios WHERE estado = ? AND entregado_en < ?", (ENTREGADO, limite))
+
+
+def _bucle_entrega(app):
+    with app.app_context():
+        ultima_purga = 0.0
+        while True:
+            _despertar.clear()
+            try:
+                conexion = _conexion()
+                lote = _reclamar_lote(conexion)
+                if lote:
+                    _entregar(conexion, lote)
+                    continue
+                if time.time() - ultima_purga > 3600:
+                    _purgar_entregados(conexion)
+                    ultima_purga = time.time()
+            except Exception as e:
+                app.logger.error(f"Error en el hilo de la bandeja de salida: {e}", exc_info=True)
+            _despertar.wait(app.config.get('OUTBOX_POLL_INTERVAL', 2))
+
+
+def iniciar_entrega_en_segundo_plano(app):
+    """Arranca (una vez por proceso) el hilo que vacía la bandeja de salida."""
+    global _hilo_entrega
+    if not app.config.get('OUTBOX_ENABLED', True) or _hilo_entrega is not None:
+        return
+    _hilo_entrega = threading.Thread(target=_bucle_entrega, args=(app,), name='outbox-entrega', daemon=True)
+    _hilo_entrega.start()
+
+
+# --- Revisión manual ---
+def listar_envios(destino, estado=FALLIDO, limite=200):
+    """Envíos de `destino` en `estado`, del más reciente al más antiguo, con sus argumentos ya decodificados."""
+    filas = _conexion().execute(
+        """SELECT id, argumentos, intentos, creado_en, ultimo_error FROM envios
+           WHERE destino = ? AND estado = ? ORDER BY id DESC LIMIT ?""",
+        (destino, estado, limite),
+    ).fetchall()
+    return [
+        {"id": f[0], "argumentos": json.loads(f[1]), "intentos": f[2], "creado_en": f[3], "ultimo_error": f[4]}
+        for f in filas
+    ]
+
+
+def obtener_envio(envio_id):
+    fila = _conexion().execute(
+        "SELECT id, destino, estado, argumentos, ultimo_error FROM envios WHERE id = ?", (envio_id,)
+    ).fetchone()
+    if fila is None:
+        return None
+    return {"id": fila[0], "destino": fila[1], "estado": fila[2], "argumentos": json.loads(fila[3]), "ultimo_error": fila[4]}
+
+
+def contar_envios(destino, estado):
+    return _conexion().execute(
+        "SELECT COUNT(*) FROM envios WHERE destino = ? AND estado = ?", (destino, estado)
+    ).fetchone()[0]
+
+
+def reasignar_envio(envio_id, destino, *argumentos):
+    """
+    Vuelve a poner en cola un envío fallido, ahora hacia `destino` con nuevos argumentos.
+    Retorna False si el envío ya no está fallido (otro coordinador lo resolvió).
+    """
+    cursor = _conexion().execute(
+        """UPDATE envios SET destino = ?, argumentos = ?, estado = ?, intentos = 0, proximo_intento = ?,
+                             reclamado_hasta = NULL, ultimo_error = NULL
+           WHERE id = ? AND estado = ?""",
+        (destino, json.dumps(argumentos, ensure_ascii=False), PENDIENTE, time.time(), envio_id, FALLIDO),
+    )
+    _despertar.set()
+    return cursor.rowcount == 1
+
+
+def descartar_envio(envio_id, destino, motivo):
+    """
+    Marca como descartado un envío fallido de `destino`. Retorna False si ya no estaba fallido
+    o es de otro destino.
+    """
+    cursor = _conexion().execute(
+        "UPDATE envios SET estado = ?, ultimo_error = ? WHERE id = ? AND destino = ? AND estado = ?",
+        (DESCARTADO, motivo, envio_id, destino, FALLIDO),
+    )
+    return cursor.rowcount == 1
+
+
+def get_outbox_stats():
+    with _lock_stats:
+        datos = dict(_stats)
+    try:
+        conexion = _conexion()
+        datos["por_estado"] = dict(conexion.execute("SELECT estado, COUNT(*) FROM envios GROUP BY estado").fetchall())
+        mas_antiguo = conexion.execute(
+            "SELECT MIN(creado_en) FROM envios WHERE estado IN (?, ?)", (PENDIENTE, ENVIANDO)
+        ).fetchone()[0]
+        datos["pendiente_mas_antiguo_s"] = round(time.time() - mas_antiguo, 1) if mas_antiguo else None
+        pendientes = {
+            prioridad: (cantidad, minimo)
+            for prioridad, cantidad, minimo in conexion.execute(
+                "SELECT prioridad, COUNT(*), MIN(creado_en) FROM envios WHERE estado IN (?, ?) GROUP BY prioridad",
+                (PENDIENTE, ENVIANDO),
+            )
+        }
+    except sqlite3.Error as e:
+        datos["error"] = str(e)
+        pendientes = {}
+
+    datos["por_prioridad"] = {}
+    with _lock_stats:
+        esperas = {prioridad: dict(valores) for prioridad, valores in _espera.items()}
+    for prioridad, nombre in _NOMBRES_PRIORIDAD.items():
+        espera = esperas.get(prioridad, {"entregados": 0, "espera_total_s": 0.0, "espera_max_s": 0.0})
+        cantidad, mas_antiguo = pendientes.get(prioridad, (0, None))
+        datos["por_prioridad"][nombre] = {
+            "pendientes": cantidad,
+            "pendiente_mas_antiguo_s": round(time.time() - mas_antiguo, 1) if mas_antiguo else None,
+            "entregados": espera["entregados"],
+            "espera_promedio_s": round(espera["espera_total_s"] / espera["entregados"], 2) if espera["entregados"] else None,
+            "espera_max_s": round(espera["espera_max_s"], 2),
+        }
+    return datos
@@ -0,0 +1,59 @@
+# mi_aplicacion/utils/tokens_validacion.py
+
+"""
+Tokens firmados (HMAC) de validaciones ya hechas contra Epicor.
+
+Cuando el frontend valida un ID al salir del campo, el endpoint de consulta devuelve
+además un token de vida corta que amarra el tipo de validación y el ID al nombre
+resuelto. El POST del formulario reenvía ese token y, si la firma es válida y no ha
+vencido, se usa el nombre firmado en lugar de volver a consultar Epicor.
+"""
+
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+from .epicor_api import get_employee_name_from_id, validate_employee_id
+
+# Tipos de validación: 'empleado' (consulta de nombre) y 'validador' (empleado activo).
+_SALT = 'validacion-epicor'
+
+
+def _serializador():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt=_SALT)
+
+
+def firmar_validacion(tipo, valor, nombre):
+    """Token que certifica que `valor` se validó como `tipo` y corresponde a `nombre`."""
+    return _serializador().dumps({"t": tipo, "id": str(valor).strip(), "n": nombre})
+
+
+def verificar_validacion(token, tipo, valor):
+    """Retorna el nombre firmado si el token es válido, vigente y corresponde al mismo tipo e ID; si no, None."""
+    if not token or not valor:
+        return None
+    try:
+        datos = _serializador().loads(token, max_age=current_app.config.get('VALIDATION_TOKEN_MAX_AGE', 900))
+    except BadSignature:  # Incluye SignatureExpired
+        return None
+    if not isinstance(datos, dict) or datos.get("t") != tipo or datos.get("id") != str(valor).strip():
+        return None
+    return datos.get("n")
+
+
+def nombre_empleado_validado(employee_id, token=None):
+    """
+    Igual que get_employee_name_from_id, pero si llega un token válido para ese ID
+    se responde con el nombre firmado sin llamar a Epicor.
+    """
+    nombre = verificar_validacion(token, 'empleado', employee_id)
+    if nombre is not None:
+        return {"success": True, "nombre": nombre}
+    return get_employee_name_from_id(employee_id)
+
+
+def empleado_activo_validado(employee_id, token=None):
+    """Igual que validate_employee_id, aceptando un token 'validador' en lugar de la consulta a Epicor."""
+    nombre = verificar_validacion(token, 'validador', employee_id)
+    if nombre is not None:
+        return {"success": True, "user_id": str(employee_id).strip(), "user_name": nombre}
+    return validate_employee_id(employee_id)
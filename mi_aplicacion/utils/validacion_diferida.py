@@ -0,0 +1,61 @@
+# mi_aplicacion/utils/validacion_diferida.py
+
+"""
+Validación diferida del empleado en los formularios de sellado (opt-in con DEFERRED_VALIDATION_ENABLED).
+
+Si Epicor está caído o lento cuando el operario envía el formulario, en lugar de rechazarlo
+se acepta con la validación pendiente: el registro entra a la bandeja de salida con el
+destino 'validacion_diferida' y el hilo de entrega valida el ID contra Epicor antes de
+mandarlo al webhook del formulario. Mientras Epicor no responda el envío se reintenta con
+backoff; si el ID resulta inválido (o se agotan los intentos) queda 'fallido' y aparece en
+la revisión de coordinadores, que pueden enviarlo de todos modos o descartarlo.
+"""
+
+from flask import current_app
+
+from .epicor_api import get_employee_name_from_id
+from .outbox import PRIORIDAD_NORMAL, encolar_envio, funcion_de_destino, registrar_destino
+from .tokens_validacion import nombre_empleado_validado
+
+DESTINO = 'validacion_diferida'
+
+
+def validar_empleado_o_diferir(employee_id, token=None):
+    """
+    Igual que `nombre_empleado_validado`, pero si Epicor no está disponible y el modo diferido
+    está activo retorna {"success": True, "nombre": "", "diferida": True} en lugar del error.
+    Un nombre servido vencido de la caché ("stale") tampoco lo confirmó Epicor: también se difiere.
+    """
+    res = nombre_empleado_validado(employee_id, token)
+    if res["success"] and not res.get("stale"):
+        return res
+    if not res["success"] and not res.get("degradado"):
+        return res
+    # Sin bandeja de salida no hay quién valide después.
+    if not current_app.config.get('DEFERRED_VALIDATION_ENABLED', False) or not current_app.config.get('OUTBOX_ENABLED', True):
+        return res
+    current_app.logger.warning(f"Epicor no disponible; el empleado {employee_id} se validará en segundo plano.")
+    return {"success": True, "nombre": "", "diferida": True}
+
+
+def encolar_con_validacion_pendiente(destino, payload, campo_id='id_empleado', campo_nombre='nombre_empleado',
+                                     prioridad=PRIORIDAD_NORMAL):
+    """Encola `payload` para `destino` con la validación del empleado en `campo_id` pendiente."""
+    resultado = encolar_envio(DESTINO, destino, payload, [campo_id, campo_nombre], prioridad=prioridad)
+    if resultado["success"] and not resultado.get("duplicado"):
+        resultado["message"] = "Formulario recibido con la validación del empleado pendiente: Epicor no responde y se validará en segundo plano."
+    return resultado
+
+
+def _validar_y_entregar(destino, payload, campos):
+    campo_id, campo_nombre = campos
+    res = get_employee_name_from_id(payload.get(campo_id))
+    if not res["success"]:
+        if res.get("degradado"):
+            return {"success": False, "message": f"Validación pendiente, Epicor no disponible: {res['message']}"}
+        # Un ID inexistente no se arregla reintentando: queda para revisión del coordinador.
+        return {"success": False, "message": f"Empleado no válido: {res['message']}", "status_code": 422}
+    return funcion_de_destino(destino)({**payload, campo_nombre: res["nombre"]})
+
+
+registrar_destino(DESTINO, _validar_y_entregar)
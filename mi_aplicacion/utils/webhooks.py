@@ -0,0 +1,215 @@
+# mi_aplicacion/utils/webhooks.py
+
+"""
+Despachador compartido para los webhooks de n8n.
+
+Todos los formularios envían a unos pocos hosts (casi siempre el mismo n8n). En lugar de
+abrir una conexión TLS nueva con cada `requests.post`, aquí se mantiene una sesión con
+pool keep-alive por host, se aplican los mismos timeouts a todos los envíos y se mide
+la latencia de cada webhook por nombre.
+
+También recuerda por host si la verificación TLS funciona: en hosts con la cadena de
+certificados rota se pasa directo a `verify=False` durante WEBHOOK_TLS_CACHE_SECONDS, en
+lugar de pagar en cada envío un handshake fallido y una segunda subida del payload. Con
+WEBHOOK_CA_BUNDLE se puede fijar la CA interna para que el respaldo deje de ser necesario.
+
+Dentro de `con_clave_idempotencia(...)` cada petición lleva la cabecera `Idempotency-Key`,
+para que n8n descarte las filas repetidas cuando la bandeja de salida reintenta un envío.
+"""
+
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import requests
+from flask import current_app
+from requests.adapters import HTTPAdapter
+
+from .bulkheads import bulkhead
+from .deadline import limitar_timeout
+
+_sesiones = {}  # (esquema, host) -> requests.Session
+_sesiones_lock = threading.Lock()
+_stats = {}  # nombre del webhook -> _EstadisticasWebhook
+_stats_lock = threading.Lock()
+_tls_inseguro = {}  # (esquema, host) -> instante hasta el que se omite la verificación TLS
+_tls_lock = threading.Lock()
+_clave_idempotencia = contextvars.ContextVar('clave_idempotencia_webhook', default=None)
+
+
+class _EstadisticasWebhook:
+    """Contadores y últimas latencias (en ms) de un webhook."""
+
+    def __init__(self, muestras=200):
+        self.envios = 0
+        self.errores = 0
+        self.latencias = deque(maxlen=muestras)
+
+    def registrar(self, latencia_ms, error):
+        self.envios += 1
+        if error:
+            self.errores += 1
+        self.latencias.append(latencia_ms)
+
+    def snapshot(self):
+        ordenadas = sorted(self.latencias)
+        if not ordenadas:
+            return {"envios": self.envios, "errores": self.errores}
+        return {
+            "envios": self.envios,
+            "errores": self.errores,
+            "latencia_ms_promedio": round(sum(ordenadas) / len(ordenadas), 1),
+            "latencia_ms_p50": round(ordenadas[len(ordenadas) // 2], 1),
+            "latencia_ms_p95": round(ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * 0.95))], 1),
+            "latencia_ms_max": round(ordenadas[-1], 1),
+        }
+
+
+def _clave_host(url):
+    partes = urlsplit(url)
+    return partes.scheme, partes.netloc
+
+
+def _sesion_para(url):
+    clave = _clave_host(url)
+    sesion = _sesiones.get(clave)
+    if sesion is None:
+        with _sesiones_lock:
+            sesion = _sesiones.get(clave)
+            if sesion is None:
+                sesion = requests.Session()
+                adaptador = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=current_app.config.get('WEBHOOK_POOL_MAXSIZE', 10),
+                )
+                sesion.mount(f"{clave[0]}://", adaptador)
+                _sesiones[clave] = sesion
+    return sesion
+
+
+def _registrar(nombre, inicio, error):
+    latencia_ms = (time.perf_counter() - inicio) * 1000
+    with _stats_lock:
+        if nombre not in _stats:
+            _stats[nombre] = _EstadisticasWebhook()
+        _stats[nombre].registrar(latencia_ms, error)
+
+
+def _verificacion_configurada():
+    """CA fijada en WEBHOOK_CA_BUNDLE o, si no hay, el almacén de certificados por defecto."""
+    return current_app.config.get('WEBHOOK_CA_BUNDLE') or True
+
+
+def _host_inseguro(clave):
+    with _tls_lock:
+        hasta = _tls_inseguro.get(clave)
+        if hasta is not None and hasta <= time.monotonic():
+            del _tls_inseguro[clave]
+            return False
+        return hasta is not None
+
+
+def _marcar_host_inseguro(clave):
+    with _tls_lock:
+        _tls_inseguro[clave] = time.monotonic() + current_app.config.get('WEBHOOK_TLS_CACHE_SECONDS', 3600)
+
+
+@contextmanager
+def con_clave_idempotencia(clave):
+    """Contexto en el que las peticiones a webhooks llevan `Idempotency-Key: clave`."""
+    token = _clave_idempotencia.set(clave)
+    try:
+        yield
+    finally:
+        _clave_idempotencia.reset(token)
+
+
+def _enviar(metodo, nombre, url, headers, json, data, verify, timeout, params=None):
+    timeout = limitar_timeout(timeout)  # Dentro de una ruta con deadline, solo el tiempo que le queda.
+    with bulkhead('n8n').ocupar():  # BulkheadSaturado si n8n ya tiene todos sus cupos ocupados.
+        inicio = time.perf_counter()
+        try:
+            respuesta = _sesion_para(url).request(
+                metodo, url, headers=headers, json=json, data=data, params=params, timeout=timeout, verify=verify
+            )
+        except requests.exceptions.RequestException:
+            _registrar(nombre, inicio, error=True)
+            raise
+    _registrar(nombre, inicio, error=respuesta.status_code >= 400)
+    return respuesta
+
+
+def solicitar_webhook(metodo, nombre, url, headers=None, json=None, data=None, verify=None, timeout=None, params=None):
+    """
+    Hace la petición `metodo` a `url` con la sesión del host y registra la latencia bajo `nombre`.
+    Retorna la Response y lanza las mismas excepciones que `requests`, así que los llamadores
+    conservan su manejo de errores (raise_for_status, Timeout...).
+
+    Con `verify=None` se aplica la política TLS del host: se verifica (con WEBHOOK_CA_BUNDLE si
+    está configurado) y, ante un SSLError, se recuerda el host como inseguro y se reintenta una
+    sola vez sin verificación, salvo que WEBHOOK_TLS_FALLBACK esté desactivado. Un `verify`
+    explícito (True, False o ruta a un bundle) se usa tal cual.
+    """
+    if timeout is None:
+        timeout = (
+            current_app.config.get('WEBHOOK_CONNECT_TIMEOUT', 5),
+            current_app.config.get('WEBHOOK_READ_TIMEOUT', 15),
+        )
+    clave = _clave_idempotencia.get()
+    if clave and not (headers or {}).get('Idempotency-Key'):
+        headers = {**(headers or {}), 'Idempotency-Key': clave}
+    if verify is not None:
+        return _enviar(metodo, nombre, url, headers, json, data, verify, timeout, params)
+
+    host = _clave_host(url)
+    permite_respaldo = current_app.config.get('WEBHOOK_TLS_FALLBACK', True)
+    if permite_respaldo and _host_inseguro(host):
+        return _enviar(metodo, nombre, url, headers, json, data, False, timeout, params)
+    try:
+        return _enviar(metodo, nombre, url, headers, json, data, _verificacion_configurada(), timeout, params)
+    except requests.exceptions.SSLError as e:
+        if not permite_respaldo:
+            raise
+        _marcar_host_inseguro(host)
+        current_app.logger.warning(
+            f"Verificación TLS fallida con {host[0]}://{host[1]} ({e}). Se enviará sin verificación "
+            f"durante {current_app.config.get('WEBHOOK_TLS_CACHE_SECONDS', 3600)} s."
+        )
+        return _enviar(metodo, nombre, url, headers, json, data, False, timeout, params)
+
+
+def cuerpo_json(respuesta):
+    """
+    Cuerpo JSON de `respuesta`, o None si no es JSON. Para las respuestas 2xx de envíos: el registro
+    ya se entregó aunque n8n responda texto, así que el cuerpo no debe convertir el envío en un error.
+    """
+    try:
+        return respuesta.json()
+    except ValueError:  # requests.JSONDecodeError hereda de ValueError
+        return None
+
+
+def enviar_webhook(nombre, url, headers=None, json=None, data=None, verify=None, timeout=None):
+    """POST a un webhook. Ver `solicitar_webhook`."""
+    return solicitar_webhook('POST', nombre, url, headers=headers, json=json, data=data, verify=verify, timeout=timeout)
+
+
+def consultar_webhook(nombre, url, headers=None, verify=None, timeout=None, params=None):
+    """GET a un webhook de consulta, con `params` en la query string. Ver `solicitar_webhook`."""
+    return solicitar_webhook('GET', nombre, url, headers=headers, verify=verify, timeout=timeout, params=params)
+
+
+def get_webhook_stats():
+    with _stats_lock:
+        por_webhook = {nombre: stats.snapshot() for nombre, stats in _stats.items()}
+    with _sesiones_lock:
+        hosts = [f"{esquema}://{host}" for esquema, host in _sesiones]
+    ahora = time.monotonic()
+    with _tls_lock:
+        tls_sin_verificar = {
+            f"{esquema}://{host}": round(hasta - ahora) for (esquema, host), hasta in _tls_inseguro.items() if hasta > ahora
+        }
+    return {"hosts": hosts, "tls_sin_verificar_s": tls_sin_verificar, "webhooks": por_webhook}
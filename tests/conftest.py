@@ -0,0 +1,13 @@
+# tests/conftest.py
+
+import pytest
+from flask import Flask
+
+
+@pytest.fixture
+def app():
+    """App mínima con contexto activo: las utilidades leen su configuración de current_app."""
+    app = Flask(__name__)
+    app.config.update(TESTING=True)
+    with app.app_context():
+        yield app
@@ -0,0 +1,141 @@
+# tests/test_circuit_breaker.py
+
+import pytest
+import requests
+
+from mi_aplicacion.utils import bulkheads, epicor_api
+from mi_aplicacion.utils.epicor_api import CircuitBreaker, EpicorClient, EpicorNoDisponible
+
+URL = "https://epicor.local/api/v1/BaqSvc/HMP_ValidadorID"
+
+
+class _Respuesta:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class _SesionFalsa:
+    """Responde (o lanza), en orden, lo que se le programa."""
+
+    def __init__(self, *resultados):
+        self.resultados = list(resultados)
+        self.llamadas = 0
+
+    def get(self, url, **kwargs):
+        self.llamadas += 1
+        resultado = self.resultados.pop(0)
+        if isinstance(resultado, Exception):
+            raise resultado
+        return _Respuesta(resultado)
+
+
+class _EjecutorInmediato:
+    """Ejecuta la sonda en el mismo hilo para que la prueba vea el estado final."""
+
+    def submit(self, funcion, *args):
+        funcion(*args)
+
+
+@pytest.fixture
+def cliente(app, monkeypatch):
+    monkeypatch.setattr(bulkheads, '_bulkheads', {})
+    monkeypatch.setattr(epicor_api, '_refresh_executor', _EjecutorInmediato())
+    return EpicorClient(umbral_fallos=2, tiempo_apertura=30)
+
+
+def _abrir(cliente, endpoint='validador'):
+    cliente.session = _SesionFalsa(503, 503)
+    for _ in range(2):
+        cliente.get(URL, endpoint=endpoint)
+    circuito = cliente.circuito(endpoint)
+    assert circuito.estado == CircuitBreaker.ABIERTO
+    return circuito
+
+
+def _vencer_apertura(circuito):
+    circuito.abierto_desde -= circuito.tiempo_apertura + 1
+
+
+def test_se_abre_tras_el_umbral_y_falla_rapido(cliente):
+    circuito = _abrir(cliente)
+
+    with pytest.raises(EpicorNoDisponible):
+        cliente.get(URL, endpoint='validador')
+    assert cliente.session.llamadas == 2
+    assert circuito.stats()["aperturas"] == 1
+    assert cliente.degradado()
+
+
+def test_los_4xx_no_abren_el_circuito(cliente):
+    cliente.session = _SesionFalsa(404, 404, 404)
+    for _ in range(3):
+        assert cliente.get(URL, endpoint='validador').status_code == 404
+    assert cliente.circuito('validador').estado == CircuitBreaker.CERRADO
+
+
+def test_sonda_exitosa_cierra_el_circuito(cliente):
+    circuito = _abrir(cliente)
+    _vencer_apertura(circuito)
+    cliente.session = _SesionFalsa(200, 200)
+
+    # La llamada que lanza la sonda sigue fallando rápido; la sonda decide el estado.
+    with pytest.raises(EpicorNoDisponible):
+        cliente.get(URL, endpoint='validador')
+    assert circuito.estado == CircuitBreaker.CERRADO
+    assert cliente.get(URL, endpoint='validador').status_code == 200
+
+
+def test_sonda_fallida_reabre_el_circuito(cliente):
+    circuito = _abrir(cliente)
+    _vencer_apertura(circuito)
+    abierto_antes = circuito.abierto_desde
+    cliente.session = _SesionFalsa(requests.exceptions.Timeout("sin respuesta"))
+
+    with pytest.raises(EpicorNoDisponible):
+        cliente.get(URL, endpoint='validador')
+    assert circuito.estado == CircuitBreaker.ABIERTO
+    assert circuito.abierto_desde > abierto_antes
+    assert circuito.stats()["aperturas"] == 2
+
+
+def test_sonda_con_error_que_no_es_de_epicor_reabre_el_circuito(cliente):
+    circuito = _abrir(cliente)
+    _vencer_apertura(circuito)
+    cliente.session = _SesionFalsa(requests.exceptions.InvalidURL("url inválida"))
+
+    with pytest.raises(EpicorNoDisponible):
+        cliente.get(URL, endpoint='validador')
+    assert circuito.estado == CircuitBreaker.ABIERTO
+
+    # Pasado el tiempo de apertura se lanza otra sonda en lugar de quedar semiabierto para siempre.
+    _vencer_apertura(circuito)
+    cliente.session = _SesionFalsa(200)
+    with pytest.raises(EpicorNoDisponible):
+        cliente.get(URL, endpoint='validador')
+    assert circuito.estado == CircuitBreaker.CERRADO
+
+
+def test_sonda_no_depende_de_cupos_del_bulkhead(cliente, app):
+    app.config['BULKHEAD_EPICOR_MAX'] = 1
+    app.config['BULKHEAD_QUEUE_WAIT'] = 0
+    circuito = _abrir(cliente)
+    _vencer_apertura(circuito)
+    cliente.session = _SesionFalsa(200)
+
+    # Con el único cupo ocupado la sonda igual llega a Epicor y cierra el circuito.
+    with bulkheads.bulkhead('epicor').ocupar():
+        with pytest.raises(EpicorNoDisponible):
+            cliente.get(URL, endpoint='validador')
+    assert circuito.estado == CircuitBreaker.CERRADO
+
+
+def test_semiabierto_sin_resultado_lanza_otra_sonda():
+    circuito = CircuitBreaker('validador', umbral_fallos=1, tiempo_apertura=30)
+    circuito.registrar_fallo()
+    circuito.abierto_desde -= 31
+    assert circuito.permitir() == (False, True)
+    assert circuito.permitir() == (False, False)
+
+    circuito.semiabierto_desde -= 31
+    assert circuito.permitir() == (False, True)
+    assert circuito.estado == CircuitBreaker.SEMIABIERTO
@@ -0,0 +1,58 @@
+# tests/test_consultas_epicor.py
+
+import pytest
+
+from mi_aplicacion.blueprints.transversal import consultas_epicor
+from mi_aplicacion.utils.tokens_validacion import verificar_validacion
+
+
+@pytest.fixture
+def cliente(app, monkeypatch):
+    app.config.update(SECRET_KEY='prueba', VALIDATION_TOKEN_MAX_AGE=900, LOOKUP_HTTP_MAX_AGE=60)
+    app.register_blueprint(consultas_epicor.consultas_epicor_bp)
+    monkeypatch.setattr(consultas_epicor, 'get_employee_name_from_id', lambda eid: {"success": True, "nombre": "Ana"})
+    return app.test_client()
+
+
+def test_respuesta_con_token_es_privada(cliente):
+    respuesta = cliente.get('/api/empleado?id=123')
+    assert respuesta.status_code == 200
+    assert respuesta.cache_control.private
+    assert not respuesta.cache_control.public
+    assert verificar_validacion(respuesta.get_json()["token"], 'empleado', '123') == "Ana"
+
+
+def test_304_solo_dentro_de_la_ventana_del_token(cliente, monkeypatch):
+    reloj = [1000.0]
+    monkeypatch.setattr(consultas_epicor.time, 'time', lambda: reloj[0])
+    etag = cliente.get('/api/empleado?id=123').headers['ETag']
+
+    reloj[0] += 100
+    assert cliente.get('/api/empleado?id=123', headers={'If-None-Match': etag}).status_code == 304
+
+    # Pasada la media vigencia del token el navegador recibe un cuerpo (y un token) nuevo.
+    reloj[0] += 450
+    assert cliente.get('/api/empleado?id=123', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_nombre_vencido_no_lleva_token(cliente, monkeypatch):
+    monkeypatch.setattr(consultas_epicor, 'get_employee_name_from_id',
+                        lambda eid: {"success": True, "nombre": "Ana", "stale": True})
+    respuesta = cliente.get('/api/empleado?id=123')
+
+    assert respuesta.status_code == 200
+    assert respuesta.get_json()["stale"] is True
+    assert "token" not in respuesta.get_json()
+    assert respuesta.cache_control.no_store
+
+
+def test_lookup_por_lotes_solo_firma_nombres_confirmados(cliente, monkeypatch):
+    monkeypatch.setattr(consultas_epicor, 'resolver_lookups', lambda claves: {
+        "empleado:1": {"success": True, "nombre": "Ana"},
+        "empleado:2": {"success": True, "nombre": "Luis", "stale": True},
+    })
+    resultados = cliente.post('/api/lookup', json={"claves": [{"tipo": "empleado", "id": "1"},
+                                                             {"tipo": "empleado", "id": "2"}]}).get_json()["resultados"]
+
+    assert verificar_validacion(resultados["empleado:1"]["token"], 'empleado', '1') == "Ana"
+    assert "token" not in resultados["empleado:2"]
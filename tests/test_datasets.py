@@ -0,0 +1,64 @@
+# tests/test_datasets.py
+
+import pytest
+
+from mi_aplicacion.utils import datasets
+from mi_aplicacion.utils.datasets import DatasetEnMemoria
+
+
+class _Origen:
+    """Tabla de origen: `descargar` registra los params de cada llamada y filtra por la marca."""
+
+    def __init__(self, filas):
+        self.filas = filas
+        self.llamadas = []
+
+    def descargar(self, params=None):
+        self.llamadas.append(params)
+        if params and 'desde_modificado' in params:
+            return [dict(f) for f in self.filas if f['modificado'] >= params['desde_modificado']]
+        return [dict(f) for f in self.filas]
+
+
+def _dataset(origen, **kwargs):
+    return DatasetEnMemoria('prueba', origen.descargar, 'id', 'PRUEBA_REFRESH_INTERVAL',
+                            clave_campo_marca='PRUEBA_SYNC_FIELD', **kwargs)
+
+
+def test_sin_campo_de_marca_cada_refresco_ve_cambios_en_filas_existentes(app):
+    origen = _Origen([{"id": 1, "verificacion": None, "modificado": 1}])
+    dataset = _dataset(origen)
+    dataset.registros()
+
+    origen.filas[0]["verificacion"] = "OK"  # Aprobado desde otro worker.
+    dataset.refrescar()
+
+    assert origen.llamadas == [None, None]
+    assert dataset.obtener_registro(1)["verificacion"] == "OK"
+
+
+def test_marca_de_modificacion_fusiona_solo_lo_cambiado(app):
+    app.config['PRUEBA_SYNC_FIELD'] = 'modificado'
+    origen = _Origen([{"id": 1, "verificacion": None, "modificado": 1},
+                      {"id": 2, "verificacion": None, "modificado": 2},
+                      {"id": 3, "verificacion": None, "modificado": 5}])
+    dataset = _dataset(origen)
+    dataset.registros()
+
+    origen.filas[0].update(verificacion="OK", modificado=6)
+    dataset.refrescar()
+
+    assert origen.llamadas[-1] == {"desde_modificado": 5}
+    assert dataset.filas_ultimo_refresco == 2
+    assert [r["verificacion"] for r in dataset.registros()] == ["OK", None, None]
+
+
+def test_sin_url_de_origen_no_arranca_el_hilo(app, monkeypatch):
+    origen = _Origen([])
+    monkeypatch.setattr(datasets, '_datasets', {'prueba': _dataset(origen, clave_url='PRUEBA_URL')})
+    monkeypatch.setattr(datasets, '_hilo_refresco', None)
+
+    datasets.iniciar_refresco_en_segundo_plano(app)
+
+    assert datasets._hilo_refresco is None
+    assert origen.llamadas == []
@@ -0,0 +1,69 @@
+# tests/test_directorio_empleados.py
+
+import pytest
+
+from mi_aplicacion.utils import directorio_empleados, epicor_api
+
+
+class _Respuesta:
+    def __init__(self, filas):
+        self._filas = filas
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {"value": self._filas}
+
+
+class _ClienteFalso:
+    def __init__(self, paginas):
+        self.paginas = list(paginas)
+        self.urls = []
+
+    def get(self, url, **kwargs):
+        self.urls.append(url)
+        return _Respuesta(self.paginas.pop(0))
+
+
+@pytest.fixture
+def cliente(app, monkeypatch):
+    app.config.update(EPICOR_API_TOKEN='token', EMPLOYEE_DIRECTORY_PAGE_SIZE=2)
+    cliente = _ClienteFalso([])
+    monkeypatch.setattr(epicor_api, 'get_epicor_client', lambda: cliente)
+    return cliente
+
+
+def test_sin_baq_de_directorio_no_usa_la_de_carnet(app, cliente):
+    app.config['EPICOR_API_CARNET_LOOKUP'] = 'https://epicor.local/HMP_PausasActivas'
+    with pytest.raises(RuntimeError):
+        directorio_empleados._descargar_empleados_activos()
+    assert cliente.urls == []
+
+
+def test_solo_entran_empleados_marcados_activos_y_las_paginas_van_ordenadas(app, cliente):
+    app.config['EPICOR_API_DIRECTORIO_EMPLEADOS'] = 'https://epicor.local/HMP_Directorio'
+    cliente.paginas = [
+        [{"EmpBasic_EmpID": "1", "EmpBasic_EmpStatus": "A", "EmpBasic_Name": "Ana"},
+         {"EmpBasic_EmpID": "2", "EmpBasic_Name": "Sin estado"}],
+        [{"EmpBasic_EmpID": "3", "EmpBasic_EmpStatus": "T", "EmpBasic_Name": "Terminado"}],
+    ]
+
+    empleados = directorio_empleados._descargar_empleados_activos()
+
+    assert [e[0] for e in empleados] == ["1"]
+    assert all("$orderby=EmpBasic_EmpID" in url for url in cliente.urls)
+    assert cliente.urls[1].endswith("$skip=2")
+
+
+def test_directorio_apagado_por_defecto(app, cliente, tmp_path):
+    app.config.update(
+        EPICOR_API_DIRECTORIO_EMPLEADOS='https://epicor.local/HMP_Directorio',
+        EMPLOYEE_DIRECTORY_PATH=str(tmp_path / 'directorio.sqlite3'),
+    )
+    cliente.paginas = [[{"EmpBasic_EmpID": "1", "EmpBasic_EmpStatus": "A", "EmpBasic_Name": "Ana"}]]
+    directorio_empleados.sincronizar_directorio()
+
+    assert directorio_empleados.buscar_por_id("1") is None
+    app.config['EMPLOYEE_DIRECTORY_ENABLED'] = True
+    assert directorio_empleados.buscar_por_id("1")["nombre"] == "Ana"
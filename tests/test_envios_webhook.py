@@ -0,0 +1,47 @@
+# tests/test_envios_webhook.py
+
+import pytest
+import requests
+
+from mi_aplicacion.blueprints.laminacion import laminacion
+from mi_aplicacion.blueprints.sellado import sellado_form_se25
+from mi_aplicacion.utils.outbox import _es_error_permanente
+
+
+class _RespuestaTexto:
+    """2xx de n8n con cuerpo de texto (p. ej. 'Workflow was started')."""
+    status_code = 200
+    text = "Workflow was started"
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        raise requests.exceptions.JSONDecodeError("Expecting value", self.text, 0)
+
+
+@pytest.mark.parametrize("modulo, funcion, claves", [
+    (sellado_form_se25, 'enviar_a_webhook_se25', {'WEBHOOK_SE25_URL': 'https://n8n.local/se25', 'WEBHOOK_SE25_AUTH': 'x'}),
+    (laminacion, 'enviar_a_webhook_externo', {'WEBHOOK_URL': 'https://n8n.local/mezclas', 'WEBHOOK_AUTH': 'x'}),
+])
+def test_2xx_sin_json_cuenta_como_entregado(app, monkeypatch, modulo, funcion, claves):
+    app.config.update(claves)
+    monkeypatch.setattr(modulo, 'enviar_webhook', lambda *args, **kwargs: _RespuestaTexto())
+
+    resultado = getattr(modulo, funcion)({"trabajo": "123"})
+
+    assert resultado["success"] is True
+    assert resultado["data"] is None
+    assert resultado["status_code"] == 200
+
+
+def test_error_de_red_sigue_siendo_transitorio(app, monkeypatch):
+    app.config.update(WEBHOOK_SE25_URL='https://n8n.local/se25', WEBHOOK_SE25_AUTH='x')
+
+    def sin_conexion(*args, **kwargs):
+        raise requests.exceptions.ConnectionError("sin ruta")
+    monkeypatch.setattr(sellado_form_se25, 'enviar_webhook', sin_conexion)
+
+    resultado = sellado_form_se25.enviar_a_webhook_se25({"trabajo": "123"})
+    assert resultado["success"] is False
+    assert not _es_error_permanente(resultado)
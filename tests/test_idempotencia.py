@@ -0,0 +1,113 @@
+# tests/test_idempotencia.py
+
+import threading
+
+import pytest
+from flask import g, jsonify, session
+
+from mi_aplicacion.utils import idempotencia, outbox
+from mi_aplicacion.utils.cache import TTLCache
+from mi_aplicacion.utils.idempotencia import clave_de_solicitud, evitar_envio_duplicado
+
+
+@pytest.fixture
+def app_formularios(app, tmp_path, monkeypatch):
+    app.config.update(SECRET_KEY='prueba', OUTBOX_PATH=str(tmp_path / 'outbox.sqlite3'), IDEMPOTENCY_WINDOW=600)
+    monkeypatch.setattr(idempotencia, '_recientes', TTLCache(maxsize=64))
+    app.llamadas = []
+    app.entrada = threading.Event()
+    app.salida = threading.Event()
+    app.salida.set()
+
+    @app.route('/formulario', methods=['POST'])
+    @evitar_envio_duplicado
+    def formulario():
+        app.llamadas.append(g.clave_idempotencia)
+        app.entrada.set()
+        app.salida.wait(5)
+        if app.config.get('PRUEBA_REGISTRAR', True):
+            g.envio_registrado = True
+        return jsonify(success=True, id=len(app.llamadas))
+
+    return app
+
+
+def _clave(app, ruta='/formulario', usuario='1001', **kwargs):
+    with app.test_request_context(ruta, method='POST', **kwargs):
+        session['user_id'] = usuario
+        return clave_de_solicitud()
+
+
+def test_la_clave_ignora_csrf_fecha_y_tokens(app_formularios):
+    base = {"trabajo": "123", "maquina": "SE25"}
+    clave = _clave(app_formularios, data=base)
+
+    assert _clave(app_formularios, data={**base, "csrf_token": "otro", "fecha": "2026-10-18 07:00:01",
+                                         "token_id_empleado": "firmado"}) == clave
+    assert _clave(app_formularios, json={**base, "fecha": "2026-10-18 07:00:02"}) == clave
+
+
+def test_la_clave_cambia_con_los_datos_el_usuario_y_la_ruta(app_formularios):
+    clave = _clave(app_formularios, data={"trabajo": "123"})
+
+    assert _clave(app_formularios, data={"trabajo": "124"}) != clave
+    assert _clave(app_formularios, data={"trabajo": "123", "observaciones": "rebaba"}) != clave
+    assert _clave(app_formularios, usuario='1002', data={"trabajo": "123"}) != clave
+    assert _clave(app_formularios, ruta='/otro_formulario', data={"trabajo": "123"}) != clave
+
+
+def test_la_cabecera_idempotency_key_manda_sobre_el_contenido(app_formularios):
+    cabecera = {"Idempotency-Key": "abc"}
+    assert _clave(app_formularios, headers=cabecera, data={"trabajo": "123"}) == \
+        _clave(app_formularios, headers=cabecera, data={"trabajo": "124"})
+
+
+def test_envio_repetido_devuelve_la_respuesta_guardada(app_formularios):
+    cliente = app_formularios.test_client()
+    primera = cliente.post('/formulario', json={"trabajo": "123"})
+    segunda = cliente.post('/formulario', json={"trabajo": "123", "fecha": "otra"})
+
+    assert len(app_formularios.llamadas) == 1
+    assert segunda.status_code == 200
+    assert segunda.get_json() == primera.get_json()
+    assert segunda.headers['Idempotent-Replayed'] == 'true'
+
+
+def test_envio_repetido_mientras_el_primero_sigue_en_proceso(app_formularios):
+    app_formularios.salida.clear()
+    hilo = threading.Thread(target=lambda: app_formularios.test_client().post('/formulario', json={"trabajo": "123"}))
+    hilo.start()
+    assert app_formularios.entrada.wait(5)
+
+    respuesta = app_formularios.test_client().post('/formulario', json={"trabajo": "123"})
+    app_formularios.salida.set()
+    hilo.join(5)
+
+    assert respuesta.status_code == 409
+    assert respuesta.get_json()["duplicado"] is True
+    assert len(app_formularios.llamadas) == 1
+
+
+def test_envio_no_registrado_se_puede_reenviar(app_formularios):
+    app_formularios.config['PRUEBA_REGISTRAR'] = False
+    cliente = app_formularios.test_client()
+    cliente.post('/formulario', json={"trabajo": "123"})
+    cliente.post('/formulario', json={"trabajo": "123"})
+
+    assert len(app_formularios.llamadas) == 2
+
+
+def test_envio_encolado_por_otro_worker_no_se_repite(app_formularios, monkeypatch):
+    monkeypatch.setitem(outbox._destinos, 'prueba', lambda payload: {"success": True})
+    with app_formularios.test_request_context('/formulario', method='POST', json={"trabajo": "123"}):
+        session['user_id'] = '1001'
+        g.clave_idempotencia = clave_de_solicitud()
+        outbox.encolar_envio('prueba', {"trabajo": "123"})
+
+    cliente = app_formularios.test_client()
+    with cliente.session_transaction() as sesion:
+        sesion['user_id'] = '1001'
+    respuesta = cliente.post('/formulario', json={"trabajo": "123"})
+
+    assert app_formularios.llamadas == []
+    assert respuesta.get_json()["duplicado"] is True
@@ -0,0 +1,167 @@
+# tests/test_outbox.py
+
+import contextlib
+import time
+
+import pytest
+from flask import g
+
+from mi_aplicacion.utils import outbox
+
+
+class _Destino:
+    """Función de envío que responde, en orden, los resultados programados."""
+
+    def __init__(self, *resultados):
+        self.resultados = list(resultados)
+        self.recibidos = []
+
+    def __call__(self, payload):
+        self.recibidos.append(payload)
+        return self.resultados.pop(0)
+
+
+@pytest.fixture
+def bandeja(app, tmp_path, monkeypatch):
+    app.config.update(OUTBOX_PATH=str(tmp_path / 'outbox.sqlite3'), OUTBOX_MAX_ATTEMPTS=3, OUTBOX_LEASE_SECONDS=120)
+    destino = _Destino()
+    monkeypatch.setitem(outbox._destinos, 'prueba', destino)
+    return destino
+
+
+def _estado(envio_id):
+    return outbox._conexion().execute(
+        "SELECT estado, intentos, proximo_intento, ultimo_error FROM envios WHERE id = ?", (envio_id,)
+    ).fetchone()
+
+
+def _ciclo():
+    """Una vuelta del hilo de entrega: reclama y entrega lo que esté listo."""
+    conexion = outbox._conexion()
+    lote = outbox._reclamar_lote(conexion)
+    if lote:
+        outbox._entregar(conexion, lote)
+    return lote
+
+
+def test_encolar_reclamar_y_entregar(bandeja):
+    bandeja.resultados = [{"success": True}]
+    envio_id = outbox.encolar_envio('prueba', {"trabajo": "123"})["id"]
+
+    lote = outbox._reclamar_lote(outbox._conexion())
+    assert [fila[0] for fila in lote] == [envio_id]
+    assert _estado(envio_id)[0] == outbox.ENVIANDO
+    # Mientras el arrendamiento está vigente nadie más lo reclama.
+    assert outbox._reclamar_lote(outbox._conexion()) == []
+
+    outbox._entregar(outbox._conexion(), lote)
+    assert bandeja.recibidos == [{"trabajo": "123"}]
+    assert _estado(envio_id)[:2] == (outbox.ENTREGADO, 1)
+
+
+def test_arrendamiento_vencido_se_vuelve_a_reclamar(bandeja):
+    envio_id = outbox.encolar_envio('prueba', {"trabajo": "123"})["id"]
+    outbox._reclamar_lote(outbox._conexion())  # El proceso que lo reclamó muere sin entregarlo.
+
+    outbox._conexion().execute("UPDATE envios SET reclamado_hasta = ? WHERE id = ?", (time.time() - 1, envio_id))
+    bandeja.resultados = [{"success": True}]
+    assert [fila[0] for fila in _ciclo()] == [envio_id]
+    assert _estado(envio_id)[0] == outbox.ENTREGADO
+
+
+def test_error_transitorio_se_reintenta_con_backoff(bandeja):
+    bandeja.resultados = [{"success": False, "message": "n8n caído", "status_code": 503}]
+    envio_id = outbox.encolar_envio('prueba', {"trabajo": "123"})["id"]
+
+    _ciclo()
+    estado, intentos, proximo_intento, ultimo_error = _estado(envio_id)
+    assert (estado, intentos, ultimo_error) == (outbox.PENDIENTE, 1, "n8n caído")
+    assert proximo_intento > time.time()
+    assert _ciclo() == []  # No se reintenta antes de que venza el backoff.
+
+
+def test_error_permanente_va_directo_a_fallidos(bandeja):
+    bandeja.resultados = [{"success": False, "message": "payload inválido", "status_code": 400}]
+    envio_id = outbox.encolar_envio('prueba', {"trabajo": "123"})["id"]
+
+    _ciclo()
+    assert _estado(envio_id)[:2] == (outbox.FALLIDO, 1)
+    assert [e["id"] for e in outbox.listar_envios('prueba')] == [envio_id]
+
+
+def test_agotar_intentos_deja_el_envio_fallido(bandeja):
+    bandeja.resultados = [{"success": False, "message": "timeout"}] * 3
+    envio_id = outbox.encolar_envio('prueba', {"trabajo": "123"})["id"]
+
+    for _ in range(3):
+        outbox._conexion().execute("UPDATE envios SET proximo_intento = 0 WHERE id = ?", (envio_id,))
+        _ciclo()
+    assert _estado(envio_id)[:2] == (outbox.FALLIDO, 3)
+    assert len(bandeja.recibidos) == 3
+
+
+def test_reasignar_y_descartar_solo_envios_fallidos(bandeja):
+    bandeja.resultados = [{"success": False, "message": "payload inválido", "status_code": 422}]
+    envio_id = outbox.encolar_envio('prueba', {"trabajo": "123"})["id"]
+    assert not outbox.descartar_envio(envio_id, 'prueba', "aún pendiente")
+    _ciclo()
+
+    assert not outbox.descartar_envio(envio_id, 'otro_destino', "destino equivocado")
+    assert outbox.reasignar_envio(envio_id, 'prueba', {"trabajo": "124"})
+    assert _estado(envio_id)[:2] == (outbox.PENDIENTE, 0)
+
+    bandeja.resultados = [{"success": False, "message": "payload inválido", "status_code": 422}]
+    _ciclo()
+    assert bandeja.recibidos[-1] == {"trabajo": "124"}
+    assert outbox.descartar_envio(envio_id, 'prueba', "descartado en la prueba")
+    assert _estado(envio_id)[0] == outbox.DESCARTADO
+    assert not outbox.reasignar_envio(envio_id, 'prueba', {"trabajo": "125"})
+
+
+@pytest.fixture
+def destino_en_lotes(bandeja, app, monkeypatch):
+    app.config.update(OUTBOX_BATCH_DESTINOS=('prueba',), OUTBOX_BATCH_WINDOW=0, OUTBOX_BATCH_MAX_SIZE=20)
+    monkeypatch.setattr(outbox, '_destinos_con_lotes', {'prueba'})
+    monkeypatch.setattr(outbox, '_sin_lotes', set())
+    return bandeja
+
+
+def test_lote_rechazado_por_formato_vuelve_a_la_cola_como_envios_individuales(destino_en_lotes):
+    ids = [outbox.encolar_envio('prueba', {"trabajo": str(i)})["id"] for i in range(3)]
+    destino_en_lotes.resultados = [{"success": False, "message": "se esperaba un objeto", "status_code": 422}]
+
+    assert len(_ciclo()) == 3
+    assert 'prueba' in outbox._sin_lotes
+    assert all(_estado(envio_id)[:2] == (outbox.PENDIENTE, 0) for envio_id in ids)
+
+    destino_en_lotes.resultados = [{"success": True}] * 3
+    assert [len(_ciclo()) for _ in range(3)] == [1, 1, 1]
+    assert destino_en_lotes.recibidos[1:] == [{"trabajo": "0"}, {"trabajo": "1"}, {"trabajo": "2"}]
+    assert all(_estado(envio_id)[0] == outbox.ENTREGADO for envio_id in ids)
+
+
+def test_lote_rechazado_por_credenciales_no_desactiva_los_lotes(destino_en_lotes):
+    ids = [outbox.encolar_envio('prueba', {"trabajo": str(i)})["id"] for i in range(2)]
+    destino_en_lotes.resultados = [{"success": False, "message": "no autorizado", "status_code": 401}]
+
+    _ciclo()
+    assert 'prueba' not in outbox._sin_lotes
+    assert all(_estado(envio_id)[0] == outbox.FALLIDO for envio_id in ids)
+    assert len(destino_en_lotes.recibidos) == 1
+
+
+def test_lote_lleva_la_clave_de_cada_envio_en_su_elemento(destino_en_lotes, app, monkeypatch):
+    cabeceras = []
+    monkeypatch.setattr(outbox, 'con_clave_idempotencia', lambda clave: cabeceras.append(clave) or contextlib.nullcontext())
+    with app.test_request_context():
+        g.clave_idempotencia = 'formulario-0'
+        outbox.encolar_envio('prueba', {"trabajo": "0"})
+    envio_id = outbox.encolar_envio('prueba', {"trabajo": "1"})["id"]
+    destino_en_lotes.resultados = [{"success": True}]
+
+    _ciclo()
+    assert cabeceras == [None]
+    assert destino_en_lotes.recibidos[0] == [
+        {"trabajo": "0", "idempotency_key": "formulario-0"},
+        {"trabajo": "1", "idempotency_key": f"outbox-{envio_id}"},
+    ]
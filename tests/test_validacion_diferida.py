@@ -0,0 +1,30 @@
+# tests/test_validacion_diferida.py
+
+import pytest
+
+from mi_aplicacion.utils import tokens_validacion
+from mi_aplicacion.utils.validacion_diferida import validar_empleado_o_diferir
+
+
+@pytest.fixture
+def diferida(app):
+    app.config.update(SECRET_KEY='prueba', DEFERRED_VALIDATION_ENABLED=True, OUTBOX_ENABLED=True)
+    return app
+
+
+def test_nombre_vencido_de_la_cache_se_difiere(diferida, monkeypatch):
+    monkeypatch.setattr(tokens_validacion, 'get_employee_name_from_id',
+                        lambda eid: {"success": True, "nombre": "Ana", "stale": True})
+    assert validar_empleado_o_diferir("123") == {"success": True, "nombre": "", "diferida": True}
+
+
+def test_nombre_confirmado_por_token_no_se_difiere(diferida):
+    token = tokens_validacion.firmar_validacion('empleado', "123", "Ana")
+    assert validar_empleado_o_diferir("123", token) == {"success": True, "nombre": "Ana"}
+
+
+def test_sin_modo_diferido_se_acepta_el_nombre_vencido(diferida, monkeypatch):
+    diferida.config['DEFERRED_VALIDATION_ENABLED'] = False
+    monkeypatch.setattr(tokens_validacion, 'get_employee_name_from_id',
+                        lambda eid: {"success": True, "nombre": "Ana", "stale": True})
+    assert validar_empleado_o_diferir("123")["nombre"] == "Ana"